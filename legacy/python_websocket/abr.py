@@ -0,0 +1,236 @@
+# Ghost Shell Adaptive Bitrate (per client)
+# One controller per /stream connection. It watches how fast this client drains
+# the socket and moves along a ladder of (JPEG quality, downscale, frame rate)
+# levels to hold a target latency:
+#
+#   latency = time from starting the send until the client drew the frame
+#             (from its ack; send completion time for clients that do not ack)
+#
+# Acks with client timestamps (frame_latency.py) give the time the client held
+# the frame before acking (received -> drawn); the ack's own trip back is then
+# taken out: send -> drawn = (send -> ack + received -> drawn) / 2.
+#
+# A slow phone on weak Wi-Fi steps down quickly (the oldest unacked frame counts
+# too, so a stalled link is noticed before any ack arrives); stepping back up
+# needs a few seconds of headroom. Frames of the same level are encoded once and
+# shared by every client on that level (HubFrame cache key).
+#
+# Acked bytes per second only show what we chose to send, until the link is the
+# bottleneck: then the acks spread out further than the sends did, and the acked
+# rate is the link's bandwidth. That rate is remembered for BANDWIDTH_MEMORY and
+# caps step-ups: a level whose full-rate bitrate (recent frame size x its fps,
+# scaled by area) exceeds it is not tried again, so a link that just failed a
+# level does not oscillate between it and the one below.
+
+import time
+from collections import OrderedDict, deque
+from typing import Any, NamedTuple, Optional
+
+from pixel_frame import as_pixel_frame
+
+
+class AbrLevel(NamedTuple):
+    quality: int   # JPEG quality of full frames
+    scale: float   # Downscale factor (1.0 = native; tiles need native)
+    fps: int       # Frame rate cap for this client
+
+
+# Best first
+ABR_LEVELS = [
+    AbrLevel(85, 1.0, 30),
+    AbrLevel(75, 1.0, 30),
+    AbrLevel(65, 1.0, 20),
+    AbrLevel(55, 0.75, 15),
+    AbrLevel(45, 0.5, 10),
+    AbrLevel(35, 0.5, 5),
+]
+ABR_TARGET_LATENCY = 0.15    # Seconds from send to rendered on the client
+ABR_DECISION_INTERVAL = 0.5  # Seconds between decisions
+ABR_DOWN_RATIO = 1.5         # Step down above target * ratio (two steps above 3x)
+ABR_UP_RATIO = 0.6           # Step up below target * ratio ...
+ABR_UP_HOLD = 3.0            # ... once the level has held this many seconds
+THROUGHPUT_WINDOW = 2.0      # Seconds of acked bytes for the throughput estimate
+BACKLOG_MARGIN = 0.1         # Acks spread this much more than their sends: link-limited
+BANDWIDTH_MEMORY = 30.0      # Seconds a measured link bandwidth caps step-ups
+MIN_BANDWIDTH_FRAMES = 5     # Acked frames in the window before it says anything
+MAX_PENDING = 64             # Unacked sends remembered per client
+EWMA_ALPHA = 0.25
+
+_level_encoders = {}
+
+
+def encode_level_jpeg(image: Any, level: AbrLevel) -> bytes:
+    """Full-frame JPEG at the level's quality and scale."""
+    encoder = _level_encoders.get(level.quality)
+    if encoder is None:
+        from encoders import JPEGEncoder
+        encoder = _level_encoders.setdefault(level.quality, JPEGEncoder(quality=level.quality))
+    frame = as_pixel_frame(image)
+    if level.scale < 1.0:
+        width, height = frame.size
+        frame = frame.resized(max(1, round(width * level.scale)), max(1, round(height * level.scale)))
+    return encoder.encode(frame)
+
+
+class AbrController:
+    """Per-client quality/scale/fps decisions from send times and client acks.
+
+    adaptive=False only measures (H.264 clients share one encoder and cannot skip
+    frames, so their level stays at the top).
+    """
+
+    def __init__(self, target_latency: float = ABR_TARGET_LATENCY, levels=ABR_LEVELS, adaptive: bool = True):
+        self.target_latency = target_latency
+        self.levels = levels
+        self.adaptive = adaptive
+        self.index = 0
+        self.latency: Optional[float] = None    # EWMA, seconds
+        self.send_time: Optional[float] = None  # EWMA of send completion, seconds
+        self._pending: "OrderedDict[int, tuple]" = OrderedDict()  # seq -> (sent_at, bytes)
+        self._delivered = deque()  # (acked_at, bytes, sent_at, drawn_at)
+        self.frame_bytes: Optional[float] = None  # EWMA of sent frame sizes
+        self.bandwidth: Optional[float] = None    # Bytes/s the link delivered while it was the bottleneck
+        self._bandwidth_at = 0.0
+        self._next_send_at = 0.0
+        self._last_change = time.monotonic()
+        self._last_decision = 0.0
+        self.sent = 0
+        self.acks = 0
+        self.upgrades = 0
+        self.downgrades = 0
+        self.capped_upgrades = 0  # Decisions that would have stepped up but for the bandwidth
+
+    @property
+    def level(self) -> AbrLevel:
+        return self.levels[self.index]
+
+    def hold_time(self, now: Optional[float] = None) -> float:
+        """Seconds until this client's frame rate allows the next frame."""
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._next_send_at - now)
+
+    def on_sent(self, seq: int, size: int, started: float, finished: float):
+        """A frame of `size` bytes was handed to the socket (monotonic timestamps)."""
+        self.sent += 1
+        self._next_send_at = started + 1.0 / self.level.fps
+        self.send_time = self._ewma(self.send_time, finished - started)
+        self.frame_bytes = self._ewma(self.frame_bytes, size)
+        self._pending[seq] = (started, size)
+        while len(self._pending) > MAX_PENDING:
+            self._pending.popitem(last=False)
+        if not self.acks:
+            # Client without acks: a full socket buffer shows up as a slow send
+            self.latency = self.send_time
+        self._decide(finished)
+
+    def on_ack(self, seq: int, now: Optional[float] = None, client_hold: Optional[float] = None):
+        """The client rendered frame `seq`; client_hold = seconds from receiving it to drawing it."""
+        now = time.monotonic() if now is None else now
+        if seq not in self._pending:
+            return
+        # Acks arrive in send order; anything older was skipped by the client
+        while self._pending:
+            pending_seq, (sent_at, size) = self._pending.popitem(last=False)
+            if pending_seq == seq:
+                break
+        self.acks += 1
+        sample = now - sent_at
+        drawn_at = now
+        if client_hold is not None and 0.0 <= client_hold <= sample:
+            sample = (sample + client_hold) / 2
+            drawn_at = now - client_hold  # Ack delay without the client's own render time
+        self.latency = self._ewma(self.latency if self.acks > 1 else None, sample)
+        self._delivered.append((now, size, sent_at, drawn_at))
+        self._decide(now)
+
+    def _ewma(self, current: Optional[float], sample: float) -> float:
+        return sample if current is None else current + EWMA_ALPHA * (sample - current)
+
+    def throughput(self, now: Optional[float] = None) -> float:
+        """Bytes per second the client acked over the last THROUGHPUT_WINDOW."""
+        now = time.monotonic() if now is None else now
+        while self._delivered and now - self._delivered[0][0] > THROUGHPUT_WINDOW:
+            self._delivered.popleft()
+        return sum(entry[1] for entry in self._delivered) / THROUGHPUT_WINDOW
+
+    def _measure_bandwidth(self, now: float, since: float):
+        """Update self.bandwidth from the frames acked since the previous decision."""
+        throughput = self.throughput(now)  # Also drops acks older than THROUGHPUT_WINDOW
+        recent = [entry for entry in self._delivered if entry[0] > since]
+        if len(recent) >= MIN_BANDWIDTH_FRAMES:
+            send_span, drawn_span = recent[-1][2] - recent[0][2], recent[-1][3] - recent[0][3]
+            if drawn_span > 0 and drawn_span > send_span * (1 + BACKLOG_MARGIN):
+                # The link could not keep up with the sends: what it delivered is its rate
+                self.bandwidth = sum(entry[1] for entry in recent[1:]) / drawn_span
+                self._bandwidth_at = now
+                return
+        if self.bandwidth is not None and (throughput > self.bandwidth * (1 + BACKLOG_MARGIN)
+                                           or now - self._bandwidth_at > BANDWIDTH_MEMORY):
+            self.bandwidth = None  # Delivered more than we measured, or the measurement is stale
+
+    def level_bitrate(self, index: int) -> Optional[float]:
+        """Bytes/s of level `index` at its full frame rate, from the current level's frame sizes."""
+        if self.frame_bytes is None:
+            return None
+        level = self.levels[index]
+        return self.frame_bytes * (level.scale / self.level.scale) ** 2 * level.fps
+
+    def _fits(self, index: int) -> bool:
+        """False if level `index` would need more than the link's measured bandwidth."""
+        bitrate = self.level_bitrate(index)
+        return self.bandwidth is None or bitrate is None or bitrate <= self.bandwidth
+
+    def _decide(self, now: float):
+        if not self.adaptive or self.latency is None or now - self._last_decision < ABR_DECISION_INTERVAL:
+            return
+        since, self._last_decision = self._last_decision, now
+        self._measure_bandwidth(now, since)
+        latency = self.latency
+        if self.acks and self._pending:
+            # A stalled link acks nothing: the oldest unacked frame keeps aging
+            latency = max(latency, now - next(iter(self._pending.values()))[0])
+        held = now - self._last_change
+        if latency > self.target_latency * ABR_DOWN_RATIO and held >= 2 * ABR_DECISION_INTERVAL:
+            self._change(2 if latency > 3 * self.target_latency else 1, now)
+        elif latency < self.target_latency * ABR_UP_RATIO and held >= ABR_UP_HOLD and self.index > 0:
+            if self._fits(self.index - 1):
+                self._change(-1, now)
+            else:
+                self.capped_upgrades += 1
+
+    def _change(self, step: int, now: float):
+        index = min(len(self.levels) - 1, max(0, self.index + step))
+        if index == self.index:
+            return
+        old = self.level
+        self.index = index
+        self._last_change = now
+        if step > 0:
+            self.downgrades += 1
+        else:
+            self.upgrades += 1
+        level = self.level
+        print(f"[ABR] Level {index}: q{old.quality}->{level.quality} scale {old.scale}->{level.scale} "
+              f"fps {old.fps}->{level.fps} (latency {self.latency * 1000:.0f}ms)")
+
+    def decision(self) -> dict:
+        """Current level, for the client's meta message."""
+        level = self.level
+        return {"level": self.index, "quality": level.quality, "scale": level.scale, "fps": level.fps}
+
+    def stats(self) -> dict:
+        return {
+            **self.decision(),
+            "adaptive": self.adaptive,
+            "target_ms": round(self.target_latency * 1000),
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "send_ms": round(self.send_time * 1000, 1) if self.send_time is not None else None,
+            "throughput_kbps": round(self.throughput() * 8 / 1000, 1),
+            "bandwidth_kbps": round(self.bandwidth * 8 / 1000, 1) if self.bandwidth is not None else None,
+            "in_flight": len(self._pending),
+            "sent": self.sent,
+            "acks": self.acks,
+            "upgrades": self.upgrades,
+            "downgrades": self.downgrades,
+            "capped_upgrades": self.capped_upgrades,
+        }
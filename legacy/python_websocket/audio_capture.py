@@ -44,6 +44,11 @@ class AudioCapture:
             self._listeners.add(queue)
             print(f"[Audio] Added listener. Total: {len(self._listeners)}")
     
+    def queue_depth(self) -> int:
+        """Deepest listener queue (chunks not yet sent to a client)"""
+        with self._lock:
+            return max((queue.qsize() for queue in self._listeners), default=0)
+    
     def remove_listener(self, queue: asyncio.Queue):
         """Remove a listener queue"""
         with self._lock:
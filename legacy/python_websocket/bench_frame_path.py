@@ -0,0 +1,118 @@
+"""
+Ghost Shell frame-path benchmark (headless)
+Compares the old PIL round-trip with the zero-copy PixelFrame path from a
+capture buffer to JPEG bytes, at 1080p and 4K.
+
+    mss   : BGRA buffer -> bytes copy -> Image.frombytes(BGRX) -> np.array -> RGB2BGR -> imencode
+            vs BGRA view -> imencode
+    dxcam : BGR crop -> BGR2RGB -> Image.fromarray -> np.array -> RGB2BGR -> imencode
+            vs BGR view -> imencode
+
+"prep" is the time until the encoder has its input array; "total" includes the encode.
+A second table shows slice-parallel JPEG (jpeg_slices.py) wall time per slice count.
+
+Usage:
+    python bench_frame_path.py --frames 30
+    python bench_frame_path.py --frames 30 --slices 1,2,4,8
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from frame_source import create_frame_source
+from jpeg_slices import default_slices, encode_jpeg_sliced
+from pixel_frame import PixelFrame
+
+RESOLUTIONS = {"1080p": (1920, 1080), "4K": (3840, 2160)}
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85]
+
+
+class FakeScreenShot:
+    """Stands in for mss.ScreenShot: a fresh BGRA bytearray per grab."""
+
+    def __init__(self, bgra):
+        self.raw = bytearray(bgra.tobytes())
+        self.size = (bgra.shape[1], bgra.shape[0])
+
+    @property
+    def bgra(self):
+        return bytes(self.raw)
+
+
+# ---- Old paths (as in ghost_server/encoders before PixelFrame) ----
+def legacy_mss_prep(sct_img):
+    image = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
+    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+def legacy_dxcam_prep(frame, crop):
+    image = Image.fromarray(cv2.cvtColor(frame[crop], cv2.COLOR_BGR2RGB))
+    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+# ---- Zero-copy paths ----
+def zerocopy_mss_prep(sct_img):
+    return PixelFrame.from_mss(sct_img).to_bgr()
+
+def zerocopy_dxcam_prep(frame, crop):
+    return PixelFrame(frame[crop], "BGR").to_bgr()
+
+
+def time_path(prep, make_input, frames):
+    prep_total = encode_total = 0.0
+    for _ in range(frames):
+        args = make_input()
+        start = time.perf_counter()
+        array = prep(*args)
+        prepared = time.perf_counter()
+        cv2.imencode(".jpg", array, JPEG_PARAMS)
+        encode_total += time.perf_counter() - prepared
+        prep_total += prepared - start
+    return prep_total / frames * 1000, (prep_total + encode_total) / frames * 1000
+
+
+def time_slices(frame, slices, frames):
+    start = time.perf_counter()
+    for _ in range(frames):
+        if slices < 2 or encode_jpeg_sliced(frame, 85, slices) is None:
+            cv2.imencode(".jpg", frame.to_bgr(), JPEG_PARAMS)
+    return (time.perf_counter() - start) / frames * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Old vs zero-copy capture-to-encoder path")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--slices", default="1,2,4,8", help="Slice counts for the parallel JPEG table")
+    args = parser.parse_args()
+    slice_counts = [int(n) for n in args.slices.split(",")]
+    sliced_rows = []
+
+    print(f"{'path':<8}{'res':<7}{'old prep':>10}{'new prep':>10}{'old total':>11}{'new total':>11}   (ms/frame)")
+    for label, (width, height) in RESOLUTIONS.items():
+        # Realistic desktop content: an IDE-like page rendered by the synthetic source
+        rgb = create_frame_source("synthetic", pattern="scroll_text", width=width, height=height).grab().array
+        bgra = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGRA)
+        # DXcam captures the whole monitor; the window is a crop of it
+        monitor = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        crop = (slice(height // 8, height - height // 8), slice(width // 8, width - width // 8))
+
+        cases = [
+            ("mss", legacy_mss_prep, zerocopy_mss_prep, lambda: (FakeScreenShot(bgra),)),
+            ("dxcam", legacy_dxcam_prep, zerocopy_dxcam_prep, lambda: (monitor.copy(), crop)),
+        ]
+        for name, old, new, make_input in cases:
+            old_prep, old_total = time_path(old, make_input, args.frames)
+            new_prep, new_total = time_path(new, make_input, args.frames)
+            print(f"{name:<8}{label:<7}{old_prep:>10.2f}{new_prep:>10.2f}{old_total:>11.2f}{new_total:>11.2f}")
+        frame = PixelFrame(bgra, "BGRA")
+        sliced_rows.append((label, [time_slices(frame, n, args.frames) for n in slice_counts]))
+
+    print(f"\nSlice-parallel JPEG, BGRA (default on this machine: {default_slices()})   (ms/frame)")
+    print(f"{'res':<7}" + "".join(f"{f'{n} slices':>11}" for n in slice_counts))
+    for label, times in sliced_rows:
+        print(f"{label:<7}" + "".join(f"{t:>11.2f}" for t in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Ghost Shell pipeline benchmark (headless)
+Runs capture -> encode -> send through the capture hub with a synthetic or
+replayed frame source, so it works on any OS with numpy + Pillow.
+
+Usage:
+    python bench_pipeline.py --source synthetic:scroll_text --clients 3 --seconds 5
+    python bench_pipeline.py --source synthetic:noise --record session.gsrf --frames 90
+    python bench_pipeline.py --source replay:session.gsrf --clients 5
+    python bench_pipeline.py --source synthetic:static_ui --no-dedup   # encode every frame
+    python bench_pipeline.py --source synthetic:typing --tiles        # dirty-tile deltas
+    python bench_pipeline.py --source synthetic:scroll_text --tiles   # scroll as copy rects
+    python bench_pipeline.py --source synthetic:tab_switch --tiles --tile-cache 0   # without client tile caches
+    python bench_pipeline.py --source synthetic:typing --encoder h264   # FFmpeg H.264 access units
+    python bench_pipeline.py --source synthetic:typing --encoder av     # In-process PyAV H.264
+"""
+import argparse
+import asyncio
+import time
+
+from capture_hub import CaptureHub
+from frame_diff import frame_digest, DIGEST_ALGORITHM
+from tile_stream import TILE_CACHE_SIZE, TileCache, TileEncoder
+from loop_monitor import EventLoopLagMonitor
+from frame_source import (create_frame_source, create_frame_source_from_spec,
+                          available_frame_sources, RawFrameRecorder)
+
+
+class StageTimer:
+    """Accumulates call count and total time for one pipeline stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.total += time.perf_counter() - start
+                self.count += 1
+        return timed
+
+    @property
+    def avg_ms(self):
+        return self.total / self.count * 1000 if self.count else 0.0
+
+
+def make_source(spec, width, height):
+    name, _, arg = spec.partition(":")
+    if name == "synthetic":
+        return create_frame_source("synthetic", pattern=arg or "scroll_text", width=width, height=height)
+    return create_frame_source_from_spec(spec)
+
+
+def make_encoder(kind):
+    from encoders import AVEncoder, FFmpegEncoder, JPEGEncoder, get_encoder_manager
+    if kind == "auto":
+        return get_encoder_manager()
+    if kind in ("h264", "av"):
+        class _H264:
+            def __init__(self):
+                self.encoder = AVEncoder() if kind == "av" else FFmpegEncoder()
+                self.name = self.encoder.name
+            def encode(self, image):
+                data = self.encoder.encode(image)
+                return data, "h264" if hasattr(data, "keyframe") else "jpeg"
+            def cleanup(self):
+                self.encoder.cleanup()
+        return _H264()
+    # Same (data, format) contract as EncoderManager.encode
+    class _Jpeg:
+        def __init__(self):
+            self.encoder = JPEGEncoder()
+            self.name = self.encoder.name
+        def encode(self, image):
+            return self.encoder.encode(image), self.encoder.format_type
+    return _Jpeg()
+
+
+def record(args):
+    source = make_source(args.source, args.width, args.height)
+    first = source.grab()
+    with RawFrameRecorder(args.record, first.size[0], first.size[1], fps=args.fps) as recorder:
+        recorder.write(first)
+        for _ in range(args.frames - 1):
+            recorder.write(source.grab())
+    print(f"Recorded {recorder.frames} frames ({first.size[0]}x{first.size[1]}) from {source.describe()} to {args.record}")
+
+
+async def run(args):
+    source = make_source(args.source, args.width, args.height)
+    encoder = make_encoder(args.encoder)
+    capture_timer, encode_timer, detect_timer = StageTimer(), StageTimer(), StageTimer()
+
+    @capture_timer.wrap
+    def capture(target):
+        return source.grab(), source.describe()
+
+    encode = encode_timer.wrap(encoder.encode)
+    tile_encoder = TileEncoder(recent_tiles=args.tile_cache) if args.tiles else None
+    tile_caches = [TileCache(args.tile_cache) if args.tiles and args.tile_cache else None
+                   for _ in range(args.clients)]
+    delta_encoder = ("tiles", encode_timer.wrap(tile_encoder.encode_update)) if tile_encoder else None
+    detector = None if args.no_dedup else detect_timer.wrap(frame_digest)
+    hub = CaptureHub(capture, frame_interval=lambda: 1.0 / args.fps, change_detector=detector)
+    lag_monitor = EventLoopLagMonitor(interval=0.01)
+    lag_monitor.start()
+    delivered = [0] * args.clients
+    sent_bytes = [0] * args.clients
+
+    async def client(i):
+        subscription = hub.subscribe(("bench", args.source), encoder=(encoder.name, encode),
+                                     delta_encoder=delta_encoder)
+        last_sent = None
+        try:
+            while True:
+                frame = await subscription.next_frame(timeout=1.0)
+                if frame is None:
+                    continue
+                # Same choice as /stream: dirty tiles against the last frame sent, else a full frame
+                data = None
+                if delta_encoder is not None and last_sent is not None:
+                    update = await subscription.encoded_delta(last_sent, frame)
+                    if update is not None:
+                        data = await asyncio.to_thread(update.to_bytes, tile_caches[i])
+                if data is None:
+                    data, _ = await subscription.encoded(frame)
+                last_sent = frame
+                delivered[i] += 1
+                sent_bytes[i] += len(data)
+        finally:
+            subscription.close()
+
+    tasks = [asyncio.create_task(client(i)) for i in range(args.clients)]
+    await asyncio.sleep(args.seconds)
+    unchanged = sum(channel["unchanged"] for channel in hub.stats()["channels"])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    lag_monitor.stop()
+    lag = lag_monitor.stats()
+    await asyncio.sleep(0.1)  # Let the capture thread finish its last tick
+    source.close()
+    if hasattr(encoder, "cleanup"):
+        encoder.cleanup()
+
+    print("=" * 50)
+    print(f"Source:   {source.describe()}   Encoder: {encoder.name}   Clients: {args.clients}")
+    print(f"Capture:  {capture_timer.count} frames, {capture_timer.avg_ms:.2f} ms avg")
+    print(f"Encode:   {encode_timer.count} frames, {encode_timer.avg_ms:.2f} ms avg")
+    if detector is not None:
+        # Each skipped frame saves one encode per encoder and one send per client
+        print(f"Detect:   {detect_timer.count} frames, {detect_timer.avg_ms:.2f} ms avg ({DIGEST_ALGORITHM}), "
+              f"{unchanged} unchanged -> saved ~{unchanged * encode_timer.avg_ms:.0f} ms encode "
+              f"for {detect_timer.total * 1000:.0f} ms hashing")
+    if tile_encoder is not None:
+        tiles = tile_encoder.stats()
+        print(f"Tiles:    {tiles['updates']} updates, {tiles['full_frames']} full-frame fallbacks, "
+              f"{tiles['avg_rects']} rects, {tiles['copy_rects']} copy rects, {tiles['avg_bytes']} B, "
+              f"{tiles['avg_encode_ms']} ms avg")
+    if tile_caches[0] is not None:
+        caches = [cache.stats() for cache in tile_caches]
+        print(f"Cache:    {args.tile_cache} tiles per client, "
+              f"hit rate {sum(c['hit_rate'] for c in caches) / len(caches):.1%}, "
+              f"{sum(c['evictions'] for c in caches)} evictions")
+    print(f"Delivery: {sum(delivered) / args.clients / args.seconds:.1f} FPS per client, "
+          f"{sum(sent_bytes) / args.seconds / 1e6:.2f} MB/s total, "
+          f"{sum(sent_bytes) / max(1, sum(delivered)) / 1024:.1f} KB/frame")
+    print(f"Loop lag: {lag['avg_ms']:.2f} ms avg, {lag['p99_ms']:.2f} ms p99, {lag['max_ms']:.2f} ms max")
+    print("=" * 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Ghost Shell pipeline benchmark")
+    parser.add_argument("--source", default="synthetic:scroll_text",
+                        help=f"Frame source spec. Available: {available_frame_sources()}")
+    parser.add_argument("--clients", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--encoder", choices=["jpeg", "h264", "av", "auto"], default="jpeg",
+                        help="h264 needs ffmpeg in PATH, av needs PyAV")
+    parser.add_argument("--no-dedup", action="store_true", help="Disable unchanged-frame detection")
+    parser.add_argument("--tiles", action="store_true", help="Send dirty-tile deltas like /stream")
+    parser.add_argument("--tile-cache", type=int, default=TILE_CACHE_SIZE,
+                        help="Client tile cache size with --tiles (0 disables)")
+    parser.add_argument("--record", help="Write --frames frames from --source to this replay file and exit")
+    parser.add_argument("--frames", type=int, default=90)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args)
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
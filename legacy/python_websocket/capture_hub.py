@@ -0,0 +1,566 @@
+# Ghost Shell Capture Hub
+# One capture loop per target (locked window / foreground / monitor region),
+# shared by every /stream, WebRTC and /capture consumer.
+#
+# Consumers never capture on their own: they subscribe to a target key and read
+# numbered frames from the channel's latest-frame slot. Adding viewers does not
+# add captures or encodes - each frame is encoded once per encoder and cached.
+#
+# Capture and encode run on worker threads per channel, never on the asyncio
+# event loop. Finished frames are handed to the loop with call_soon_threadsafe,
+# so other WebSockets and HTTP handlers keep running.
+#
+# [PIPELINE] Capture and encode are separate stages joined by a bounded queue:
+# frame N+1 is captured while frame N is encoded (and N-1 is on the wire, see
+# stream_sender.py), so the frame rate is bound by the slowest stage instead of
+# their sum. When encode falls behind, the full queue blocks the capture thread
+# rather than dropping frames the change detector has already seen. Per-stage
+# timings are in stats() with the current bottleneck.
+#
+# With a change detector, a capture identical to the last published frame is
+# dropped before encoding: no new seq, so no consumer encodes or sends anything.
+#
+# Delta encoders (e.g. dirty tiles) encode a frame relative to an older frame the
+# consumer already has. The capture thread pre-computes the delta against the
+# previous frame; full-frame encodes are then only done on demand.
+#
+# With an encode pool (encode_pool.py), poolable full-frame encodes are submitted
+# to worker processes and the capture thread moves on to the next frame. A
+# publisher thread waits for each frame's encodes in submission order, so frames
+# are still published strictly by seq; the pool's ring bounds frames in flight.
+#
+# Stateful encoders (H.264: each frame references the ones before it) are given as
+# a PerChannelEncoder factory: every channel creates its own instance for its
+# target, so viewers of different windows never share one GOP, and a keyframe
+# request only restarts the stream of that channel. They are encoded on the
+# encode thread for every frame, in seq order, even when the deltas made full
+# frames unnecessary; only stateless encoders are left to Subscription.encoded().
+
+import asyncio
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from latency_stats import LatencyStats
+from metrics import get_metrics
+
+# Captured frames waiting for the encode stage (capture blocks beyond this)
+ENCODE_QUEUE_DEPTH = 2
+
+# (cache_key, encode_func) - encode_func(image) result is cached on the frame under cache_key
+FrameEncoder = Tuple[Hashable, Callable[[Any], Any]]
+# (cache_key, delta_func) - delta_func(base_image, image) result is cached under (cache_key, base.seq);
+# None means "no delta possible, send a full frame"
+DeltaEncoder = Tuple[Hashable, Callable[[Any, Any], Any]]
+
+
+class HubFrame:
+    """A captured frame published by a CaptureChannel.
+
+    `image` is whatever the capture function returned (PIL Image or numpy array).
+    Encoded payloads are cached per key so N consumers share one encode.
+    """
+
+    def __init__(self, seq: int, image: Any, window_title: Optional[str], captured_at: float):
+        self.seq = seq
+        self.image = image
+        self.window_title = window_title
+        self.captured_at = captured_at
+        self._encoded: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()  # Worker thread, event loop and /capture threadpool
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Return (width, height) for PIL images and numpy arrays alike."""
+        shape = getattr(self.image, "shape", None)
+        if shape is not None:
+            return shape[1], shape[0]
+        return self.image.size
+
+    def cached(self, cache_key: Hashable) -> Any:
+        """Encoded payload for cache_key if already computed, else None."""
+        return self._encoded.get(cache_key)
+
+    def encode(self, cache_key: Hashable, encode_func: Callable[[Any], Any]) -> Any:
+        """Return encode_func(image), computing it only once per cache_key."""
+        with self._lock:
+            if cache_key not in self._encoded:
+                self._encoded[cache_key] = encode_func(self.image)
+            return self._encoded[cache_key]
+
+    def store(self, cache_key: Hashable, value: Any):
+        """Cache a payload encoded elsewhere (e.g. by the encode pool)."""
+        with self._lock:
+            self._encoded.setdefault(cache_key, value)
+
+    def encode_delta(self, cache_key: Hashable, base: "HubFrame", delta_func: Callable[[Any, Any], Any]) -> Any:
+        """Return delta_func(base.image, image), computing it only once per (cache_key, base)."""
+        return self.encode((cache_key, base.seq), lambda image: delta_func(base.image, image))
+
+    def derived(self, cache_key: Hashable, transform: Callable[[Any], Any]) -> "HubFrame":
+        """HubFrame of transform(image) (e.g. a downscale) with this frame's seq, title and
+        capture time and its own encode cache; computed once per cache_key."""
+        return self.encode(("derived", cache_key),
+                           lambda image: HubFrame(self.seq, transform(image), self.window_title, self.captured_at))
+
+
+class PerChannelEncoder:
+    """FrameEncoder func for a stateful encoder: factory(channel_key) builds one instance per channel.
+
+    The instance has encode(image) and optionally request_keyframe(), stats() and
+    cleanup(); it is cleaned up on the encode thread once no subscription uses it.
+    fallback(image) is the payload for a frame the instance never saw (published
+    before the subscription, or its encode failed): feeding it such a frame
+    later would break the order of its stream.
+    """
+
+    def __init__(self, factory: Callable[[Hashable], Any], fallback: Optional[Callable[[Any], Any]] = None):
+        self.factory = factory
+        self.fallback = fallback
+
+
+def _add_ref(table: dict, refs: Dict[Hashable, int], entry: tuple):
+    """Register a (cache_key, func) entry in table and count one more user."""
+    cache_key, func = entry
+    table[cache_key] = func
+    refs[cache_key] = refs.get(cache_key, 0) + 1
+
+
+def _drop_ref(table: dict, refs: Dict[Hashable, int], entry: tuple) -> bool:
+    """Undo one _add_ref(); the entry is removed with its last user (returns True then)."""
+    cache_key = entry[0]
+    count = refs.get(cache_key, 0) - 1
+    if count > 0:
+        refs[cache_key] = count
+        return False
+    refs.pop(cache_key, None)
+    table.pop(cache_key, None)
+    return True
+
+
+class CaptureChannel:
+    """Owns the capture thread for one target and publishes into a latest-frame slot."""
+
+    def __init__(self, key: Hashable, capture_func: Callable, frame_interval: Callable[[], float],
+                 change_detector: Optional[Callable[[Any], Hashable]] = None, encode_pool: Any = None):
+        self.key = key
+        self._capture_func = capture_func
+        self._frame_interval = frame_interval
+        self._change_detector = change_detector
+        self._last_digest: Optional[Hashable] = None
+        # Encoders run on the worker thread right after capture, before publishing. Counted
+        # per cache_key: an entry goes when the last subscription using it closes
+        self._encoders: Dict[Hashable, Callable[[Any], Any]] = {}
+        self._delta_encoders: Dict[Hashable, Callable[[Any, Any], Any]] = {}
+        self._encoder_refs: Dict[Hashable, int] = {}
+        self._delta_encoder_refs: Dict[Hashable, int] = {}
+        # This channel's PerChannelEncoder instances; dropped ones wait for the encode thread
+        self._channel_encoders: Dict[Hashable, Any] = {}
+        self._retired_encoders: list = []
+        self._previous: Optional[HubFrame] = None  # Last frame pre-encoded (encode thread side)
+        # [PIPELINE] (frame, queued_at) from the capture thread to the encode thread
+        self._captured: "queue.Queue[Optional[Tuple[HubFrame, float]]]" = queue.Queue(ENCODE_QUEUE_DEPTH)
+        self._encoder_thread: Optional[threading.Thread] = None
+        # [ENCODE POOL] (frame, [(cache_key, future)], submitted_at) in seq order, drained by the publisher thread
+        self._encode_pool = encode_pool
+        self._pending: Optional[queue.Queue] = queue.Queue(encode_pool.max_in_flight) if encode_pool else None
+        self._publisher: Optional[threading.Thread] = None
+        self.latest: Optional[HubFrame] = None
+        self.last_title: Optional[str] = None
+        self.seq = 0
+        self.subscribers = 0
+        self.captures = 0
+        self.failures = 0
+        self.unchanged = 0  # Captures dropped as identical to the latest frame
+        self.capture_ms = 0.0  # Last capture + change-detection time
+        self.detect_ms = 0.0  # Last change-detection time
+        # Per-stage timings (seconds); the histograms are shared by all channels (/metrics)
+        metrics = get_metrics()
+        self.capture_time = LatencyStats(histogram=metrics.histogram(
+            "capture_seconds", "Capture plus change detection per published frame"))
+        self.encode_wait = LatencyStats(histogram=metrics.histogram(   # Captured -> picked up by the encode thread
+            "encode_queue_wait_seconds", "Captured frame waiting for the encode stage"))
+        self.encode_time = LatencyStats(histogram=metrics.histogram(   # Pre-encode (deltas + full frame, or pool submit)
+            "encode_seconds", "Pre-encode per frame (deltas and full frame, or pool submit)"))
+        self.pool_wait = LatencyStats(histogram=metrics.histogram(     # Encode pool only: submitted -> all encodes done
+            "encode_pool_wait_seconds", "Encode pool: submitted to all encodes done"))
+        self._frames_counter = metrics.counter("frames_captured_total", "Frames captured and published")
+        self._unchanged_counter = metrics.counter("frames_unchanged_total", "Captures dropped as unchanged")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._new_frame: Optional[asyncio.Future] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_encoder(self, encoder: Optional[FrameEncoder]):
+        if encoder is None:
+            return
+        cache_key, encode_func = encoder
+        if isinstance(encode_func, PerChannelEncoder):
+            instance = self._channel_encoders.get(cache_key)
+            if instance is None:
+                instance = self._channel_encoders[cache_key] = encode_func.factory(self.key)
+            encode_func = instance.encode
+        _add_ref(self._encoders, self._encoder_refs, (cache_key, encode_func))
+
+    def remove_encoder(self, encoder: Optional[FrameEncoder]):
+        if encoder is not None and _drop_ref(self._encoders, self._encoder_refs, encoder):
+            instance = self._channel_encoders.pop(encoder[0], None)
+            if instance is not None:
+                # The encode thread may be inside instance.encode(): it cleans up between frames
+                self._retired_encoders.append(instance)
+
+    def channel_encoder(self, cache_key: Hashable) -> Any:
+        """This channel's PerChannelEncoder instance for cache_key, or None."""
+        return self._channel_encoders.get(cache_key)
+
+    def encoder_stats(self) -> dict:
+        """stats() of this channel's PerChannelEncoder instances, by cache key."""
+        return {str(cache_key): instance.stats() for cache_key, instance in list(self._channel_encoders.items())
+                if hasattr(instance, "stats")}
+
+    def _cleanup_retired_encoders(self):
+        """Encode thread: release PerChannelEncoder instances no subscription uses any more."""
+        while self._retired_encoders:
+            instance = self._retired_encoders.pop()
+            cleanup = getattr(instance, "cleanup", None)
+            if cleanup is not None:
+                try:
+                    cleanup()
+                except Exception as e:
+                    print(f"[HUB] Encoder cleanup error on {self.key}: {e}")
+
+    def add_delta_encoder(self, delta_encoder: Optional[DeltaEncoder]):
+        if delta_encoder is not None:
+            _add_ref(self._delta_encoders, self._delta_encoder_refs, delta_encoder)
+
+    def remove_delta_encoder(self, delta_encoder: Optional[DeltaEncoder]):
+        if delta_encoder is not None:
+            _drop_ref(self._delta_encoders, self._delta_encoder_refs, delta_encoder)
+
+    def start(self):
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._new_frame = self._loop.create_future()
+            self._thread = threading.Thread(target=self._run, name=f"capture-{self.key}", daemon=True)
+            self._thread.start()
+            self._encoder_thread = threading.Thread(target=self._encode_frames, name=f"encode-{self.key}",
+                                                    daemon=True)
+            self._encoder_thread.start()
+            if self._pending is not None:
+                self._publisher = threading.Thread(target=self._publish_in_order, name=f"publish-{self.key}",
+                                                   daemon=True)
+                self._publisher.start()
+
+    def stop(self):
+        # Never join here: we are on the event loop and the thread may be mid-capture
+        self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        """Capture thread: capture -> change detection -> hand off to the encode thread."""
+        print(f"[HUB] Capture thread started: {self.key}")
+        while not self._stop.is_set():
+            frame_start = time.perf_counter()
+            try:
+                image, window_title = self._capture_func(self.key)
+            except Exception as e:
+                print(f"[HUB] Capture error on {self.key}: {e}")
+                image, window_title = None, None
+
+            self.captures += 1
+            title_changed = window_title != self.last_title
+            self.last_title = window_title
+            if image is not None and self._is_unchanged(image, title_changed):
+                self.unchanged += 1  # Skip encode and publish: consumers keep the frame they have
+                self._unchanged_counter.inc()
+            elif image is not None:
+                self.seq += 1
+                frame = HubFrame(self.seq, image, window_title, time.time())
+                captured = time.perf_counter()
+                self.capture_time.add(captured - frame_start)
+                self._frames_counter.inc()
+                self._captured.put((frame, captured))  # Blocks while the encode stage is behind
+            else:
+                self.failures += 1
+
+            elapsed = time.perf_counter() - frame_start
+            self.capture_ms = elapsed * 1000
+            self._stop.wait(max(0.001, self._frame_interval() - elapsed))
+        self._captured.put(None)  # Encode thread exits after the frames already captured
+        print(f"[HUB] Capture thread stopped: {self.key}")
+
+    def _encode_frames(self):
+        """Encode thread: pre-encode -> hand off to the event loop (or the in-order publisher)."""
+        while True:
+            item = self._captured.get()
+            self._cleanup_retired_encoders()
+            if item is None:
+                break
+            frame, captured = item
+            encode_start = time.perf_counter()
+            self.encode_wait.add(encode_start - captured)
+            jobs = self._pre_encode(frame)
+            self.encode_time.add(time.perf_counter() - encode_start)
+            self._previous = frame
+            if self._pending is not None:
+                self._pending.put((frame, jobs, time.perf_counter()))  # Blocks while max_in_flight frames are pending
+            elif not self._stop.is_set():
+                try:
+                    self._loop.call_soon_threadsafe(self._publish, frame)
+                except RuntimeError:
+                    self._stop.set()  # Event loop closed (server shutting down); drain until the sentinel
+        if self._pending is not None:
+            self._pending.put(None)  # Publisher exits after the frames still in flight
+
+    def _publish_in_order(self):
+        """Publisher thread (encode pool only): frames leave in seq order, each once its encodes are done."""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            frame, jobs, submitted = item
+            for cache_key, future in jobs:
+                try:
+                    frame.store(cache_key, future.result())
+                except Exception as e:
+                    # Subscription.encoded() encodes it in process on demand
+                    print(f"[HUB] Pooled encode error on {self.key}: {e}")
+            self.pool_wait.add(time.perf_counter() - submitted)
+            if self._stop.is_set():
+                continue
+            try:
+                self._loop.call_soon_threadsafe(self._publish, frame)
+            except RuntimeError:
+                self._stop.set()  # Event loop closed (server shutting down); drain until the sentinel
+
+    def _pre_encode(self, frame: HubFrame) -> list:
+        """Encode on the worker thread what consumers will ask for. Stateful encoders
+        always; then deltas: when every delta succeeds, in-sync consumers never need
+        the full frame. Returns [(cache_key, future)] for encodes submitted to the encode pool."""
+        # Every frame, in seq order: a skipped or late frame would break their streams
+        for cache_key, instance in list(self._channel_encoders.items()):
+            try:
+                frame.encode(cache_key, instance.encode)
+            except Exception as e:
+                print(f"[HUB] Encode error on {self.key}: {e}")
+        deltas_ok = False
+        if self._previous is not None and self._delta_encoders:
+            deltas_ok = True
+            for cache_key, delta_func in list(self._delta_encoders.items()):
+                try:
+                    if frame.encode_delta(cache_key, self._previous, delta_func) is None:
+                        deltas_ok = False
+                except Exception as e:
+                    deltas_ok = False
+                    print(f"[HUB] Delta encode error on {self.key}: {e}")
+        if deltas_ok:
+            return []  # Stateless full frames are encoded lazily by Subscription.encoded()
+        jobs = []
+        for cache_key, encode_func in list(self._encoders.items()):
+            if cache_key in self._channel_encoders:
+                continue  # Done above
+            try:
+                if self._encode_pool is not None and self._encode_pool.can_encode(encode_func):
+                    jobs.append((cache_key, self._encode_pool.submit(frame.image, encode_func)))
+                else:
+                    frame.encode(cache_key, encode_func)
+            except Exception as e:
+                print(f"[HUB] Encode error on {self.key}: {e}")
+        return jobs
+
+    def _is_unchanged(self, image: Any, title_changed: bool) -> bool:
+        """True if image is pixel-identical to the last published frame. Worker thread."""
+        if self._change_detector is None:
+            return False
+        detect_start = time.perf_counter()
+        digest = self._change_detector(image)
+        self.detect_ms = (time.perf_counter() - detect_start) * 1000
+        unchanged = digest is not None and digest == self._last_digest and not title_changed
+        self._last_digest = digest
+        return unchanged
+
+    def stage_stats(self) -> dict:
+        """[PIPELINE] Per-stage timings and the stage with the highest average time."""
+        stages = {
+            "capture": self.capture_time.stats(),
+            "encode_wait": self.encode_wait.stats(),
+            "encode": self.encode_time.stats(),
+        }
+        if self._pending is not None:
+            stages["pool_wait"] = self.pool_wait.stats()
+        busy = {name: stages[name]["avg_ms"] for name in ("capture", "encode", "pool_wait") if name in stages}
+        return {
+            "stages": stages,
+            "encode_queued": self._captured.qsize(),
+            "bottleneck": max(busy, key=busy.get) if any(busy.values()) else None,
+        }
+
+    def _publish(self, frame: HubFrame):
+        """Runs on the event loop."""
+        self.latest = frame
+        # Wake every waiting consumer, then arm a fresh future for the next frame
+        waiters, self._new_frame = self._new_frame, self._loop.create_future()
+        waiters.set_result(frame.seq)
+
+
+class Subscription:
+    """A consumer's view of a channel. Tracks the last frame it has seen."""
+
+    def __init__(self, hub: "CaptureHub", channel: CaptureChannel, encoder: Optional[FrameEncoder] = None,
+                 delta_encoder: Optional[DeltaEncoder] = None):
+        self._hub = hub
+        self.channel = channel
+        self.encoder = encoder
+        self.delta_encoder = delta_encoder
+        self.last_seq = 0
+        self.closed = False
+
+    @property
+    def key(self) -> Hashable:
+        return self.channel.key
+
+    async def next_frame(self, timeout: Optional[float] = None) -> Optional[HubFrame]:
+        """Return the newest frame this subscriber has not seen yet.
+
+        A fresh subscriber gets the current frame immediately (no extra capture).
+        Returns None if no new frame arrives within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            frame = self.channel.latest
+            if frame is not None and frame.seq > self.last_seq:
+                self.last_seq = frame.seq
+                return frame
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return None
+            # asyncio.wait() never cancels the shared future and never swallows our own cancellation
+            done, _ = await asyncio.wait([self.channel._new_frame], timeout=remaining)
+            if not done:
+                return None
+
+    async def latest_frame(self, timeout: Optional[float] = None) -> Optional[HubFrame]:
+        """Return the current frame even if already seen; only waits when the slot is empty."""
+        frame = self.channel.latest
+        if frame is not None:
+            self.last_seq = frame.seq
+            return frame
+        return await self.next_frame(timeout)
+
+    async def encoded(self, frame: HubFrame) -> Any:
+        """This subscriber's encoded payload for frame.
+
+        Normally already computed by the capture thread; a frame published before
+        we subscribed is encoded in a worker thread rather than on the event loop.
+        A PerChannelEncoder only encodes on the encode thread: such a frame gets its
+        fallback (None without one).
+        """
+        cache_key, encode_func = self.encoder
+        cached = frame.cached(cache_key)
+        if cached is not None:
+            return cached
+        if isinstance(encode_func, PerChannelEncoder):
+            if encode_func.fallback is None:
+                return None
+            return await asyncio.to_thread(frame.encode, ("fallback", cache_key), encode_func.fallback)
+        return await asyncio.to_thread(frame.encode, cache_key, encode_func)
+
+    async def encoded_delta(self, base: HubFrame, frame: HubFrame) -> Any:
+        """Delta payload turning base (a frame of this channel the consumer already
+        has) into frame, or None if a full frame must be sent instead."""
+        cache_key, delta_func = self.delta_encoder
+        cached = frame.cached((cache_key, base.seq))
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(frame.encode_delta, cache_key, base, delta_func)
+
+    def request_keyframe(self):
+        """Ask this channel's instance of a PerChannelEncoder for a keyframe (no-op otherwise)."""
+        instance = self.channel.channel_encoder(self.encoder[0]) if self.encoder is not None else None
+        request = getattr(instance, "request_keyframe", None)
+        if request is not None:
+            request()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._hub._release(self)
+
+
+class CaptureHub:
+    """Registry of capture channels keyed by target.
+
+    capture_func(key) -> (image or None, window_title) runs once per tick per
+    target, no matter how many consumers are subscribed to that target.
+    """
+
+    def __init__(self, capture_func: Callable, frame_interval: Callable[[], float],
+                 change_detector: Optional[Callable[[Any], Hashable]] = None, encode_pool: Any = None):
+        self._capture_func = capture_func
+        self._frame_interval = frame_interval
+        # change_detector(image) -> digest; equal digests mean the frame is skipped
+        self._change_detector = change_detector
+        # Optional EncodePool for full-frame encodes (encode_pool.py)
+        self._encode_pool = encode_pool
+        self._channels: Dict[Hashable, CaptureChannel] = {}
+
+    def subscribe(self, key: Hashable, encoder: Optional[FrameEncoder] = None,
+                  delta_encoder: Optional[DeltaEncoder] = None) -> Subscription:
+        """Subscribe to a target, starting its capture thread if needed. Call from the event loop.
+
+        encoder: optional (cache_key, encode_func) the capture thread should apply to every frame.
+        delta_encoder: optional (cache_key, delta_func) applied against the previous frame.
+        """
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = CaptureChannel(key, self._capture_func, self._frame_interval, self._change_detector,
+                                     self._encode_pool)
+            self._channels[key] = channel
+            channel.start()
+        channel.add_encoder(encoder)
+        channel.add_delta_encoder(delta_encoder)
+        channel.subscribers += 1
+        return Subscription(self, channel, encoder, delta_encoder)
+
+    def switch(self, subscription: Subscription, key: Hashable) -> Subscription:
+        """Move a subscription to another target (e.g. after lock/unlock)."""
+        if subscription.key == key and not subscription.closed:
+            return subscription
+        new_subscription = self.subscribe(key, subscription.encoder, subscription.delta_encoder)
+        subscription.close()
+        return new_subscription
+
+    def _release(self, subscription: Subscription):
+        channel = subscription.channel
+        channel.remove_encoder(subscription.encoder)
+        channel.remove_delta_encoder(subscription.delta_encoder)
+        channel.subscribers -= 1
+        if channel.subscribers <= 0 and self._channels.get(channel.key) is channel:
+            del self._channels[channel.key]
+            channel.stop()
+
+    def latest(self, key: Hashable) -> Optional[HubFrame]:
+        """Latest frame of a live channel, or None. Safe to call from any thread."""
+        channel = self._channels.get(key)
+        return channel.latest if channel is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "channels": [
+                {
+                    "target": list(channel.key) if isinstance(channel.key, tuple) else channel.key,
+                    "subscribers": channel.subscribers,
+                    "seq": channel.seq,
+                    "captures": channel.captures,
+                    "failures": channel.failures,
+                    "unchanged": channel.unchanged,
+                    "capture_ms": round(channel.capture_ms, 2),
+                    "detect_ms": round(channel.detect_ms, 2),
+                    "pending": channel._pending.qsize() if channel._pending is not None else None,
+                    "encoders": channel.encoder_stats(),
+                    **channel.stage_stats(),
+                }
+                for channel in list(self._channels.values())
+            ]
+        }
@@ -0,0 +1,144 @@
+# Ghost Shell Capture Scoreboard
+# A locked window used to go through the whole backend chain on every frame:
+# WGC first, then PrintWindow(PW_RENDERFULLCONTENT) / WM_PRINT / PrintWindow(0) /
+# BitBlt. A window WGC never works for paid for that failure 30 times a second.
+#
+# The scoreboard remembers, per window (hwnd), the success rate and capture time
+# of every method it tried. Each frame starts with the fastest method that works
+# for that window, and the remaining methods follow only as fallbacks. Every
+# PROBE_INTERVAL one other method goes first instead, so a method that started
+# working or got faster (window moved to another GPU, restored from minimized)
+# is found again. A probe that fails costs one attempt; the known-good method
+# still produces the frame.
+#
+# Fallback-only methods (BitBlt from the screen DC) copy whatever is on screen at
+# the window's rect - a covering window included - so they are never chosen or
+# probed, only used when everything else failed for a frame.
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional
+
+PROBE_INTERVAL = 10.0   # Seconds between probes of non-chosen methods, per window
+SCORE_ALPHA = 0.2       # EWMA weight of the newest sample (success and latency)
+MIN_SUCCESS_RATE = 0.5  # Below this a method is not chosen
+MAX_WINDOWS = 64        # Least recently captured windows are forgotten beyond this
+
+
+class MethodScore:
+    """Attempts, EWMA success rate and EWMA capture time of one method for one window."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.success_rate = 0.0
+        self.latency = None  # Seconds, successful captures only
+        self.last_tried = 0.0
+
+    def record(self, ok: bool, seconds: float, now: float):
+        self.attempts += 1
+        self.last_tried = now
+        if self.attempts == 1:
+            self.success_rate = 1.0 if ok else 0.0
+        else:
+            self.success_rate += SCORE_ALPHA * ((1.0 if ok else 0.0) - self.success_rate)
+        if ok:
+            self.successes += 1
+            self.latency = seconds if self.latency is None else self.latency + SCORE_ALPHA * (seconds - self.latency)
+
+    def stats(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "success_rate": round(self.success_rate, 2),
+            "avg_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+        }
+
+
+class WindowScore:
+    def __init__(self, title: Optional[str]):
+        self.title = title
+        self.methods: Dict[str, MethodScore] = {}
+        self.chosen: Optional[str] = None
+        self.last_probe = time.monotonic()
+        self.probes = 0
+
+
+class CaptureScoreboard:
+    """Per-window method ranking for locked-window capture."""
+
+    def __init__(self, methods: List[str], fallback_only: Iterable[str] = (),
+                 probe_interval: float = PROBE_INTERVAL):
+        self.methods = list(methods)  # Default order for windows with no history
+        self.fallback_only = set(fallback_only)
+        self.probe_interval = probe_interval
+        self._windows: "OrderedDict[Hashable, WindowScore]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _window(self, key: Hashable, title: Optional[str]) -> WindowScore:
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = WindowScore(title)
+            while len(self._windows) > MAX_WINDOWS:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(key)
+            if title:
+                window.title = title
+        return window
+
+    def _choose(self, window: WindowScore) -> Optional[str]:
+        working = [(score.latency, name) for name, score in window.methods.items()
+                   if name in self.methods and name not in self.fallback_only and score.latency is not None
+                   and score.success_rate >= MIN_SUCCESS_RATE]
+        return min(working)[1] if working else None
+
+    def plan(self, key: Hashable, title: Optional[str] = None) -> List[str]:
+        """Methods to try for this frame, in order; stop at the first success."""
+        with self._lock:
+            window = self._window(key, title)
+            chosen = window.chosen
+            if chosen is None:
+                return list(self.methods)
+            order = [chosen] + [name for name in self.methods if name != chosen]
+            now = time.monotonic()
+            if now - window.last_probe >= self.probe_interval:
+                window.last_probe = now
+                # Probe the method tried least recently (never-tried ones first)
+                others = [name for name in self.methods if name != chosen and name not in self.fallback_only]
+                if others:
+                    probe = min(others, key=lambda name: (window.methods[name].last_tried
+                                                          if name in window.methods else 0.0))
+                    window.probes += 1
+                    order.remove(probe)
+                    order.insert(0, probe)
+            return order
+
+    def record(self, key: Hashable, method: str, ok: bool, seconds: float):
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                return
+            score = window.methods.get(method)
+            if score is None:
+                score = window.methods[method] = MethodScore()
+            score.record(ok, seconds, time.monotonic())
+            chosen = self._choose(window)
+            if chosen != window.chosen:
+                print(f"[CAPTURE] '{(window.title or key)}': {window.chosen} -> {chosen}")
+                window.chosen = chosen
+
+    def chosen(self, key: Hashable) -> Optional[str]:
+        window = self._windows.get(key)
+        return window.chosen if window else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            windows = [
+                {"hwnd": key, "title": window.title, "chosen": window.chosen, "probes": window.probes,
+                 "methods": {name: score.stats() for name, score in window.methods.items()}}
+                for key, window in reversed(self._windows.items())
+            ]
+        return {"methods": self.methods, "fallback_only": sorted(self.fallback_only),
+                "probe_interval_s": self.probe_interval, "windows": windows}
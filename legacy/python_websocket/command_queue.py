@@ -0,0 +1,76 @@
+# Ghost Shell Session Command Queue (pointer coalescing)
+# Drag mode streams mousemove commands faster than they can be injected (each one
+# is a window lookup plus SendInput on the input thread). Instead of replaying a
+# backlog that trails the finger, a move that arrives while another move is still
+# waiting at the tail of the queue replaces it: only the latest position of a run
+# of moves is injected. Moves never merge across a mousedown/mouseup/click, so
+# the press and release still happen where they were sent.
+
+import asyncio
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+from latency_stats import LatencyStats
+
+POINTER_MOVE_ACTIONS = {"mousemove"}
+RATE_WINDOW = 5.0  # Seconds over which moves/s is computed
+
+
+def is_pointer_move(cmd: dict) -> bool:
+    return cmd.get("action", cmd.get("type")) in POINTER_MOVE_ACTIONS
+
+
+class CommandQueue:
+    """FIFO of (command, received_at) for one session, with pointer-move coalescing."""
+
+    def __init__(self):
+        self._items: deque = deque()
+        self._ready = asyncio.Event()
+        self.moves_received = 0
+        self.moves_coalesced = 0
+        self.moves_injected = 0
+        self.pointer_lag = LatencyStats()  # Receipt of the injected position -> injected
+        self._injected_at: deque = deque()
+
+    def put(self, cmd: dict, received_at: Optional[float] = None):
+        received_at = time.perf_counter() if received_at is None else received_at
+        if is_pointer_move(cmd):
+            self.moves_received += 1
+            if self._items and is_pointer_move(self._items[-1][0]):
+                # Still waiting: the newer position supersedes it
+                self._items[-1] = (cmd, received_at)
+                self.moves_coalesced += 1
+                return
+        self._items.append((cmd, received_at))
+        self._ready.set()
+
+    async def get(self) -> Tuple[dict, float]:
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()
+
+    def move_injected(self, received_at: float):
+        """Record that a (possibly coalesced) move received at received_at was injected."""
+        now = time.perf_counter()
+        self.moves_injected += 1
+        self.pointer_lag.add(now - received_at)
+        self._injected_at.append(now)
+        while now - self._injected_at[0] > RATE_WINDOW:
+            self._injected_at.popleft()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        now = time.perf_counter()
+        recent = sum(1 for t in self._injected_at if now - t <= RATE_WINDOW)
+        return {
+            "queued": len(self._items),
+            "moves_received": self.moves_received,
+            "moves_coalesced": self.moves_coalesced,
+            "moves_injected": self.moves_injected,
+            "moves_per_s": round(recent / RATE_WINDOW, 1),
+            "pointer_lag": self.pointer_lag.stats(),
+        }
@@ -0,0 +1,222 @@
+# Ghost Shell Encode Pool (multi-process JPEG)
+# The capture thread encodes each frame before it captures the next one, and the
+# numpy/PIL glue around the encoder holds the GIL: at high frame rates one core
+# saturates while the rest idle. With a pool, full-frame JPEG encodes run in
+# worker processes, several frames at a time:
+#
+#   capture thread:  capture N+2 | copy into ring slot | submit     (blocks at max_in_flight)
+#   workers:         encode N, N+1 in parallel, each from its slot
+#   publisher:       waits for N, then N+1, ... -> publishes in sequence order
+#
+# Pixels travel through a ring of multiprocessing.shared_memory slots (one copy
+# in, nothing pickled but the slot name); the encoded bytes come back through the
+# pool's result pipe. A slot is reused only after its frame was encoded, so the
+# ring size is the bound on frames in flight - and on the latency the pool adds.
+#
+# Only stateless encoders can be pooled (JPEG at a fixed quality). H.264 depends on
+# the previous frame and tile deltas on the frame the client has; they stay in
+# process.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from latency_stats import LatencyStats
+from pixel_frame import CV2_AVAILABLE, NUMPY_AVAILABLE, PixelFrame, as_pixel_frame, cv2, np
+
+# Frames in flight (submitted, not yet published) per pool
+DEFAULT_MAX_IN_FLIGHT = 4
+MAX_WORKERS = 4
+
+
+def default_pool_workers() -> int:
+    """Worker processes to use: 0 (pool off) on machines with fewer than 4 cores."""
+    cores = os.cpu_count() or 1
+    if cores < 4 or not (CV2_AVAILABLE and NUMPY_AVAILABLE):
+        return 0
+    return min(MAX_WORKERS, cores - 2)
+
+
+class PoolEncodeFunc:
+    """A hub encode function the EncodePool may run out of process.
+
+    Called directly it encodes in process (fallback); the pool instead runs a JPEG
+    encode at `quality` in a worker and caches wrap(jpeg_bytes), so both paths
+    produce the same cached value.
+    """
+
+    def __init__(self, func: Callable[[Any], Any], quality: int, wrap: Optional[Callable[[bytes], Any]] = None):
+        self.func = func
+        self.quality = quality
+        self.wrap = wrap or (lambda data: data)
+
+    def __call__(self, image: Any) -> Any:
+        return self.func(image)
+
+
+# ==================== Worker process side ====================
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    segment = _attached.get(name)
+    if segment is None:
+        # Pool workers share the parent's resource tracker: the segment stays the parent's to unlink
+        segment = shared_memory.SharedMemory(name=name)
+        _attached[name] = segment
+        while len(_attached) > 4 * DEFAULT_MAX_IN_FLIGHT:
+            stale = next(iter(_attached))
+            _attached.pop(stale).close()
+    return segment
+
+
+def _encode_in_worker(name: str, shape: Tuple[int, ...], pixel_format: str, quality: int) -> Tuple[bytes, float]:
+    started = time.perf_counter()
+    segment = _attach(name)
+    array = np.ndarray(shape, dtype=np.uint8, buffer=segment.buf)
+    _, encoded = cv2.imencode(".jpg", PixelFrame(array, pixel_format).to_bgr(), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes(), time.perf_counter() - started
+
+
+# ==================== Parent side ====================
+class SharedFrameRing:
+    """Fixed number of shared-memory slots; acquire() blocks while all are in use."""
+
+    def __init__(self, slots: int):
+        self._segments: List[Optional[shared_memory.SharedMemory]] = [None] * slots
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for index in range(slots):
+            self._free.put(index)
+
+    def acquire(self, nbytes: int) -> Tuple[int, shared_memory.SharedMemory]:
+        index = self._free.get()
+        segment = self._segments[index]
+        if segment is None or segment.size < nbytes:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+            segment = self._segments[index] = shared_memory.SharedMemory(create=True, size=nbytes)
+        return index, segment
+
+    def release(self, index: int):
+        self._free.put(index)
+
+    def in_use(self) -> int:
+        return len(self._segments) - self._free.qsize()
+
+    def close(self):
+        for segment in self._segments:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+        self._segments = [None] * len(self._segments)
+
+
+class EncodePool:
+    """Process pool for PoolEncodeFunc jobs, fed through a SharedFrameRing."""
+
+    def __init__(self, workers: int, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._ring = SharedFrameRing(max_in_flight)
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.errors = 0
+        self.slot_wait = LatencyStats()   # Capture thread blocked on a free slot
+        self.encode_time = LatencyStats()  # Encode inside the worker
+        self.round_trip = LatencyStats()   # Submit -> result back in this process
+
+    def _ensure_started(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    print(f"✅ Encode pool started: {self.workers} worker processes, {self.max_in_flight} frames in flight")
+
+    def can_encode(self, encode_func: Any) -> bool:
+        return isinstance(encode_func, PoolEncodeFunc)
+
+    def submit(self, image: Any, job: PoolEncodeFunc) -> Future:
+        """Encode image with job out of process; the Future yields job.wrap(jpeg_bytes).
+
+        Blocks while max_in_flight frames are already submitted."""
+        self._ensure_started()
+        frame = as_pixel_frame(image)
+        array = frame.array
+        started = time.perf_counter()
+        index, segment = self._ring.acquire(array.nbytes)
+        submitted = time.perf_counter()
+        self.slot_wait.add(submitted - started)
+        np.ndarray(array.shape, dtype=np.uint8, buffer=segment.buf)[...] = array  # The one copy
+        result: Future = Future()
+        try:
+            work = self._executor.submit(_encode_in_worker, segment.name, array.shape, frame.pixel_format, job.quality)
+        except Exception:
+            self._ring.release(index)
+            raise
+
+        def done(work: Future):
+            self._ring.release(index)
+            self.jobs += 1
+            try:
+                data, encode_seconds = work.result()
+            except Exception as e:
+                self.errors += 1
+                result.set_exception(e)
+                return
+            self.encode_time.add(encode_seconds)
+            self.round_trip.add(time.perf_counter() - submitted)
+            result.set_result(job.wrap(data))
+
+        work.add_done_callback(done)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._ring.in_use(),
+            "jobs": self.jobs,
+            "errors": self.errors,
+            "slot_wait": self.slot_wait.stats(),
+            "encode": self.encode_time.stats(),
+            "round_trip": self.round_trip.stats(),
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._ring.close()
+
+
+# Global singleton (None = pool disabled)
+_encode_pool: Optional[EncodePool] = None
+_encode_pool_configured = False
+
+
+def configure_encode_pool(workers: Optional[int] = None, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+    """Set the pool size before first use: None = default_pool_workers(), 0 = off."""
+    global _encode_pool, _encode_pool_configured
+    workers = default_pool_workers() if workers is None else workers
+    _encode_pool = EncodePool(workers, max_in_flight) if workers > 0 else None
+    _encode_pool_configured = True
+
+
+def get_encode_pool() -> Optional[EncodePool]:
+    """Get the global encode pool, or None if it is disabled."""
+    if not _encode_pool_configured:
+        configure_encode_pool()
+    return _encode_pool
+
+
+def shutdown_encode_pool():
+    global _encode_pool
+    if _encode_pool is not None:
+        _encode_pool.close()
+        _encode_pool = None
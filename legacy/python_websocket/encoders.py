@@ -1,12 +1,19 @@
 # Ghost Shell Multi-Backend Encoder System
-# Auto-detects and uses best available: NVENC > FFmpeg H.264 > JPEG
+# Auto-detects and uses best available: PyAV H.264 > NVENC > FFmpeg H.264 > JPEG
 
 import io
+import queue
 import subprocess
 import shutil
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple
+from fractions import Fraction
+from typing import Optional, Tuple, Union
 from PIL import Image
+from pixel_frame import PixelFrame, as_pixel_frame, to_pil_image
+from h264_stream import AccessUnit, FlvAccessUnitReader
+from jpeg_slices import default_slices, encode_jpeg_sliced
 
 # Optional imports with availability flags
 try:
@@ -23,6 +30,13 @@ except ImportError:
     CV2_AVAILABLE = False
     cv2 = None
 
+try:
+    import av
+    AV_AVAILABLE = True
+except ImportError:
+    AV_AVAILABLE = False
+    av = None
+
 # Check NVIDIA GPU
 NVIDIA_AVAILABLE = False
 try:
@@ -44,6 +58,9 @@ if FFMPEG_AVAILABLE:
 else:
     print("⚠️ FFmpeg not in PATH - H.264 encoding unavailable")
 
+# Anything a capture backend can hand to an encoder
+FrameInput = Union[PixelFrame, Image.Image]
+
 
 class BaseEncoder(ABC):
     """Base class for all encoders."""
@@ -60,8 +77,8 @@ class BaseEncoder(ABC):
         pass
     
     @abstractmethod
-    def encode(self, image: Image.Image) -> bytes:
-        """Encode PIL Image to bytes."""
+    def encode(self, image: FrameInput) -> bytes:
+        """Encode a PixelFrame (BGRA/BGR/RGB) or PIL Image to bytes."""
         pass
     
     def cleanup(self):
@@ -70,13 +87,18 @@ class BaseEncoder(ABC):
 
 
 class JPEGEncoder(BaseEncoder):
-    """JPEG encoder - uses cv2 if available (faster), otherwise PIL."""
+    """JPEG encoder - uses cv2 if available (faster), otherwise PIL.
+
+    Frames of PARALLEL_MIN_PIXELS and up are encoded as parallel slices on a
+    thread pool (see jpeg_slices.py); slices=1 disables that.
+    """
     
-    def __init__(self, quality: int = 85):
+    def __init__(self, quality: int = 85, slices: Optional[int] = None):
         self.quality = quality
+        self.slices = slices or default_slices()
         self._use_cv2 = CV2_AVAILABLE and NUMPY_AVAILABLE
         if self._use_cv2:
-            print(f"📷 Using CV2 JPEG encoder (quality={quality}) - FAST")
+            print(f"📷 Using CV2 JPEG encoder (quality={quality}, {self.slices} slices for large frames) - FAST")
         else:
             print(f"📷 Using PIL JPEG encoder (quality={quality})")
     
@@ -88,13 +110,17 @@ class JPEGEncoder(BaseEncoder):
     def format_type(self) -> str:
         return "jpeg"
     
-    def encode(self, image: Image.Image) -> bytes:
+    def encode(self, image: FrameInput) -> bytes:
         if self._use_cv2:
             # CV2 encoding is 2-3x faster than PIL
-            img_array = np.array(image)
-            # Convert RGB to BGR for cv2
-            if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-                img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+            # [ZERO-COPY] mss BGRA / DXcam BGR views go straight to imencode (it drops
+            # alpha row by row); only RGB input (PIL, synthetic) pays one conversion
+            frame = as_pixel_frame(image)
+            # [PARALLEL] 4K: slices on all cores, stitched into one JPEG
+            data = encode_jpeg_sliced(frame, self.quality, self.slices)
+            if data is not None:
+                return data
+            img_array = frame.to_bgr()
             # Encode with quality parameter
             encode_param = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
             _, encoded = cv2.imencode('.jpg', img_array, encode_param)
@@ -102,19 +128,45 @@ class JPEGEncoder(BaseEncoder):
         else:
             # PIL fallback
             buf = io.BytesIO()
-            image.save(buf, format='JPEG', quality=self.quality)
+            to_pil_image(image).save(buf, format='JPEG', quality=self.quality)
             return buf.getvalue()
 
 
 class FFmpegEncoder(BaseEncoder):
-    """FFmpeg H.264 software encoder (~10-20ms per frame)."""
+    """FFmpeg H.264 software encoder (~10-20ms per frame).
+
+    One long-lived libx264 process per stream: raw frames go in on stdin, and a
+    reader thread turns stdout into one AccessUnit per frame (see h264_stream.py).
+    encode() is synchronous: zerolatency has no lookahead and no B-frames, so the
+    unit for a frame is ready as soon as x264 has encoded it.
+    """
     
-    def __init__(self, width: int = 1920, height: int = 1080, fps: int = 30):
+    # Raw input formats FFmpeg reads directly (no conversion in Python)
+    PIX_FMTS = {"BGRA": "bgra", "BGR": "bgr24", "RGB": "rgb24"}
+    # Periodic IDR interval in frames; viewers joining in between ask for a keyframe
+    KEYFRAME_INTERVAL = 300
+    # Keyframe requests are coalesced: at most one forced IDR per interval (seconds)
+    KEYFRAME_MIN_INTERVAL = 1.0
+    ENCODE_TIMEOUT = 5.0
+    
+    def __init__(self, width: int = 1920, height: int = 1080, fps: int = 30, crf: int = 23):
         self.width = width
         self.height = height
         self.fps = fps
+        self.crf = crf
+        self.pixel_format = "RGB"
         self.process: Optional[subprocess.Popen] = None
-        self._frame_buffer = []
+        self._units: "queue.Queue" = queue.Queue()
+        self._reader: Optional[threading.Thread] = None
+        self._next_index = 0
+        self._lock = threading.Lock()  # Capture threads and lazy encodes share the process
+        self._keyframe_requested = False
+        self._last_forced_keyframe = 0.0
+        self._jpeg_fallback: Optional[JPEGEncoder] = None
+        self.frames = 0
+        self.keyframes = 0
+        self.bytes = 0
+        self.restarts = 0
         print(f"🎬 Using FFmpeg H.264 encoder ({width}x{height} @ {fps}fps)")
     
     @property
@@ -125,54 +177,104 @@ class FFmpegEncoder(BaseEncoder):
     def format_type(self) -> str:
         return "h264"
     
-    def _ensure_process(self, width: int, height: int):
-        """Start or restart FFmpeg process if dimensions changed."""
-        if self.process and (self.width != width or self.height != height):
+    def _ensure_process(self, width: int, height: int, pixel_format: str):
+        """Start or restart FFmpeg process if dimensions or input pixel format changed."""
+        if self.process and (self.width != width or self.height != height or self.pixel_format != pixel_format):
             self.cleanup()
         
         if self.process is None:
             self.width = width
             self.height = height
-            # Use ultrafast preset for lowest latency
+            self.pixel_format = pixel_format
+            # Use ultrafast preset for lowest latency. Baseline 4:2:0 decodes in every
+            # browser (BGRA input would otherwise give 4:4:4); yuv420p needs even sizes.
             self.process = subprocess.Popen([
-                'ffmpeg', '-y',
+                'ffmpeg', '-loglevel', 'error',
                 '-f', 'rawvideo',
-                '-pix_fmt', 'rgb24',
+                '-pix_fmt', self.PIX_FMTS[pixel_format],
                 '-s', f'{width}x{height}',
                 '-r', str(self.fps),
                 '-i', '-',
+                '-vf', 'crop=trunc(iw/2)*2:trunc(ih/2)*2',
                 '-c:v', 'libx264',
                 '-preset', 'ultrafast',
                 '-tune', 'zerolatency',
-                '-f', 'h264',
+                '-profile:v', 'baseline',
+                '-pix_fmt', 'yuv420p',
+                '-crf', str(self.crf),
+                '-g', str(self.KEYFRAME_INTERVAL),
+                # FLV tags carry their size: each frame is complete as soon as it is written
+                '-flush_packets', '1',
+                '-f', 'flv',
                 '-'
             ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self._units = queue.Queue()
+            self._reader = threading.Thread(target=self._read_units, args=(self.process, self._units),
+                                            name="ffmpeg-h264-reader", daemon=True)
+            self._reader.start()
     
-    def encode(self, image: Image.Image) -> bytes:
-        width, height = image.size
-        self._ensure_process(width, height)
-        
-        # Convert to RGB bytes
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        raw_data = image.tobytes()
-        
+    def _read_units(self, process: subprocess.Popen, units: "queue.Queue"):
+        """Reader thread: FFmpeg stdout -> access units, None at EOF."""
         try:
-            self.process.stdin.write(raw_data)
-            self.process.stdin.flush()
-            # Read available output (non-blocking would be better)
-            # For now, return JPEG as fallback since FFmpeg streaming is complex
-            # TODO: Implement proper frame buffer reading
-            return self._fallback_jpeg(image)
+            for unit in FlvAccessUnitReader(process.stdout, first_index=self._next_index):
+                units.put(unit)
         except Exception as e:
-            print(f"[FFmpeg] Encode error: {e}")
-            return self._fallback_jpeg(image)
+            print(f"[FFmpeg] Stream parse error: {e}")
+        units.put(None)
     
-    def _fallback_jpeg(self, image: Image.Image) -> bytes:
-        """Fallback to JPEG if FFmpeg fails."""
-        buf = io.BytesIO()
-        image.save(buf, format='JPEG', quality=85)
-        return buf.getvalue()
+    def request_keyframe(self):
+        """Make the next frame an IDR (a viewer joined)."""
+        self._keyframe_requested = True
+    
+    def encode(self, image: FrameInput) -> bytes:
+        frame = as_pixel_frame(image)
+        width, height = frame.size
+        
+        # [ZERO-COPY] Pipe the capture buffer as-is; only strided crops (DXcam) are packed
+        raw_data = np.ascontiguousarray(frame.array).data
+        
+        with self._lock:
+            now = time.time()
+            if (self._keyframe_requested and self.process is not None
+                    and now - self._last_forced_keyframe >= self.KEYFRAME_MIN_INTERVAL):
+                # The libx264 pipe cannot be told to emit an IDR: a fresh process starts with one
+                self._keyframe_requested = False
+                self._last_forced_keyframe = now
+                self.restarts += 1
+                self.cleanup()
+            try:
+                self._ensure_process(width, height, frame.pixel_format)
+                self.process.stdin.write(raw_data)
+                self.process.stdin.flush()
+                unit = self._units.get(timeout=self.ENCODE_TIMEOUT)
+                if unit is None:
+                    raise RuntimeError("FFmpeg exited")
+            except Exception as e:
+                print(f"[FFmpeg] Encode error: {e}")
+                # Restart on the next frame: a late unit must not be paired with the wrong frame
+                self.cleanup()
+                return self._fallback_jpeg(image)
+            self._next_index = unit.index + 1
+            self.frames += 1
+            self.keyframes += unit.keyframe
+            self.bytes += len(unit)
+            if unit.keyframe:
+                self._keyframe_requested = False
+            return unit
+    
+    def _fallback_jpeg(self, image: FrameInput) -> bytes:
+        """JPEG for a frame FFmpeg failed on (EncoderManager reports it as 'jpeg')."""
+        if self._jpeg_fallback is None:
+            self._jpeg_fallback = JPEGEncoder(quality=85)
+        return self._jpeg_fallback.encode(image)
+    
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "restarts": self.restarts,
+            "avg_bytes": int(self.bytes / self.frames) if self.frames else 0,
+        }
     
     def cleanup(self):
         if self.process:
@@ -185,6 +287,110 @@ class FFmpegEncoder(BaseEncoder):
             self.process = None
 
 
+class AVEncoder(BaseEncoder):
+    """In-process H.264 via PyAV (libx264, the library aiortc already ships).
+
+    No subprocess and no pipe: the capture buffer goes straight into
+    VideoFrame.from_ndarray (BGRA/BGR/RGB, strided views included) and each
+    encode() returns one AccessUnit.
+    """
+    
+    # PixelFrame format -> PyAV ndarray format
+    AV_FORMATS = {"BGRA": "bgra", "BGR": "bgr24", "RGB": "rgb24"}
+    KEYFRAME_INTERVAL = FFmpegEncoder.KEYFRAME_INTERVAL
+    KEYFRAME_MIN_INTERVAL = FFmpegEncoder.KEYFRAME_MIN_INTERVAL
+    
+    def __init__(self, fps: int = 30, crf: int = 23, codec_name: str = "libx264"):
+        self.fps = fps
+        self.crf = crf
+        self.codec_name = codec_name
+        self.context = None
+        self.width = 0
+        self.height = 0
+        self._next_index = 0
+        self._codec: Optional[str] = None  # From the last keyframe's SPS
+        self._lock = threading.Lock()  # Capture threads and lazy encodes share the context
+        self._keyframe_requested = False
+        self._last_forced_keyframe = 0.0
+        self.frames = 0
+        self.keyframes = 0
+        self.forced_keyframes = 0
+        self.bytes = 0
+        print(f"🎬 Using PyAV H.264 encoder ({codec_name} @ {fps}fps, in-process)")
+    
+    @property
+    def name(self) -> str:
+        return "PyAV H.264"
+    
+    @property
+    def format_type(self) -> str:
+        return "h264"
+    
+    def _ensure_context(self, width: int, height: int):
+        """(Re)create the codec context when the frame size changes; it starts with an IDR."""
+        if self.context is not None and (self.width, self.height) == (width, height):
+            return
+        context = av.CodecContext.create(self.codec_name, "w")
+        context.width = width
+        context.height = height
+        context.pix_fmt = "yuv420p"  # Baseline 4:2:0 decodes in every browser
+        context.time_base = Fraction(1, self.fps)
+        context.framerate = Fraction(self.fps, 1)
+        context.gop_size = self.KEYFRAME_INTERVAL
+        context.options = {
+            "preset": "ultrafast",
+            "tune": "zerolatency",  # No lookahead, no B-frames: one packet out per frame in
+            "profile": "baseline",
+            "crf": str(self.crf),
+            "forced-idr": "1",  # A forced I-frame must be an IDR for a joining decoder
+        }
+        self.context = context
+        self.width, self.height = width, height
+    
+    def request_keyframe(self):
+        """Make the next frame an IDR (a viewer joined)."""
+        self._keyframe_requested = True
+    
+    def encode(self, image: FrameInput) -> bytes:
+        frame = as_pixel_frame(image)
+        # yuv420p needs even sizes: drop the last odd row/column (a view, no copy)
+        width, height = frame.width & ~1, frame.height & ~1
+        
+        with self._lock:
+            self._ensure_context(width, height)
+            # [ZERO-COPY] Capture buffer view -> VideoFrame; PyAV converts to yuv420p
+            video_frame = av.VideoFrame.from_ndarray(frame.array[:height, :width],
+                                                     format=self.AV_FORMATS[frame.pixel_format])
+            video_frame.pts = self._next_index
+            now = time.time()
+            if self._keyframe_requested and now - self._last_forced_keyframe >= self.KEYFRAME_MIN_INTERVAL:
+                video_frame.pict_type = av.video.frame.PictureType.I
+                self._keyframe_requested = False
+                self._last_forced_keyframe = now
+                self.forced_keyframes += 1
+            data = b"".join(bytes(packet) for packet in self.context.encode(video_frame))
+            unit = AccessUnit.from_annexb(data, self._next_index, self._codec)
+            self._next_index += 1
+            self._codec = unit.codec
+            self.frames += 1
+            self.keyframes += unit.keyframe
+            self.bytes += len(unit)
+            if unit.keyframe:
+                self._keyframe_requested = False
+            return unit
+    
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "forced_keyframes": self.forced_keyframes,
+            "avg_bytes": int(self.bytes / self.frames) if self.frames else 0,
+        }
+    
+    def cleanup(self):
+        self.context = None
+
+
 class NVENCEncoder(BaseEncoder):
     """NVIDIA NVENC hardware encoder (~1-2ms per frame).
     Note: Currently falls back to JPEG as H.264 streaming requires frame buffer management.
@@ -205,7 +411,7 @@ class NVENCEncoder(BaseEncoder):
     def format_type(self) -> str:
         return "jpeg"  # Currently falls back to JPEG
     
-    def encode(self, image: Image.Image) -> bytes:
+    def encode(self, image: FrameInput) -> bytes:
         # For now, use JPEG as H.264 streaming is complex
         # TODO: Implement proper NVENC streaming with frame buffer
         return self._jpeg_fallback.encode(image)
@@ -217,13 +423,28 @@ class NVENCEncoder(BaseEncoder):
 class EncoderManager:
     """Manages encoder selection and lifecycle."""
     
-    def __init__(self):
-        self.encoder = self._detect_best_encoder()
+    def __init__(self, encoder: Optional[BaseEncoder] = None):
+        self.encoder = encoder or self._detect_best_encoder()
         print(f"📦 EncoderManager initialized with: {self.encoder.name}")
     
+    def for_target(self, key) -> "EncoderManager":
+        """A new instance of the selected encoder for one capture target (capture_hub.PerChannelEncoder).
+        
+        H.264 encoders carry the GOP between frames: frames of two targets through
+        one instance would reference each other's pictures.
+        """
+        print(f"[ENCODER] {self.encoder.name} instance for {key}")
+        return EncoderManager(type(self.encoder)())
+    
     def _detect_best_encoder(self) -> BaseEncoder:
         """Auto-detect and return best available encoder."""
-        # Priority: NVENC > FFmpeg > JPEG
+        # Priority: PyAV > NVENC > FFmpeg > JPEG
+        if AV_AVAILABLE:
+            try:
+                return AVEncoder()
+            except Exception as e:
+                print(f"⚠️ PyAV encoder unavailable: {e}")
+        
         if NVIDIA_AVAILABLE and FFMPEG_AVAILABLE:
             try:
                 # Test if NVENC works
@@ -249,11 +470,23 @@ class EncoderManager:
     def format_type(self) -> str:
         return self.encoder.format_type
     
-    def encode(self, image: Image.Image) -> Tuple[bytes, str]:
+    def encode(self, image: FrameInput) -> Tuple[bytes, str]:
         """Encode image and return (data, format_type)."""
         data = self.encoder.encode(image)
+        if self.encoder.format_type == "h264" and not isinstance(data, AccessUnit):
+            return data, "jpeg"  # Encoder fell back to JPEG for this frame
         return data, self.encoder.format_type
     
+    def request_keyframe(self):
+        """Ask a streaming encoder for an IDR on its next frame (no-op for JPEG)."""
+        request = getattr(self.encoder, "request_keyframe", None)
+        if request is not None:
+            request()
+    
+    def stats(self) -> dict:
+        stats = getattr(self.encoder, "stats", None)
+        return {"name": self.encoder.name, "format": self.encoder.format_type, **(stats() if stats else {})}
+    
     def cleanup(self):
         self.encoder.cleanup()
 
@@ -0,0 +1,91 @@
+# Ghost Shell Frame Change Detection
+# Python counterpart of the Go edition's "Smart Frame Skipping": a fast digest of
+# the raw pixel buffer, taken before encoding. Identical frames (idle IDE, static
+# terminal) are dropped by the capture hub, so nothing is encoded or sent.
+#
+# The digest covers every byte - a sampled hash would miss a single typed
+# character or the caret. The digest is also the identity of a tile in the client
+# tile cache (tile_stream.py), so it must not collide: xxHash (XXH3, 64 bit) when
+# installed, 128-bit BLAKE2b otherwise. The frame shape is hashed with the pixels.
+#
+# comparable_rows() gives word-sized row views for pixel-exact comparisons
+# (dirty tiles in tile_stream.py, shifted frames in motion_detect.py).
+
+import hashlib
+from typing import Any, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+    xxhash = None
+
+DIGEST_ALGORITHM = "xxh3_64" if XXHASH_AVAILABLE else "blake2b_128"
+
+
+def _pixel_buffer(image: Any):
+    """numpy array (PixelFrame.array, raw cv2/DXcam array) or bytes (PIL Image)."""
+    array = getattr(image, "array", None)
+    if array is not None:
+        return array
+    if NUMPY_AVAILABLE and isinstance(image, np.ndarray):
+        return image
+    return image.tobytes()
+
+
+def frame_digest(image: Any) -> Optional[int]:
+    """Digest of a frame's pixels (plus its shape). None if the frame cannot be hashed."""
+    try:
+        buf = _pixel_buffer(image)
+    except Exception:
+        return None
+    if isinstance(buf, bytes):
+        shape = (len(buf),)
+        chunks = (buf,)
+    elif buf.flags["C_CONTIGUOUS"]:
+        shape = buf.shape
+        chunks = (buf.data,)
+    else:
+        # Strided crop (e.g. DXcam window region): hash row by row instead of copying
+        shape = buf.shape
+        chunks = (np.ascontiguousarray(row).data for row in buf)
+
+    hasher = xxhash.xxh3_64() if XXHASH_AVAILABLE else hashlib.blake2b(digest_size=16)
+    # Same bytes at a different size (window resize) are a different frame
+    hasher.update(repr(shape).encode())
+    for chunk in chunks:
+        hasher.update(chunk)
+    return int.from_bytes(hasher.digest(), "little")
+
+
+def _row_view(array, group: int):
+    """(h, w*c) view of a frame, as uint64 words when row and group lengths allow (8x fewer compares)."""
+    rows = array.reshape(array.shape[0], -1)
+    if rows.shape[1] % 8 == 0 and (group * array.shape[2]) % 8 == 0:
+        try:
+            return rows.view(np.uint64), 8
+        except ValueError:
+            pass  # Strided view that numpy cannot reinterpret
+    return rows, 1
+
+
+def comparable_rows(a, b, group: int = 1):
+    """Row views of two same-shape frames for element-wise comparison.
+
+    Returns (a_rows, b_rows, bytes_per_element). Every `group` pixels of a row map
+    to group * channels / bytes_per_element elements, so column groups (tiles)
+    can still be reduced with reduceat.
+    """
+    a_rows, word = _row_view(a, group)
+    b_rows, b_word = _row_view(b, group)
+    if word != b_word:
+        return a.reshape(a.shape[0], -1), b.reshape(b.shape[0], -1), 1
+    return a_rows, b_rows, word
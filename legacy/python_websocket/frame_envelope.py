@@ -0,0 +1,99 @@
+# Ghost Shell Frame Envelope (v2)
+# One binary WebSocket message per frame instead of a JSON meta message plus a
+# bytes message. Per-frame facts live in a fixed little-endian header; the slowly
+# changing meta (window title, lock state, encoder, codec, ABR level) is attached
+# as JSON only on frames where it changed.
+#
+#   offset  type   field
+#   0       4s     magic 'GSFR'
+#   4       u8     version (2)
+#   5       u8     format (FORMAT_*)
+#   6       u16    flags (FLAG_*)
+#   8       u32    seq (capture sequence; the client acks it)
+#   12      f64    captured_at (ms since the epoch, server clock)
+#   20      f64    sent_at (ms since the epoch, server clock)
+#   28      u16    width  (source size; 0 for audio)
+#   30      u16    height
+#   32      u32    meta length (0 unless FLAG_META)
+#   36      f64    encoded_at (ms since the epoch, server clock; v2)
+#   44      ...    meta JSON (UTF-8), then the payload to the end of the message
+#
+# captured_at -> encoded_at -> sent_at are the server side of the frame's
+# glass-to-glass latency; the client acks with its receive/decode/draw times
+# (frame_latency.py).
+#
+# The payload is whatever the format defines: a JPEG, a GTIL tile batch
+# (tile_stream.py), an Annex-B access unit (h264_stream.py) or a PCM chunk - so
+# all media can share this framing and its timestamps.
+
+import json
+import struct
+import time
+from typing import Optional
+
+ENVELOPE_MAGIC = b"GSFR"
+ENVELOPE_VERSION = 2
+_HEADER = struct.Struct("<4sBBHIddHHId")
+HEADER_SIZE = _HEADER.size  # 44
+
+FORMAT_JPEG = 1
+FORMAT_TILES = 2
+FORMAT_H264 = 3
+FORMAT_AUDIO_PCM = 4
+FORMAT_CODES = {"jpeg": FORMAT_JPEG, "tiles": FORMAT_TILES, "h264": FORMAT_H264, "pcm": FORMAT_AUDIO_PCM}
+FORMAT_NAMES = {code: name for name, code in FORMAT_CODES.items()}
+
+FLAG_META = 0x0001      # Meta JSON follows the header
+FLAG_KEYFRAME = 0x0002  # H.264 IDR: a decoder can start here
+
+
+def pack_envelope(format_name: str, payload: bytes, seq: int, captured_at: float, width: int = 0,
+                  height: int = 0, keyframe: bool = False, meta: Optional[dict] = None,
+                  sent_at: Optional[float] = None, encoded_at: Optional[float] = None) -> bytes:
+    """Header + optional meta + payload as one message (times in seconds since the epoch;
+    encoded_at defaults to sent_at)."""
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8") if meta else b""
+    flags = (FLAG_META if meta_bytes else 0) | (FLAG_KEYFRAME if keyframe else 0)
+    sent_at = time.time() if sent_at is None else sent_at
+    encoded_at = sent_at if encoded_at is None else encoded_at
+    header = _HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, FORMAT_CODES[format_name], flags,
+                          seq & 0xFFFFFFFF, captured_at * 1000, sent_at * 1000, width, height, len(meta_bytes),
+                          encoded_at * 1000)
+    return b"".join((header, meta_bytes, payload))
+
+
+def unpack_envelope(message: bytes) -> dict:
+    """Inverse of pack_envelope (for tools and checks); payload is a memoryview."""
+    magic, version, format_code, flags, seq, captured_ms, sent_ms, width, height, meta_length, encoded_ms = \
+        _HEADER.unpack_from(message)
+    if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION:
+        raise ValueError(f"Not a v{ENVELOPE_VERSION} frame envelope")
+    meta_end = HEADER_SIZE + meta_length
+    return {
+        "format": FORMAT_NAMES.get(format_code, format_code),
+        "keyframe": bool(flags & FLAG_KEYFRAME),
+        "seq": seq,
+        "captured_at": captured_ms / 1000,
+        "encoded_at": encoded_ms / 1000,
+        "sent_at": sent_ms / 1000,
+        "width": width,
+        "height": height,
+        "meta": json.loads(bytes(message[HEADER_SIZE:meta_end])) if flags & FLAG_META else None,
+        "payload": memoryview(message)[meta_end:],
+    }
+
+
+class MetaTracker:
+    """Remembers the meta a client has; returns a dict only when it changed."""
+
+    def __init__(self):
+        self._last: Optional[dict] = None
+
+    def changed(self, meta: dict) -> Optional[dict]:
+        if meta == self._last:
+            return None
+        self._last = dict(meta)
+        return meta
+
+    def reset(self):
+        self._last = None
@@ -0,0 +1,94 @@
+# Ghost Shell Frame Latency (glass-to-glass, per session)
+# Every frame carries its capture, encode-done and send times (server clock,
+# frame_envelope.py). The client acks each frame it drew with its own times:
+# received, render started (after earlier frames finished), decoded, drawn.
+#
+# The two clocks are not synchronized, so client times are only used as
+# differences. The one-way network time comes from the round trip, NTP style:
+#
+#   t0 = sent_at (server)      t1 = received (client)
+#   t2 = drawn   (client, the ack goes out right after)   t3 = ack arrival (server)
+#   network = ((t3 - t0) - (t2 - t1)) / 2
+#
+#   glass_to_glass = (sent_at - captured_at) + network + (drawn - received)
+#
+# which splits into encode (capture -> encode done), send_queue (encode done ->
+# send), network, client_queue (received -> render started), decode and draw.
+# The estimate assumes a symmetric link; the clock offset it implies is reported
+# as clock_offset_ms for sanity checks.
+
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from latency_stats import LatencyStats
+from metrics import get_metrics
+
+MAX_PENDING = 64  # Sent, unacked frames remembered per session
+STAGES = ("encode", "send_queue", "network", "client_queue", "decode", "draw", "glass_to_glass")
+
+
+class FrameLatencyTracker:
+    """Rolling per-stage latency of one /stream session from frame timestamps and client acks."""
+
+    def __init__(self):
+        self._pending: "OrderedDict[int, tuple]" = OrderedDict()  # seq -> (captured_at, encoded_at, sent_at)
+        metrics = get_metrics()
+        # Only the end-to-end figures go to /metrics; the full split is in /status per session
+        histograms = {
+            "network": metrics.histogram("network_seconds", "Estimated one-way network time of a frame"),
+            "decode": metrics.histogram("client_decode_seconds", "Client decode time of a frame"),
+            "glass_to_glass": metrics.histogram("glass_to_glass_seconds",
+                                                "Capture to drawn on the client (estimated)"),
+        }
+        self.stages = {stage: LatencyStats(histogram=histograms.get(stage)) for stage in STAGES}
+        self.clock_offset: Optional[float] = None  # Client clock minus server clock (seconds, latest)
+        self.acks = 0
+        self.invalid_acks = 0
+
+    def on_sent(self, seq: int, captured_at: float, encoded_at: float, sent_at: float):
+        """A frame went out (epoch seconds, server clock)."""
+        self._pending[seq] = (captured_at, encoded_at, sent_at)
+        while len(self._pending) > MAX_PENDING:
+            self._pending.popitem(last=False)
+
+    def on_ack(self, seq: int, received: float, started: float, decoded: float, drawn: float,
+               now: Optional[float] = None) -> Optional[dict]:
+        """The client drew frame seq (its times in epoch seconds, client clock). Returns the sample."""
+        now = time.time() if now is None else now
+        if seq not in self._pending:
+            return None
+        # Acks arrive in send order; anything older was skipped by the client
+        while self._pending:
+            pending_seq, sent = self._pending.popitem(last=False)
+            if pending_seq == seq:
+                break
+        captured_at, encoded_at, sent_at = sent
+        client_hold = drawn - received
+        if not received <= started <= decoded <= drawn or client_hold > now - sent_at:
+            self.invalid_acks += 1  # Reordered or clamped client clock: skip the sample
+            return None
+        network = max(0.0, ((now - sent_at) - client_hold) / 2)
+        sample = {
+            "encode": encoded_at - captured_at,
+            "send_queue": sent_at - encoded_at,
+            "network": network,
+            "client_queue": started - received,
+            "decode": decoded - started,
+            "draw": drawn - decoded,
+            "glass_to_glass": (sent_at - captured_at) + network + client_hold,
+        }
+        for stage, seconds in sample.items():
+            self.stages[stage].add(seconds)
+        self.clock_offset = received - (sent_at + network)
+        self.acks += 1
+        return sample
+
+    def stats(self) -> dict:
+        return {
+            "acks": self.acks,
+            "invalid_acks": self.invalid_acks,
+            "unacked": len(self._pending),
+            "clock_offset_ms": round(self.clock_offset * 1000, 1) if self.clock_offset is not None else None,
+            **{stage: self.stages[stage].stats() for stage in STAGES},
+        }
@@ -0,0 +1,291 @@
+# Ghost Shell Frame Sources
+# Pluggable capture backends behind one interface + a registry.
+#
+# Desktop backends (dxcam, mss, imagegrab, wgc, one per background capture method)
+# are registered by ghost_server.py, which owns the Windows capture code; the
+# window-capture ones feed the locked-window scoreboard. The synthetic and replay
+# backends below have no platform dependencies, so the capture -> encode -> send
+# pipeline can be profiled and regression-tested headless with deterministic input.
+
+import os
+import struct
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Type, Union
+
+from PIL import Image
+
+from pixel_frame import PixelFrame, as_pixel_frame, to_pil_image, NUMPY_AVAILABLE, np
+
+
+class FrameSource(ABC):
+    """Base class for all frame sources.
+
+    grab() receives the capture target as hints; backends use what they need
+    (rect for screen grabbers, hwnd/window_name for window grabbers) and
+    generated sources ignore it.
+
+    Backends that own a pixel buffer return a PixelFrame view over it; the
+    GDI/WGC window backends return PIL Images. Encoders accept both.
+    """
+
+    name = "base"
+    # Constructor option filled from the part after ':' in a source spec
+    spec_option: Optional[str] = None
+    # Grabs a window by hwnd even when it is covered (locked-window capture methods)
+    window_capture = False
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return True
+
+    @abstractmethod
+    def grab(self, hwnd=None, rect=None, window_name=None) -> Optional[Union[PixelFrame, Image.Image]]:
+        """Return a PixelFrame or PIL Image, or None if capture failed."""
+        pass
+
+    def describe(self) -> str:
+        """Human-readable label, used as the window title for generated content."""
+        return self.name
+
+    def close(self):
+        """Optional cleanup method."""
+        pass
+
+
+# ==================== Registry ====================
+_FRAME_SOURCES: Dict[str, Type[FrameSource]] = {}
+_instances: Dict[str, FrameSource] = {}
+
+def register_frame_source(cls: Type[FrameSource]) -> Type[FrameSource]:
+    """Class decorator: make a backend available by its `name`."""
+    _FRAME_SOURCES[cls.name] = cls
+    return cls
+
+def available_frame_sources() -> List[str]:
+    """Names of registered backends that can run on this machine."""
+    return [name for name, cls in _FRAME_SOURCES.items() if cls.is_available()]
+
+def window_capture_sources() -> List[str]:
+    """Available backends that capture covered windows, in registration order."""
+    return [name for name, cls in _FRAME_SOURCES.items() if cls.window_capture and cls.is_available()]
+
+def create_frame_source(name: str, **options) -> FrameSource:
+    """Instantiate a registered backend. Raises ValueError if unknown or unavailable."""
+    cls = _FRAME_SOURCES.get(name)
+    if cls is None:
+        raise ValueError(f"Unknown frame source '{name}'. Registered: {sorted(_FRAME_SOURCES)}")
+    if not cls.is_available():
+        raise ValueError(f"Frame source '{name}' is not available on this machine")
+    return cls(**options)
+
+def create_frame_source_from_spec(spec: str) -> FrameSource:
+    """Create a source from 'name' or 'name:arg', e.g. 'synthetic:noise' or 'replay:session.gsrf'."""
+    name, _, arg = spec.partition(":")
+    cls = _FRAME_SOURCES.get(name)
+    options = {}
+    if arg and cls is not None and cls.spec_option:
+        options[cls.spec_option] = arg
+    return create_frame_source(name, **options)
+
+def get_frame_source(name: str) -> Optional[FrameSource]:
+    """Shared default-configured instance of a backend, or None if unavailable."""
+    if name not in _instances:
+        try:
+            _instances[name] = create_frame_source(name)
+        except ValueError:
+            return None
+    return _instances[name]
+
+
+# ==================== Synthetic Source ====================
+@register_frame_source
+class SyntheticSource(FrameSource):
+    """Deterministic generated desktop content.
+
+    Patterns:
+        scroll_text - IDE-like text lines scrolling up a few pixels per frame
+        noise       - video-like content: full-frame noise over a moving gradient
+        static_ui   - static panels with a blinking cursor (mostly unchanged frames)
+        typing      - editor where one character is typed per frame (a few dirty tiles)
+        tab_switch  - editor cycling through three open files with a blinking caret
+                      (repeated content, for the client tile cache)
+    """
+
+    name = "synthetic"
+    spec_option = "pattern"
+    PATTERNS = ("scroll_text", "noise", "static_ui", "typing", "tab_switch")
+    TAB_FRAMES = 10  # Frames per tab in tab_switch
+
+    def __init__(self, pattern: str = "scroll_text", width: int = 1920, height: int = 1080,
+                 seed: int = 0, scroll_step: int = 4):
+        if pattern not in self.PATTERNS:
+            raise ValueError(f"Unknown synthetic pattern '{pattern}'. Use one of {self.PATTERNS}")
+        self.pattern = pattern
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.scroll_step = scroll_step
+        self.frame_index = 0
+        self._rng = np.random.default_rng(seed)
+        self._page = None
+        if pattern in ("scroll_text", "static_ui", "typing"):
+            # Render 3 screens of content once; frames are views into it
+            self._page = self._render_page(height * 3 if pattern == "scroll_text" else height)
+        self._tabs = [self._render_page(height) for _ in range(3)] if pattern == "tab_switch" else None
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return NUMPY_AVAILABLE
+
+    def describe(self) -> str:
+        return f"synthetic:{self.pattern}"
+
+    def _render_page(self, page_height: int):
+        """Dark editor background with light 'text' runs on a 20px line grid."""
+        page = np.full((page_height, self.width, 3), (30, 30, 30), dtype=np.uint8)
+        line_height, glyph_height, margin = 20, 12, 60
+        for row, top in enumerate(range(4, page_height - line_height, line_height)):
+            indent = margin + int(self._rng.integers(0, 6)) * 16
+            run_end = indent + int(self._rng.integers(80, max(81, self.width - indent - margin)))
+            color = (200, 200, 200) if row % 7 else (86, 156, 214)
+            glyphs = self._rng.random((glyph_height, run_end - indent)) > 0.45
+            page[top:top + glyph_height, indent:run_end][glyphs] = color
+            # Line-number gutter
+            page[top:top + glyph_height, 8:8 + 24][self._rng.random((glyph_height, 24)) > 0.6] = (110, 110, 110)
+        if self.pattern in ("static_ui", "typing", "tab_switch"):
+            page[:, :240] = (37, 37, 38)         # Side bar
+            page[:32, :] = (50, 50, 52)          # Tab strip
+            page[-24:, :] = (0, 122, 204)        # Status bar
+        return page
+
+    def _next_array(self):
+        i = self.frame_index
+        if self.pattern == "scroll_text":
+            page_height = self._page.shape[0]
+            offset = (i * self.scroll_step) % (page_height - self.height)
+            return self._page[offset:offset + self.height]
+        if self.pattern == "static_ui":
+            frame = self._page.copy()
+            if (i // 15) % 2 == 0:
+                frame[300:318, 400:402] = (220, 220, 220)  # Cursor blinks every 15 frames
+            return frame
+        if self.pattern == "typing":
+            # Type one 8x12 glyph into the page, wrapping inside the editor area
+            per_line = (self.width - 300) // 8
+            line, col = divmod(i, per_line)
+            top = 40 + (line * 20) % max(20, self.height - 80)
+            left = 280 + col * 8
+            glyph = self._rng.random((12, 7)) > 0.5
+            self._page[top:top + 12, left:left + 8] = (30, 30, 30)
+            self._page[top:top + 12, left:left + 7][glyph] = (212, 212, 212)
+            # Copy: consumers may still hold the previous frame
+            return self._page.copy()
+        if self.pattern == "tab_switch":
+            # Tabs 0, 1, 0, 2, ...: going back to a tab shows exactly what it showed before
+            frame = self._tabs[(0, 1, 0, 2)[(i // self.TAB_FRAMES) % 4]].copy()
+            if (i // 15) % 2 == 0:
+                frame[300:318, 400:402] = (220, 220, 220)
+            return frame
+        # noise: moving gradient + fresh per-frame noise (incompressible, like video)
+        x = (np.arange(self.width, dtype=np.uint16) + i * 8) % 256
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        frame[:] = x.astype(np.uint8)[None, :, None]
+        rng = np.random.default_rng(self.seed + i)
+        frame ^= rng.integers(0, 64, size=frame.shape, dtype=np.uint8)
+        return frame
+
+    def grab(self, hwnd=None, rect=None, window_name=None) -> Optional[PixelFrame]:
+        arr = self._next_array()
+        self.frame_index += 1
+        # scroll_text frames are views into the pre-rendered page (never written to)
+        return PixelFrame(arr, "RGB")
+
+
+# ==================== Raw Frame Recording / Replay ====================
+# File layout (little endian):
+#   header: magic 'GSRF', version u16, pixel format 4s ('RGB '), width u16, height u16, fps f32
+#   frames: capture timestamp f64 + width*height*3 bytes, repeated
+RAW_FRAME_MAGIC = b"GSRF"
+RAW_FRAME_VERSION = 1
+_HEADER = struct.Struct("<4sH4sHHf")
+_TIMESTAMP = struct.Struct("<d")
+
+
+class RawFrameRecorder:
+    """Write frames from any source to a raw replay file."""
+
+    def __init__(self, path: str, width: int, height: int, fps: float = 30.0):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.frames = 0
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(RAW_FRAME_MAGIC, RAW_FRAME_VERSION, b"RGB ", width, height, fps))
+
+    def write(self, image: Union[PixelFrame, Image.Image], timestamp: Optional[float] = None):
+        if image.size != (self.width, self.height):
+            image = to_pil_image(image).resize((self.width, self.height))
+        pixels = as_pixel_frame(image).to_rgb()
+        self._file.write(_TIMESTAMP.pack(time.time() if timestamp is None else timestamp))
+        self._file.write(pixels.data)
+        self.frames += 1
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@register_frame_source
+class ReplaySource(FrameSource):
+    """Replay a raw frame file written by RawFrameRecorder (memory-mapped, no decode)."""
+
+    name = "replay"
+    spec_option = "path"
+
+    def __init__(self, path: str, loop: bool = True):
+        if not os.path.exists(path):
+            raise ValueError(f"Replay file not found: {path}")
+        with open(path, "rb") as f:
+            magic, version, pixel_format, width, height, fps = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != RAW_FRAME_MAGIC or version != RAW_FRAME_VERSION:
+            raise ValueError(f"Not a Ghost Shell raw frame file (v{RAW_FRAME_VERSION}): {path}")
+        self.path = path
+        self.loop = loop
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pixel_format = pixel_format.decode().strip()
+        self.frame_index = 0
+        record_dtype = np.dtype([("timestamp", "<f8"), ("pixels", np.uint8, (height, width, 3))])
+        self._records = np.memmap(path, dtype=record_dtype, mode="r", offset=_HEADER.size)
+        self.frame_count = len(self._records)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return NUMPY_AVAILABLE
+
+    def describe(self) -> str:
+        return f"replay:{os.path.basename(self.path)}"
+
+    def grab(self, hwnd=None, rect=None, window_name=None) -> Optional[PixelFrame]:
+        if self.frame_count == 0:
+            return None
+        if self.frame_index >= self.frame_count:
+            if not self.loop:
+                return None
+            self.frame_index = 0
+        pixels = self._records[self.frame_index]["pixels"]
+        self.frame_index += 1
+        # Read-only view into the memory map: no decode, no copy
+        return PixelFrame(np.asarray(pixels), "RGB")
+
+    def close(self):
+        self._records = None
@@ -15,8 +15,8 @@ except:
     except:
         pass
 
-from fastapi import FastAPI, HTTPException, WebSocket
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import pyautogui
@@ -132,8 +132,18 @@ def stop_dxcam():
 
 app = FastAPI(title="Ghost Shell Server v2.2")
 
+# [METRICS] Process-wide registry: /metrics (Prometheus) and the "metrics" block of /status
+from metrics import get_metrics
+metrics = get_metrics()
+
+# Event-loop lag: capture, encode and input must never block the loop
+from loop_monitor import EventLoopLagMonitor
+loop_lag_monitor = EventLoopLagMonitor(histogram=metrics.histogram(
+    "event_loop_lag_seconds", "Event loop wake-up delay of a periodic sleep"))
+
 @app.on_event("startup")
 async def startup_event():
+    loop_lag_monitor.start()
     # Auto-start DXcam if available
     start_dxcam()
     # Start audio capture
@@ -142,7 +152,9 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    loop_lag_monitor.stop()
     stop_dxcam()
+    shutdown_encode_pool()
     if audio_capture:
         audio_capture.stop()
 
@@ -178,6 +190,8 @@ ACTIVATE_WINDOW = False  # Don't steal focus during capture
 
 # Locked window title (None = auto-detect by keywords)
 LOCKED_WINDOW_TITLE = None
+# hwnd the lock resolved to: followed every tick instead of re-matching the title
+LOCKED_HWND = None
 MANUAL_LOCK_ACTIVE = False  # True = Hard Lock (User selected dropdown/button), False = Soft Lock (Auto-click)
 # 当前正在显示的窗口标题（用于点击时定位）
 CURRENT_DISPLAY_WINDOW = None
@@ -201,32 +215,38 @@ class InteractionRequest(BaseModel):
     text: str = ""
     key: str = ""
     window_title: str = None  # Client-specified target window for robust locking
+    # Size of the frame x/y refer to, when the client shows a downscaled one (viewport.py)
+    frame_width: Optional[int] = None
+    frame_height: Optional[int] = None
+    source_width: Optional[int] = None  # Window size that frame was scaled from
+    source_height: Optional[int] = None
 
 class LockRequest(BaseModel):
     title: str
 
+# [WINDOW REGISTRY] Cached window table: lookups no longer enumerate the desktop
+from window_registry import get_window_registry, window_hwnd
+window_registry = get_window_registry()
+
 def get_all_windows():
     """Get all visible windows."""
-    all_windows = gw.getAllWindows()
-    return [w for w in all_windows if w.title and w.visible and w.width > 100]
+    return window_registry.list_windows()
 
 def get_foreground_window():
     """Get the currently active foreground window."""
     if not BACKGROUND_CAPTURE_AVAILABLE:
         return None
-    try:
-        hwnd = win32gui.GetForegroundWindow()
-        if hwnd:
-            title = win32gui.GetWindowText(hwnd)
-            if title:
-                # Find matching pygetwindow object
-                windows = gw.getWindowsWithTitle(title)
-                if windows:
-                    return windows[0]
-    except:
-        pass
+    win = window_registry.foreground()
+    if win is not None and win.title:
+        return win
     return None
 
+def pin_locked_window(title):
+    """Lock to title (None = unlock). The next get_target_window() pins the hwnd it resolves to."""
+    global LOCKED_WINDOW_TITLE, LOCKED_HWND
+    LOCKED_WINDOW_TITLE = title
+    LOCKED_HWND = None
+
 def get_foreground_hwnd_and_rect():
     """Get foreground window hwnd and rect directly (v2_simplified approach)."""
     if not BACKGROUND_CAPTURE_AVAILABLE:
@@ -250,7 +270,8 @@ def activate_window(win):
         hwnd = None
         
         # Get window handle
-        if BACKGROUND_CAPTURE_AVAILABLE:
+        hwnd = window_hwnd(win)
+        if not hwnd and BACKGROUND_CAPTURE_AVAILABLE:
             try:
                 hwnd = win32gui.FindWindow(None, win.title)
             except:
@@ -326,22 +347,144 @@ def activate_window(win):
         print(f"[ERROR] Failed to activate window: {e}")
         return False
 
+# ==================== Frame Source Backends ====================
+# The desktop capture paths are registered as FrameSource backends so they can be
+# selected by name (and swapped for synthetic/replay sources on headless machines).
+from frame_source import (FrameSource, register_frame_source, get_frame_source,
+                          create_frame_source_from_spec, available_frame_sources,
+                          window_capture_sources)
+from pixel_frame import PixelFrame, as_pixel_frame
+
+@register_frame_source
+class DXcamSource(FrameSource):
+    """DXcam desktop duplication (fastest, primary monitor only)."""
+    name = "dxcam"
+
+    @classmethod
+    def is_available(cls):
+        return DXCAM_AVAILABLE and CV2_AVAILABLE
+
+    def grab(self, hwnd=None, rect=None, window_name=None):
+        global dxcam_camera
+        left, top, right, bottom = rect
+        # Initialize camera if needed
+        if dxcam_camera is None:
+            dxcam_camera = dxcam.create(output_idx=0, output_color="BGR")
+        
+        # Check bounds (DXcam only captures one monitor)
+        cam_w, cam_h = dxcam_camera.width, dxcam_camera.height
+        if (left < 0 or top < 0 or right > cam_w or bottom > cam_h):
+            # Window is outside primary monitor or cross-monitor
+            raise ValueError("Window out of bounds for DXcam")
+
+        # DXcam captures full screen, we need to crop
+        # [STREAMING MODE] Use get_latest_frame if started (Zero latency)
+        if dxcam_camera.is_capturing:
+            frame = dxcam_camera.get_latest_frame()
+        else:
+            # [POLLING MODE] Fallback to grab (One-shot)
+            frame = dxcam_camera.grab()
+        
+        if frame is None:
+            # In streaming mode, this means no new frame yet (static screen)
+            # We should handle this gracefully, but for now fallback to ensure response
+            raise ValueError("DXcam frame is None (static or failed)")
+            
+        # Crop to window region (a strided view - DXcam returns a fresh array per call)
+        cropped = frame[top:bottom, left:right]
+        
+        if cropped.size == 0:
+            raise ValueError(f"Empty crop result: {cropped.shape}")
+
+        # [ZERO-COPY] Hand the BGR view to the encoder as-is (no RGB/PIL round-trip)
+        return PixelFrame(cropped, "BGR")
+
+@register_frame_source
+class MssSource(FrameSource):
+    """mss screen grab (fast, cross-platform, any monitor)."""
+    name = "mss"
+
+    @classmethod
+    def is_available(cls):
+        return MSS_AVAILABLE
+
+    def grab(self, hwnd=None, rect=None, window_name=None):
+        left, top, right, bottom = rect
+        monitor = {
+            "left": left,
+            "top": top,
+            "width": right - left,
+            "height": bottom - top
+        }
+        sct_img = mss_sct.grab(monitor)
+        # [ZERO-COPY] Wrap the BGRA buffer (sct_img.bgra would copy it, PIL would convert it)
+        return PixelFrame.from_mss(sct_img)
+
+@register_frame_source
+class ImageGrabSource(FrameSource):
+    """PIL.ImageGrab (legacy, slowest, always available on Windows)."""
+    name = "legacy"
+
+    def grab(self, hwnd=None, rect=None, window_name=None):
+        from PIL import ImageGrab
+        return ImageGrab.grab(bbox=rect, all_screens=True)
+
+@register_frame_source
+class WGCSource(FrameSource):
+    """Windows Graphics Capture (covered GPU-accelerated windows)."""
+    name = "wgc"
+    window_capture = True
+
+    @classmethod
+    def is_available(cls):
+        return WGC_CAPTURE_AVAILABLE
+
+    def grab(self, hwnd=None, rect=None, window_name=None):
+        return capture_window_wgc(hwnd=hwnd, window_name=window_name)
+
+# Background capture methods of capture_window_background(), in fallback order
+BACKGROUND_METHODS = ["printwindow_full", "wm_print", "printwindow", "bitblt"]
+
+class BackgroundCaptureSource(FrameSource):
+    """One PrintWindow/WM_PRINT/BitBlt background capture method (works for covered windows)."""
+    method = None
+    window_capture = True
+
+    @classmethod
+    def is_available(cls):
+        return BACKGROUND_CAPTURE_AVAILABLE
+
+    def grab(self, hwnd=None, rect=None, window_name=None):
+        if not hwnd:
+            return None
+        # Locked-window semantics: accept dark themes, only reject all-black failures
+        return capture_window_background(hwnd, 0, 0, skip_black_check=True, method=self.method)
+
+# Registered by method name, after WGC: registry order is the scoreboard's default order
+for _method in BACKGROUND_METHODS:
+    register_frame_source(type(f"BackgroundCaptureSource_{_method}", (BackgroundCaptureSource,),
+                               {"name": _method, "method": _method}))
+
+# Screen-grab engines in fallback order
+SCREEN_ENGINE_CHAIN = ["dxcam", "mss", "legacy"]
+
+# Optional override: serve every target from one source, e.g.
+#   GHOST_FRAME_SOURCE=synthetic:scroll_text  or  GHOST_FRAME_SOURCE=replay:session.gsrf
+FRAME_SOURCE_OVERRIDE = None
+if os.environ.get("GHOST_FRAME_SOURCE"):
+    try:
+        FRAME_SOURCE_OVERRIDE = create_frame_source_from_spec(os.environ["GHOST_FRAME_SOURCE"])
+        print(f"✅ Frame source override: {FRAME_SOURCE_OVERRIDE.describe()}")
+    except ValueError as e:
+        print(f"⚠️ Invalid GHOST_FRAME_SOURCE: {e}")
+
 def simple_capture(hwnd=None, rect=None):
     """
     Multi-mode capture with fallback chain.
     Modes: 'dxcam' (fastest), 'mss' (cross-platform), 'legacy' (PIL.ImageGrab)
     """
-    global CAPTURE_ENGINE, dxcam_camera
-    
     # Determine which engine to use
-    engine = CAPTURE_ENGINE
-    if engine == "auto":
-        if DXCAM_AVAILABLE:
-            engine = "dxcam"
-        elif MSS_AVAILABLE:
-            engine = "mss"
-        else:
-            engine = "legacy"
+    engine = get_current_capture_engine()
     
     try:
         # Get rect if not provided
@@ -351,72 +494,18 @@ def simple_capture(hwnd=None, rect=None):
         if not rect or rect[2] <= rect[0] or rect[3] <= rect[1]:
             return None
         
-        left, top, right, bottom = rect
-        width = right - left
-        height = bottom - top
-        
-        # ==================== DXcam Mode (Fastest) ====================
-        if engine == "dxcam" and DXCAM_AVAILABLE and CV2_AVAILABLE:
+        # Start at the configured engine and fall back down the chain
+        chain = SCREEN_ENGINE_CHAIN[SCREEN_ENGINE_CHAIN.index(engine):] if engine in SCREEN_ENGINE_CHAIN else ["legacy"]
+        for name in chain:
+            source = get_frame_source(name)
+            if source is None:
+                continue
             try:
-                # Initialize camera if needed
-                if dxcam_camera is None:
-                    dxcam_camera = dxcam.create(output_idx=0, output_color="BGR")
-                
-                # Check bounds (DXcam only captures one monitor)
-                cam_w, cam_h = dxcam_camera.width, dxcam_camera.height
-                if (left < 0 or top < 0 or right > cam_w or bottom > cam_h):
-                    # Window is outside primary monitor or cross-monitor
-                    # print(f"[CAPTURE] Window out of bounds for DXcam: {rect}, cam: {cam_w}x{cam_h}")
-                    raise ValueError("Window out of bounds for DXcam")
-
-                # DXcam captures full screen, we need to crop
-                # [STREAMING MODE] Use get_latest_frame if started (Zero latency)
-                if dxcam_camera.is_capturing:
-                    frame = dxcam_camera.get_latest_frame()
-                else:
-                    # [POLLING MODE] Fallback to grab (One-shot)
-                    frame = dxcam_camera.grab()
-                
-                if frame is None:
-                    # In streaming mode, this means no new frame yet (static screen)
-                    # We should handle this gracefully, but for now fallback to ensure response
-                    raise ValueError("DXcam frame is None (static or failed)")
-                    
-                # Crop to window region
-                cropped = frame[top:bottom, left:right]
-                
-                if cropped.size == 0:
-                    raise ValueError(f"Empty crop result: {cropped.shape}")
-
-                # [OPTIMIZED] Keep BGR format - cv2 encoder expects BGR anyway
-                # Skip conversion to save CPU: was BGR->RGB->BGR, now just BGR
-                return Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB))
+                return source.grab(hwnd=hwnd, rect=rect)
             except Exception as e:
                 # Only print non-bounds errors to avoid log spam
                 if "bounds" not in str(e):
-                    print(f"[CAPTURE] DXcam error: {e} | Rect: {rect}, falling back to mss")
-                engine = "mss"  # Fallback
-        
-        # ==================== mss Mode (Fast, Cross-platform) ====================
-        if engine == "mss" and MSS_AVAILABLE:
-            try:
-                monitor = {
-                    "left": left,
-                    "top": top,
-                    "width": width,
-                    "height": height
-                }
-                sct_img = mss_sct.grab(monitor)
-                # Convert to PIL Image
-                img = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
-                return img
-            except Exception as e:
-                print(f"[CAPTURE] mss error: {e} | Rect: {rect}, falling back to legacy")
-                engine = "legacy"  # Fallback
-        
-        # ==================== Legacy Mode (PIL.ImageGrab) ====================
-        from PIL import ImageGrab
-        return ImageGrab.grab(bbox=rect, all_screens=True)
+                    print(f"[CAPTURE] {name} error: {e} | Rect: {rect}, falling back")
         
     except Exception as e:
         print(f"[CAPTURE] simple_capture error: {e}")
@@ -439,20 +528,17 @@ def get_target_window():
     锁定模式: 只返回锁定的窗口
     自动模式: 跟随当前前台窗口（不限于预设关键词）
     """
-    global LOCKED_WINDOW_TITLE
+    global LOCKED_HWND
     
-    # If locked to a specific window, find it first (exact match)
+    # If locked to a specific window, follow its pinned hwnd (survives title changes)
     if LOCKED_WINDOW_TITLE:
-        all_windows = get_all_windows()
-        for win in all_windows:
-            if win.title == LOCKED_WINDOW_TITLE:
-                return win
-        # Also try partial match if exact fails
-        for win in all_windows:
-            if LOCKED_WINDOW_TITLE in win.title:
-                return win
-        # Locked window not found
-        return None
+        win = window_registry.get(LOCKED_HWND)
+        if win is None:
+            # Not pinned yet or closed: resolve the title (exact, then partial) and re-pin
+            win = window_registry.find(LOCKED_WINDOW_TITLE, listed_only=True)
+            LOCKED_HWND = window_hwnd(win)
+        # None = locked window not found
+        return win
     
     # Auto-detect mode: follow the foreground window (any window!)
     foreground = get_foreground_window()
@@ -465,12 +551,12 @@ def get_target_window():
     # Fallback: No foreground window or it's a system window
     # Try keyword search as last resort
     for keyword in TARGET_KEYWORDS:
-        windows = gw.getWindowsWithTitle(keyword)
-        if windows:
-            return windows[0]
+        win = window_registry.find(keyword)
+        if win:
+            return win
     return None
 
-def capture_window_background(hwnd, width, height, skip_black_check=False):
+def capture_window_background(hwnd, width, height, skip_black_check=False, method=None):
     """
     Capture window content even when covered by other windows.
     Uses multiple fallback methods for maximum compatibility.
@@ -478,6 +564,8 @@ def capture_window_background(hwnd, width, height, skip_black_check=False):
     Args:
         skip_black_check: If True, skip the "black screen" detection. Use for locked windows
                           where user explicitly wants the content even if dark-themed.
+        method: Run only this BACKGROUND_METHODS entry (None = fallback chain). A single
+                method returns None if it fails, so the caller can try the next one.
     """
     if not BACKGROUND_CAPTURE_AVAILABLE:
         return None
@@ -503,13 +591,14 @@ def capture_window_background(hwnd, width, height, skip_black_check=False):
         
         # Try Method 1: PrintWindow with PW_RENDERFULLCONTENT (best for modern apps)
         result = False
-        try:
-            result = win32gui.PrintWindow(hwnd, saveDC.GetSafeHdc(), 2)  # PW_RENDERFULLCONTENT = 2
-        except:
-            pass
+        if method in (None, "printwindow_full"):
+            try:
+                result = win32gui.PrintWindow(hwnd, saveDC.GetSafeHdc(), 2)  # PW_RENDERFULLCONTENT = 2
+            except:
+                pass
         
         # Method 2: If failed, try WM_PRINT message
-        if not result:
+        if not result and method in (None, "wm_print"):
             try:
                 WM_PRINT = 0x0317
                 PRF_CLIENT = 0x04
@@ -523,14 +612,14 @@ def capture_window_background(hwnd, width, height, skip_black_check=False):
                 pass
         
         # Method 3: If still failed, try regular PrintWindow without flag
-        if not result:
+        if not result and method in (None, "printwindow"):
             try:
                 result = win32gui.PrintWindow(hwnd, saveDC.GetSafeHdc(), 0)
             except:
                 pass
         
         # Method 4: BitBlt from screen DC (works better for multi-monitor)
-        if not result:
+        if not result and method in (None, "bitblt"):
             try:
                 # Get screen DC for the window's monitor
                 screenDC = win32gui.GetDC(0)  # 0 = entire virtual screen
@@ -547,18 +636,22 @@ def capture_window_background(hwnd, width, height, skip_black_check=False):
         bmpinfo = saveBitMap.GetInfo()
         bmpstr = saveBitMap.GetBitmapBits(True)
         img = Image.frombuffer('RGB', (bmpinfo['bmWidth'], bmpinfo['bmHeight']), bmpstr, 'raw', 'BGRX', 0, 1)
+        if not result:
+            img = None  # The requested method failed; don't return an empty bitmap
         
         # Check if image is mostly black (capture failed)
         # When skip_black_check is True (locked mode), use very low threshold (2) to only detect
         # truly failed captures (all-black from PrintWindow failure), while allowing dark themes through.
         # When False, use higher threshold (10) to be more aggressive about fallback.
-        import numpy as np
-        arr = np.array(img)
-        mean_brightness = np.mean(arr)
-        threshold = 2 if skip_black_check else 10
-        if mean_brightness < threshold:
-            # Capture failed - image is completely/nearly black
-            img = None
+        # Mean over every 8th pixel of every 8th row: same verdict, 1/64 of the work
+        if img is not None:
+            import numpy as np
+            arr = np.frombuffer(bmpstr, dtype=np.uint8).reshape(bmpinfo['bmHeight'], -1, 4)
+            mean_brightness = arr[::8, ::8, :3].mean()
+            threshold = 2 if skip_black_check else 10
+            if mean_brightness < threshold:
+                # Capture failed - image is completely/nearly black
+                img = None
         
         # Cleanup
         win32gui.DeleteObject(saveBitMap.GetHandle())
@@ -571,6 +664,239 @@ def capture_window_background(hwnd, width, height, skip_black_check=False):
         print(f"Background capture error: {e}")
         return None
 
+# ==================== Shared Capture Hub ====================
+# One capture loop per target feeds every /stream, WebRTC and /capture consumer.
+# Viewers subscribe to the target instead of capturing on their own.
+from capture_hub import CaptureHub, PerChannelEncoder
+from encode_pool import PoolEncodeFunc, get_encode_pool, shutdown_encode_pool
+from frame_diff import frame_digest
+from tile_stream import TileCache, get_tile_encoder
+from abr import ABR_TARGET_LATENCY, AbrController, encode_level_jpeg
+from stream_sender import ClientSender, is_connection_closed
+from frame_envelope import MetaTracker, pack_envelope
+from frame_latency import FrameLatencyTracker
+from latency_stats import LatencyStats
+from input_executor import get_input_executor
+from command_queue import CommandQueue, is_pointer_move
+from capture_scoreboard import CaptureScoreboard
+from viewport import Viewport, ViewTransform, remap_input
+
+# Stream frame period (30 FPS)
+STREAM_FRAME_INTERVAL = 0.033
+
+# Unchanged frames are never re-sent; an idle stream gets a tiny keepalive instead
+STREAM_KEEPALIVE_INTERVAL = 2.0
+
+# [TILES] Send only dirty 64x64 tiles when little changed (JPEG streams only)
+TILE_STREAMING = True
+
+# [TILE CACHE] Tiles each client keeps for reuse (sent as references on a hit); 0 disables
+TILE_CACHE_SIZE = 2048
+TILE_CACHE_POLICY = "lru"  # "lru" or "fifo"
+
+# [ABR] Per-client JPEG quality / downscale / frame rate, driven by send times and render acks
+ABR_ENABLED = True
+
+# Active /stream sessions: session id -> {"client_id", "connected_at", "tile_cache", "abr", "sender",
+# "commands", "command_queue", "viewport", "latency"} (for /status)
+stream_sessions = {}
+_next_stream_session_id = 0
+
+# [INPUT] WebSocket input actions whose receive-to-injection delay is measured
+INPUT_ACTIONS = {"click", "double_click", "right_click", "type", "key", "hotkey",
+                 "scroll", "scroll_up", "scroll_down", "mousedown", "mouseup", "mousemove"}
+# Receive-to-injection delay of WebSocket input commands, all sessions
+ws_input_latency = LatencyStats(histogram=metrics.histogram(
+    "input_latency_seconds", "WebSocket input command received to injected"))
+# [POINTER] Receipt-to-injection lag of (coalesced) pointer moves, all sessions
+ws_pointer_lag = LatencyStats(histogram=metrics.histogram(
+    "pointer_lag_seconds", "Pointer move received to injected"))
+bytes_sent_counter = metrics.counter("bytes_sent_total", "Frame payload bytes sent on /stream")
+metrics.gauge("stream_sessions", "Connected /stream sessions", lambda: len(stream_sessions))
+metrics.gauge("audio_queue_depth", "Deepest audio listener queue (chunks)",
+              lambda: audio_capture.queue_depth() if audio_capture else None)
+metrics.gauge("encode_pool_in_flight", "Frames in the encode pool",
+              lambda: get_encode_pool().stats()["in_flight"] if get_encode_pool() else None)
+# Frame time for the instrumentation overhead estimate
+metrics.frame_counter("frames_captured_total", "Frames captured and published")
+
+# [SCOREBOARD] Locked-window capture methods: the available window-capture frame
+# sources in registry order; per window, the fastest one that works goes first and
+# the others are re-probed every PROBE_INTERVAL
+LOCKED_CAPTURE_METHODS = window_capture_sources()
+# BitBlt copies the screen at the window's rect (covering windows included): fallback only
+capture_scoreboard = CaptureScoreboard(LOCKED_CAPTURE_METHODS, fallback_only=["bitblt"])
+
+def capture_locked_window(hwnd, title):
+    """Capture a locked window with the methods the scoreboard ranks best for it."""
+    if not hwnd:
+        return None
+    for method in capture_scoreboard.plan(hwnd, title):
+        started = time.perf_counter()
+        try:
+            screenshot = get_frame_source(method).grab(hwnd=hwnd, window_name=title)
+        except Exception as e:
+            print(f"[CAPTURE] {method} failed: {e}")
+            screenshot = None
+        capture_scoreboard.record(hwnd, method, screenshot is not None, time.perf_counter() - started)
+        if screenshot is not None:
+            return screenshot
+    return None
+
+def current_capture_target():
+    """Hub key for the window every viewer should currently see."""
+    if LOCKED_WINDOW_TITLE:
+        return ("window", LOCKED_WINDOW_TITLE)
+    return ("foreground", None)
+
+def capture_for_target(target):
+    """
+    Capture one frame for a hub target. Called once per tick per target by the
+    capture hub, however many clients are watching.
+    Returns (screenshot, window_title); screenshot is None if capture failed.
+    """
+    global PENDING_ACTIVATION, CURRENT_DISPLAY_WINDOW, LAST_VALID_WINDOW, WINDOW_CHANGE_TIME
+    kind, value = target
+    
+    # Synthetic / replay override (headless benchmarking): same frames for every target
+    if FRAME_SOURCE_OVERRIDE is not None:
+        return FRAME_SOURCE_OVERRIDE.grab(), FRAME_SOURCE_OVERRIDE.describe()
+    
+    # Monitor region: (left, top, width, height)
+    if kind == "region":
+        left, top, width, height = value
+        return simple_capture(rect=(left, top, left + width, top + height)), None
+    
+    screenshot = None
+    window_title = "未知"
+    
+    if kind == "window":
+        # [SMART AUTO-UNLOCK]
+        # If user physically switches to a different window (not Ghost Shell and not the Locked one),
+        # we assume they want to switch context, so we release the lock.
+        # [MANUAL MODE PROTECTION] Only unlock if it's a "Soft Lock" (Auto). 
+        # If Manual Lock is active, we NEVER auto-unlock.
+        if LOCKED_WINDOW_TITLE == value and not MANUAL_LOCK_ACTIVE:
+            try:
+                fg_hwnd_check = win32gui.GetForegroundWindow()
+                fg_title_check = win32gui.GetWindowText(fg_hwnd_check)
+                if (fg_title_check and "Ghost Shell" not in fg_title_check
+                        and fg_hwnd_check != LOCKED_HWND and fg_title_check != LOCKED_WINDOW_TITLE):
+                    print(f"[AUTO-UNLOCK] Context switched to '{fg_title_check}'. Releasing Soft Lock.")
+                    pin_locked_window(None)
+            except: pass
+        
+        # Lock moved elsewhere: subscribers will switch to the new target
+        if LOCKED_WINDOW_TITLE != value:
+            return None, None
+        
+        # Locked mode: use the locked window
+        win = get_target_window()
+        if win:
+            window_title = win.title
+            hwnd = window_hwnd(win)
+            if not hwnd and BACKGROUND_CAPTURE_AVAILABLE:
+                hwnd = win32gui.FindWindow(None, win.title)
+            
+            # Handle pending activation (only once after lock)
+            if PENDING_ACTIVATION:
+                print(f"[STREAM] Activating locked window once: '{win.title}'")
+                try:
+                    if win.isMinimized:
+                        win.restore()
+                    win.activate()
+                    time.sleep(0.15)
+                except:
+                    pass
+                PENDING_ACTIVATION = False
+            
+            # === LOCKED MODE CAPTURE CHAIN ===
+            # Default priority: WGC (covered GPU apps) > PrintWindow variants / BitBlt > simple_capture
+            # 1-2. Background methods, ordered per window by the capture scoreboard
+            screenshot = capture_locked_window(hwnd, win.title)
+            
+            # 3. Last resort: simple_capture (only gets visible screen)
+            if screenshot is None and hwnd:
+                try:
+                    rect = win32gui.GetWindowRect(hwnd)
+                    screenshot = simple_capture(hwnd=hwnd, rect=rect)
+                except:
+                    screenshot = simple_capture(hwnd=hwnd)
+        return screenshot, window_title
+    
+    # Auto-detect mode: use v2_simplified direct approach
+    hwnd, rect = get_foreground_hwnd_and_rect()
+    if not (hwnd and rect):
+        # Nothing to follow - viewers show "searching"
+        return None, None
+    
+    window_title = win32gui.GetWindowText(hwnd)
+    width = rect[2] - rect[0]
+    height = rect[3] - rect[1]
+    
+    # [LIVE MIRROR + LOGICAL PERSISTENCE v2]
+    # 核心目标：当用户操作 Ghost Shell 时，系统逻辑上必须认为依然在操作上一个窗口
+    # 1. 优先保持当前的状态 (Stickyness)，防止跳转到 Last 或 Ghost Shell
+    if "Ghost Shell" in window_title:
+        if CURRENT_DISPLAY_WINDOW and "Ghost Shell" not in CURRENT_DISPLAY_WINDOW:
+            # 保持当前窗口 (如记事本) 不变，即使前台是 Ghost Shell
+            window_title = CURRENT_DISPLAY_WINDOW
+        elif LAST_VALID_WINDOW and "Ghost Shell" not in LAST_VALID_WINDOW:
+            # 如果当前无效，回退到上一个有效窗口
+            window_title = LAST_VALID_WINDOW
+    
+    # [Normal Case] Capture the actual foreground window (or Ghost Shell if above)
+    # [PHASE 1 OPTIMIZATION] DXcam优先 (最快)
+    screenshot = simple_capture(hwnd=hwnd, rect=rect)
+    
+    # BitBlt 备选 (窗口被遮挡时)
+    if screenshot is None and BACKGROUND_CAPTURE_AVAILABLE:
+        try:
+            screenshot = capture_window_background(hwnd, width, height)
+        except:
+            screenshot = None
+    
+    # Update global state for lock_current
+    # 只有在非锁定模式下才更新 CURRENT_DISPLAY_WINDOW
+    if window_title and not LOCKED_WINDOW_TITLE:
+        # 只有当 window_title 不是 Ghost Shell 时，才更新状态
+        # 这确保了 Ghost Shell 永远不会成为逻辑焦点
+        if "Ghost Shell" not in window_title:
+            # 保存上一个窗口用于快速切换时的回退
+            if CURRENT_DISPLAY_WINDOW and CURRENT_DISPLAY_WINDOW != window_title:
+                # [POISON PREVENTION] 再次确认不保存 Ghost Shell
+                if "Ghost Shell" not in CURRENT_DISPLAY_WINDOW:
+                    LAST_VALID_WINDOW = CURRENT_DISPLAY_WINDOW
+                    WINDOW_CHANGE_TIME = time.time()
+            CURRENT_DISPLAY_WINDOW = window_title
+    
+    return screenshot, window_title
+
+# [FRAME SKIPPING] Pixel-identical captures are dropped before encoding
+# [ENCODE POOL] Full-frame JPEG encodes run in worker processes (4+ cores), published in seq order
+capture_hub = CaptureHub(capture_for_target, frame_interval=lambda: STREAM_FRAME_INTERVAL,
+                         change_detector=frame_digest, encode_pool=get_encode_pool())
+
+capture_jpeg_encoder = None
+
+def encode_capture_jpeg(image):
+    """Encode a frame for /capture (always JPEG, independent of the stream encoder)."""
+    global capture_jpeg_encoder
+    if capture_jpeg_encoder is None:
+        from encoders import JPEGEncoder
+        capture_jpeg_encoder = JPEGEncoder(quality=85)
+    return capture_jpeg_encoder.encode(image)
+
+def encode_stream_jpeg(image):
+    """/stream encoder for viewers that cannot decode the main encoder's format (e.g. H.264)."""
+    return encode_capture_jpeg(image), "jpeg"
+
+def jpeg_stream_result(data):
+    return data, "jpeg"
+
+# Same encode, poolable: the hub may run it in an encode pool worker
+pooled_stream_jpeg = PoolEncodeFunc(encode_stream_jpeg, 85, jpeg_stream_result)
+
 # Path to HTML client
 import os
 CLIENT_HTML_PATH = os.path.join(os.path.dirname(__file__), "ghost_client.html")
@@ -604,6 +930,7 @@ def api_info():
 @app.get("/windows")
 def list_windows():
     """列出所有可用窗口 / List all available windows."""
+    window_registry.refresh(force=True)  # User is picking a window: show what is open now
     windows = get_all_windows()
     current_win = get_target_window()
     return {
@@ -616,15 +943,15 @@ def list_windows():
 @app.post("/lock")
 def lock_window(req: LockRequest):
     """锁定到指定窗口 / Lock to a specific window."""
-    global LOCKED_WINDOW_TITLE, PENDING_ACTIVATION, MANUAL_LOCK_ACTIVE
+    global PENDING_ACTIVATION, MANUAL_LOCK_ACTIVE
     if req.title == "":
-        LOCKED_WINDOW_TITLE = None
+        pin_locked_window(None)
         MANUAL_LOCK_ACTIVE = False  # Reset to auto mode
         PENDING_ACTIVATION = False
         print(f"[LOCK] Unlocked, switching to auto-follow")
         return {"status": "unlocked", "message": "已解锁，恢复自动跟随", "auto_follow": True}
     else:
-        LOCKED_WINDOW_TITLE = req.title
+        pin_locked_window(req.title)
         MANUAL_LOCK_ACTIVE = True  # Hard Lock - won't auto-unlock
         PENDING_ACTIVATION = True
         print(f"[LOCK] Manually locked to: '{req.title}'")
@@ -639,7 +966,7 @@ def lock_window(req: LockRequest):
 @app.post("/lock_current")
 def lock_current_window():
     """一键锁定当前正在自动跟随显示的窗口 / Lock the currently auto-followed window."""
-    global LOCKED_WINDOW_TITLE, PENDING_ACTIVATION, MANUAL_LOCK_ACTIVE
+    global PENDING_ACTIVATION, MANUAL_LOCK_ACTIVE
     
     # 如果已经锁定，返回当前锁定状态
     if LOCKED_WINDOW_TITLE:
@@ -661,7 +988,7 @@ def lock_current_window():
     # 再次检查：只排除 Ghost Shell 自身
     # 注意：不要过滤 "Antigravity"，因为用户的项目文件名可能包含这个词
     if title and "Ghost Shell" not in title:
-        LOCKED_WINDOW_TITLE = title
+        pin_locked_window(title)
         MANUAL_LOCK_ACTIVE = True  # Hard Lock - user clicked lock button
         PENDING_ACTIVATION = False
         print(f"[LOCK_CURRENT] Manually locked to current display: '{title}'")
@@ -689,6 +1016,12 @@ def set_fps(req: FpsRequest):
 @app.get("/capture")
 def capture():
     """Capture screenshot - works even when window is in background."""
+    # [CAPTURE HUB] If viewers are already streaming this target, reuse the latest frame
+    # instead of triggering another capture
+    frame = capture_hub.latest(current_capture_target())
+    if frame is not None:
+        return Response(content=frame.encode("capture-jpeg", encode_capture_jpeg), media_type="image/jpeg")
+    
     win = get_target_window()
     if not win:
         raise HTTPException(status_code=404, detail="未找到目标窗口")
@@ -696,7 +1029,7 @@ def capture():
     try:
         # Try background capture first (works even when window is not in foreground)
         if BACKGROUND_CAPTURE_AVAILABLE:
-            hwnd = win32gui.FindWindow(None, win.title)
+            hwnd = window_hwnd(win) or win32gui.FindWindow(None, win.title)
             if hwnd:
                 screenshot = capture_window_background(hwnd, win.width, win.height)
                 if screenshot:
@@ -720,16 +1053,130 @@ def capture():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def inject_ws_command(cmd: dict) -> dict:
+    """Execute a /stream interaction command; runs on the input executor thread."""
+    global LAST_CLICK_POS
+    
+    cmd_type = cmd.get('type', cmd.get('action', ''))
+    action = cmd.get('action', cmd_type)
+    x = cmd.get('x', 0)
+    y = cmd.get('y', 0)
+    text = cmd.get('text', '')
+    key = cmd.get('key', '')
+    
+    # Find target window
+    target_title = LOCKED_WINDOW_TITLE or CURRENT_DISPLAY_WINDOW or LAST_VALID_WINDOW
+    pointer_move = action == 'mousemove'
+    win = None
+    if LOCKED_WINDOW_TITLE:
+        win = get_target_window()  # Pinned hwnd
+    elif target_title:
+        win = window_registry.find(target_title)
+    if not win:
+        win = get_target_window()
+    if not win:
+        return {"type": "error", "message": "未找到目标窗口"}
+    
+    # Calculate absolute coordinates
+    abs_x = win.left + x
+    abs_y = win.top + y
+    
+    # Activate window (a move needs no focus: the mousedown that started the drag activated it)
+    if not pointer_move:
+        try:
+            activate_window(win)
+        except:
+            pass
+    
+    # Execute action
+    try:
+        if action == 'click':
+            pyautogui.click(abs_x, abs_y)
+            LAST_CLICK_POS = (abs_x, abs_y, win.title)
+            return {"type": "result", "status": "clicked", "pos": [abs_x, abs_y]}
+        elif action == 'double_click':
+            pyautogui.doubleClick(abs_x, abs_y)
+            return {"type": "result", "status": "double_clicked"}
+        elif action == 'right_click':
+            pyautogui.click(abs_x, abs_y, button='right')
+            return {"type": "result", "status": "right_clicked"}
+        elif action == 'type':
+            import pyperclip
+            import win32api
+            import win32con
+            if x != 0 or y != 0:
+                pyautogui.click(abs_x, abs_y)
+            elif LAST_CLICK_POS and LAST_CLICK_POS[2] == win.title:
+                pyautogui.click(LAST_CLICK_POS[0], LAST_CLICK_POS[1])
+            safe_text = text.replace('\x00', '').strip()
+            if safe_text:
+                print(f"[WS-TYPE] Typing: '{safe_text}' to '{win.title[:30]}'")
+                pyperclip.copy(safe_text)
+                win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
+                win32api.keybd_event(0x56, 0, 0, 0)
+                win32api.keybd_event(0x56, 0, win32con.KEYEVENTF_KEYUP, 0)
+                win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
+            return {"type": "result", "status": "typed", "text": safe_text}
+        elif action == 'key':
+            if len(key) == 1:
+                pyautogui.typewrite(key, interval=0)
+            else:
+                pyautogui.press(key)
+            return {"type": "result", "status": "key_pressed", "key": key}
+        elif action == 'hotkey':
+            keys = key.split('+')
+            pyautogui.hotkey(*keys)
+            return {"type": "result", "status": "hotkey_pressed", "keys": keys}
+        elif action in ['scroll', 'scroll_up', 'scroll_down']:
+            pyautogui.moveTo(abs_x, abs_y)
+            amount = int(text) if text else (3 if action == 'scroll_up' else -3 if action == 'scroll_down' else 3)
+            pyautogui.scroll(amount)
+            return {"type": "result", "status": "scrolled", "amount": amount}
+        elif action == 'mousedown':
+            pyautogui.mouseDown(abs_x, abs_y)
+            return {"type": "result", "status": "mousedown"}
+        elif action == 'mouseup':
+            pyautogui.mouseUp(abs_x, abs_y)
+            return {"type": "result", "status": "mouseup"}
+        elif action == 'mousemove':
+            pyautogui.moveTo(abs_x, abs_y)
+            return {"type": "result", "status": "mousemove"}
+        elif action == 'open_app':
+            pyautogui.hotkey('win', 's')
+            import pyperclip
+            time.sleep(1.0)
+            pyperclip.copy(text)
+            pyautogui.hotkey('ctrl', 'v')
+            time.sleep(0.5)
+            pyautogui.press('enter')
+            return {"type": "result", "status": "opening_app", "app": text}
+        else:
+            return {"type": "error", "message": f"Unknown action: {action}"}
+    except Exception as e:
+        return {"type": "error", "message": str(e)}
+
 @app.websocket("/stream")
-async def stream(websocket: WebSocket, client_id: int = 0):
-    """WebSocket stream - bidirectional: sends frames, receives control commands."""
-    global CURRENT_DISPLAY_WINDOW, LAST_VALID_WINDOW, WINDOW_CHANGE_TIME, LOCKED_WINDOW_TITLE, PENDING_ACTIVATION, MANUAL_LOCK_ACTIVE, LAST_CLICK_POS
+async def stream(websocket: WebSocket, client_id: int = 0, codecs: str = "jpeg", envelope: int = 0,
+                 vw: int = 0, vh: int = 0, dpr: float = 1.0):
+    """WebSocket stream - bidirectional: sends frames, receives control commands.
+
+    codecs: comma-separated formats the client can decode besides JPEG ("h264" with WebCodecs).
+    envelope: 1 = one binary message per frame (frame_envelope.py) instead of JSON meta + bytes.
+    vw, vh, dpr: client viewport (CSS px) and devicePixelRatio; JPEG frames are downscaled to fit.
+    """
+    global _next_stream_session_id
     import time
     import json
     await websocket.accept()
     
-    # Queue for pending control commands
-    command_queue = asyncio.Queue()
+    # Queue for pending control commands ([POINTER] consecutive waiting moves coalesce)
+    command_queue = CommandQueue()
+    # [ABR] Created before the receiver starts: acks may arrive at any time
+    abr = AbrController(ABR_TARGET_LATENCY) if ABR_ENABLED else None
+    # [LATENCY] Capture -> drawn breakdown from frame timestamps and the client's acks
+    frame_latency = FrameLatencyTracker()
+    # [VIEWPORT] Client display size; updated by 'viewport' messages (resize / rotation)
+    viewport = Viewport(vw, vh, dpr)
     
     async def receive_commands():
         """Background task to receive control commands from client."""
@@ -738,26 +1185,50 @@ async def stream(websocket: WebSocket, client_id: int = 0):
                 data = await websocket.receive_text()
                 try:
                     cmd = json.loads(data)
-                    print(f"[WS-CMD] Received: {cmd.get('action', cmd.get('type', 'unknown'))}")
-                    await command_queue.put(cmd)
-                except json.JSONDecodeError:
-                    pass
+                    if cmd.get('type') == 'ack':
+                        # [ABR] Render acks are bookkeeping, not commands
+                        seq = int(cmd.get('seq', -1))
+                        client_hold = None
+                        if 'drawn' in cmd:
+                            # [LATENCY] Client times (epoch ms, client clock): received, render start, decoded, drawn
+                            received, started, decoded, drawn = (float(cmd.get(key, cmd['drawn'])) / 1000
+                                                                 for key in ('rx', 'start', 'dec', 'drawn'))
+                            if frame_latency.on_ack(seq, received, started, decoded, drawn) is not None:
+                                client_hold = drawn - received
+                        if abr is not None:
+                            abr.on_ack(seq, client_hold=client_hold)
+                        continue
+                    if cmd.get('type') == 'viewport':
+                        if viewport.update(cmd.get('width'), cmd.get('height'), cmd.get('dpr')):
+                            print(f"[VIEWPORT] Client {client_id}: {viewport.width}x{viewport.height} @{viewport.dpr}x")
+                        continue
+                    if not is_pointer_move(cmd):
+                        print(f"[WS-CMD] Received: {cmd.get('action', cmd.get('type', 'unknown'))}")
+                    command_queue.put(cmd, time.perf_counter())
+                except (ValueError, TypeError):
+                    pass  # Malformed JSON or ack fields
         except Exception:
             pass  # Connection closed
     
     async def process_command(cmd):
         """Process a single control command and return response."""
-        global LOCKED_WINDOW_TITLE, MANUAL_LOCK_ACTIVE, CURRENT_DISPLAY_WINDOW, LAST_VALID_WINDOW, LAST_CLICK_POS, PENDING_ACTIVATION
+        global MANUAL_LOCK_ACTIVE, PENDING_ACTIVATION
         
         cmd_type = cmd.get('type', cmd.get('action', ''))
         
+        # Client's video decoder failed: JPEG stills until the next periodic keyframe
+        # (a forced one would cost every viewer of the shared encoder)
+        if cmd_type == 'request_keyframe':
+            h264_state["next_index"] = None
+            return {"type": "result", "status": "keyframe_requested"}
+        
         # Handle lock_current command
         if cmd_type == 'lock_current':
             title = CURRENT_DISPLAY_WINDOW
             if not title or "Ghost Shell" in title:
                 title = LAST_VALID_WINDOW
             if title and "Ghost Shell" not in title:
-                LOCKED_WINDOW_TITLE = title
+                pin_locked_window(title)
                 MANUAL_LOCK_ACTIVE = True
                 PENDING_ACTIVATION = False
                 return {"type": "lock_result", "status": "locked", "title": title}
@@ -765,266 +1236,231 @@ async def stream(websocket: WebSocket, client_id: int = 0):
         
         # Handle unlock command
         if cmd_type == 'unlock':
-            LOCKED_WINDOW_TITLE = None
+            pin_locked_window(None)
             MANUAL_LOCK_ACTIVE = False
             return {"type": "unlock_result", "status": "unlocked"}
         
-        # Handle interaction commands (click, type, key, scroll, etc.)
-        action = cmd.get('action', cmd_type)
-        x = cmd.get('x', 0)
-        y = cmd.get('y', 0)
-        text = cmd.get('text', '')
-        key = cmd.get('key', '')
+        # [VIEWPORT] x/y are in the (possibly downscaled) frame this client shows
+        cmd = viewport.remap_command(cmd)
         
-        # Find target window
-        target_title = LOCKED_WINDOW_TITLE or CURRENT_DISPLAY_WINDOW or LAST_VALID_WINDOW
-        win = None
-        if target_title:
-            windows = gw.getWindowsWithTitle(target_title)
-            if windows:
-                win = windows[0]
-        if not win:
-            win = get_target_window()
-        if not win:
-            return {"type": "error", "message": "未找到目标窗口"}
-        
-        # Calculate absolute coordinates
-        abs_x = win.left + x
-        abs_y = win.top + y
-        
-        # Activate window
-        try:
-            activate_window(win)
-        except:
-            pass
-        
-        # Execute action
-        try:
-            if action == 'click':
-                pyautogui.click(abs_x, abs_y)
-                LAST_CLICK_POS = (abs_x, abs_y, win.title)
-                return {"type": "result", "status": "clicked", "pos": [abs_x, abs_y]}
-            elif action == 'double_click':
-                pyautogui.doubleClick(abs_x, abs_y)
-                return {"type": "result", "status": "double_clicked"}
-            elif action == 'right_click':
-                pyautogui.click(abs_x, abs_y, button='right')
-                return {"type": "result", "status": "right_clicked"}
-            elif action == 'type':
-                import pyperclip
-                import win32api
-                import win32con
-                if x != 0 or y != 0:
-                    pyautogui.click(abs_x, abs_y)
-                elif LAST_CLICK_POS and LAST_CLICK_POS[2] == win.title:
-                    pyautogui.click(LAST_CLICK_POS[0], LAST_CLICK_POS[1])
-                safe_text = text.replace('\x00', '').strip()
-                if safe_text:
-                    print(f"[WS-TYPE] Typing: '{safe_text}' to '{win.title[:30]}'")
-                    pyperclip.copy(safe_text)
-                    win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-                    win32api.keybd_event(0x56, 0, 0, 0)
-                    win32api.keybd_event(0x56, 0, win32con.KEYEVENTF_KEYUP, 0)
-                    win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-                return {"type": "result", "status": "typed", "text": safe_text}
-            elif action == 'key':
-                if len(key) == 1:
-                    pyautogui.typewrite(key, interval=0)
-                else:
-                    pyautogui.press(key)
-                return {"type": "result", "status": "key_pressed", "key": key}
-            elif action == 'hotkey':
-                keys = key.split('+')
-                pyautogui.hotkey(*keys)
-                return {"type": "result", "status": "hotkey_pressed", "keys": keys}
-            elif action in ['scroll', 'scroll_up', 'scroll_down']:
-                pyautogui.moveTo(abs_x, abs_y)
-                amount = int(text) if text else (3 if action == 'scroll_up' else -3 if action == 'scroll_down' else 3)
-                pyautogui.scroll(amount)
-                return {"type": "result", "status": "scrolled", "amount": amount}
-            elif action == 'mousedown':
-                pyautogui.mouseDown(abs_x, abs_y)
-                return {"type": "result", "status": "mousedown"}
-            elif action == 'mouseup':
-                pyautogui.mouseUp(abs_x, abs_y)
-                return {"type": "result", "status": "mouseup"}
-            elif action == 'mousemove':
-                pyautogui.moveTo(abs_x, abs_y)
-                return {"type": "result", "status": "mousemove"}
-            elif action == 'open_app':
-                pyautogui.hotkey('win', 's')
-                import pyperclip
-                await asyncio.sleep(1.0)
-                pyperclip.copy(text)
-                pyautogui.hotkey('ctrl', 'v')
-                await asyncio.sleep(0.5)
-                pyautogui.press('enter')
-                return {"type": "result", "status": "opening_app", "app": text}
-            else:
-                return {"type": "error", "message": f"Unknown action: {action}"}
-        except Exception as e:
-            return {"type": "error", "message": str(e)}
+        # [INPUT EXECUTOR] Window lookup, activation and injection block: run them on the
+        # input thread, in order behind earlier commands, while this loop keeps streaming
+        return await get_input_executor().run(inject_ws_command, cmd)
+    
+    # Per-session receive-to-injection delay of input commands
+    command_latency = LatencyStats()
+    
+    async def execute_commands():
+        """[INPUT] Runs each command as soon as it arrives, independent of frame production."""
+        while True:
+            cmd, received_at = await command_queue.get()
+            try:
+                result = await process_command(cmd)
+            except Exception as cmd_err:
+                print(f"[WS-CMD] Error: {cmd_err}")
+                continue
+            action = cmd.get('action', cmd.get('type', ''))
+            if is_pointer_move(cmd) and result.get("type") == "result":
+                # [POINTER] Fire-and-forget: measured, but no result message per move
+                command_queue.move_injected(received_at)
+                ws_pointer_lag.add(time.perf_counter() - received_at)
+                continue
+            if action in INPUT_ACTIONS and result.get("type") == "result":
+                delay = time.perf_counter() - received_at
+                command_latency.add(delay)
+                ws_input_latency.add(delay)
+                result["latency_ms"] = round(delay * 1000, 1)
+            # Goes out before any frame still waiting in the sender
+            sender.send_control(result)
     
     # Start background receiver task
     receiver_task = asyncio.create_task(receive_commands())
     
+    # [CAPTURE HUB] Subscribe to the shared capture loop of the current target.
+    # All viewers of the same window read the same frames: no per-client capture/encode.
+    # Capture and encode run on the hub's worker thread, never on this event loop.
+    from encoders import JPEGEncoder, get_encoder_manager
+    encoder = get_encoder_manager()
+    # [H.264] Real video only for clients that can decode it; the others get JPEG
+    # (and with it dirty tiles) from the same capture channel
+    if encoder.format_type == "h264" and encoder.format_type in codecs.split(","):
+        # One H.264 instance per capture target: a GOP never mixes two windows. A frame
+        # published before this client subscribed goes out as a JPEG still
+        stream_encoder = (encoder.name, PerChannelEncoder(encoder.for_target, fallback=encode_stream_jpeg))
+        stream_format = "h264"
+    elif encoder.format_type == "jpeg":
+        stream_encoder = (encoder.name, encoder.encode)
+        if isinstance(encoder.encoder, JPEGEncoder):
+            # [ENCODE POOL] Stateless JPEG can be encoded out of process
+            stream_encoder = (encoder.name, PoolEncodeFunc(encoder.encode, encoder.encoder.quality, jpeg_stream_result))
+        stream_format = "jpeg"
+    else:
+        stream_encoder = ("stream-jpeg", pooled_stream_jpeg)
+        stream_format = "jpeg"
+    if abr is not None:
+        # Quality, scale and frame skipping only apply to JPEG; H.264 clients share their channel's encoder
+        abr.adaptive = stream_format == "jpeg"
+    # AU index this client's decoder needs next; None = wait for a keyframe.
+    # joined: it decoded from an IDR before, so a resync does not force one
+    h264_state = {"next_index": None, "joined": False}
+    # [TILES] Dirty-tile deltas against the frame this client already shows; tiles are
+    # JPEG, so they can only patch a JPEG canvas
+    delta_encoder = None
+    tile_cache = None
+    if TILE_STREAMING and stream_format == "jpeg":
+        delta_encoder = ("tiles", get_tile_encoder().encode_update)
+        if TILE_CACHE_SIZE:
+            # Mirrors the tiles this client keeps; the client starts empty on every connection
+            tile_cache = TileCache(TILE_CACHE_SIZE, TILE_CACHE_POLICY)
+    subscription = capture_hub.subscribe(current_capture_target(), encoder=stream_encoder,
+                                         delta_encoder=delta_encoder)
+    # What the client's canvas currently shows (only the sender task touches this)
+    sent_state = {"subscription": None, "frame": None}
+    # [ENVELOPE] Meta fields the client already has
+    meta_tracker = MetaTracker() if envelope else None
+    
+    async def send_frame(frame_subscription, frame):
+        """Encode frame for this client (as a delta against what it has) and send meta + payload."""
+        if frame_subscription is not sent_state["subscription"]:
+            # Other channel: deltas need a base from the new one, H.264 an IDR of its encoder
+            sent_state["subscription"] = frame_subscription
+            sent_state["frame"] = None
+            h264_state.update(next_index=None, joined=False)
+        last_sent_frame = sent_state["frame"]
+        source_size = frame.size
+        if stream_format == "jpeg":
+            # [VIEWPORT] Downscale to the client's screen before any encode; tiles and ABR then
+            # work at that size. One resize per frame and size, shared by same-size clients
+            view_size = viewport.frame_size(*source_size)
+            if view_size != source_size:
+                frame = await asyncio.to_thread(frame.derived, ("viewport", view_size),
+                                                lambda image: as_pixel_frame(image).resized(*view_size))
+                viewport.remember(ViewTransform(source_size, view_size))
+        width, height = frame.size
+        window_title = frame.window_title
+        level = abr.level if abr is not None and abr.adaptive else None
+        scaled = level is not None and level.scale < 1.0
+        # [TILES] Only the dirty tiles since the last frame we sent (None = too much changed)
+        encoded_data = None
+        if delta_encoder is not None and last_sent_frame is not None and not scaled:
+            update = await frame_subscription.encoded_delta(last_sent_frame, frame)
+            if update is not None:
+                # [TILE CACHE] This client's message: references for tiles it holds,
+                # its misses JPEG-encoded off-loop
+                encoded_data = await asyncio.to_thread(update.to_bytes, tile_cache)
+                format_type = "tiles"
+        if encoded_data is None and level is not None and abr.index > 0:
+            # [ABR] Lower level: own quality/scale, shared by all clients on this level
+            encoded_data = await asyncio.to_thread(frame.encode, ("abr", level),
+                                                   lambda image: encode_level_jpeg(image, level))
+            format_type = "jpeg"
+        if encoded_data is None:
+            # [MULTI-BACKEND] 使用最优编码器 (PyAV > NVENC > FFmpeg > JPEG)
+            # Encoded once per frame (off-loop) and shared by every subscriber
+            encoded_data, format_type = await frame_subscription.encoded(frame)
+        meta = {}
+        if format_type == "h264":
+            # [H.264] A P-frame only decodes after the unit before it: a client that
+            # just joined or skipped a frame gets a JPEG still until the next IDR
+            if encoded_data.keyframe or encoded_data.index == h264_state["next_index"]:
+                h264_state["next_index"] = encoded_data.index + 1
+                h264_state["joined"] = True
+                meta = {"codec": encoded_data.codec, "keyframe": encoded_data.keyframe}
+            else:
+                h264_state["next_index"] = None
+                if not h264_state["joined"]:
+                    # Only a new viewer asks for an IDR. The channel's encoder is shared by its
+                    # viewers (FFmpeg even restarts for one): a client that fell behind waits
+                    # for the periodic IDR
+                    frame_subscription.request_keyframe()
+                encoded_data, format_type = await asyncio.to_thread(frame.encode, "stream-jpeg", encode_stream_jpeg)
+        encoded_at = time.time()
+        # seq: the client acks it once the frame is on screen
+        meta["seq"] = frame.seq
+        if abr is not None:
+            meta["abr"] = abr.decision()
+        # Command results that arrived while we were encoding go first
+        await sender.flush_control()
+        send_started = time.monotonic()
+        sent_at = time.time()
+        if meta_tracker is not None:
+            # [ENVELOPE] One message: per-frame fields in the binary header, the rest only when changed
+            changed = meta_tracker.changed({
+                "window": window_title[:50] if window_title else "未知",
+                "locked_title": LOCKED_WINDOW_TITLE if LOCKED_WINDOW_TITLE else None,
+                "manual_lock": MANUAL_LOCK_ACTIVE,
+                "encoder": encoder.name,
+                "codec": meta.get("codec"),
+                "abr": meta.get("abr"),
+                "source": list(source_size),
+            })
+            await websocket.send_bytes(pack_envelope(format_type, encoded_data, frame.seq, frame.captured_at,
+                                                     width, height, keyframe=meta.get("keyframe", False),
+                                                     meta=changed, sent_at=sent_at, encoded_at=encoded_at))
+        else:
+            await websocket.send_json({
+                "type": "meta",
+                "width": width,
+                "height": height,
+                "source": list(source_size),
+                "window": window_title[:50] if window_title else "未知",
+                "locked_title": LOCKED_WINDOW_TITLE if LOCKED_WINDOW_TITLE else None,
+                "manual_lock": MANUAL_LOCK_ACTIVE,
+                "format": format_type,
+                "encoder": encoder.name,
+                "captured_at": frame.captured_at * 1000,
+                "encoded_at": encoded_at * 1000,
+                "sent_at": sent_at * 1000,
+                **meta
+            })
+            await websocket.send_bytes(encoded_data)
+        bytes_sent_counter.inc(len(encoded_data))
+        frame_latency.on_sent(frame.seq, frame.captured_at, encoded_at, sent_at)
+        if abr is not None:
+            abr.on_sent(frame.seq, len(encoded_data), send_started, time.monotonic())
+        # A downscaled canvas cannot take native-size tiles: next frame is full
+        sent_state["frame"] = frame if not scaled else None
+        return True
+    
+    # [BACKPRESSURE] The sender task owns the socket: this loop only offers frames
+    # (latest wins, an unsent one is dropped) and queues control messages ahead of them
+    sender = ClientSender(websocket.send_json, send_frame)
+    sender_task = asyncio.create_task(sender.run())
+    command_task = asyncio.create_task(execute_commands())
+    _next_stream_session_id += 1
+    session_id = _next_stream_session_id
+    stream_sessions[session_id] = {"client_id": client_id, "connected_at": time.time(), "tile_cache": tile_cache,
+                                   "abr": abr, "sender": sender, "commands": command_latency,
+                                   "command_queue": command_queue, "viewport": viewport,
+                                   "latency": frame_latency}
+    last_keepalive_time = time.time()
+    
     try:
         while True:
+            if sender_task.done():
+                print(f"[STREAM] WebSocket closed, exiting loop")
+                break
             try:
-                frame_start = time.perf_counter()  # Track frame timing
-                screenshot = None
-                width, height = 800, 600
-                window_title = "未知"
-                skipped = False
-                hwnd = None
-                rect = None
+                # Follow lock/unlock by moving to the channel of the current target
+                subscription = capture_hub.switch(subscription, current_capture_target())
                 
-                # [SMART AUTO-UNLOCK]
-                # If user physically switches to a different window (not Ghost Shell and not the Locked one),
-                # we assume they want to switch context, so we release the lock.
-                # [MANUAL MODE PROTECTION] Only unlock if it's a "Soft Lock" (Auto). 
-                # If Manual Lock is active, we NEVER auto-unlock.
-                if LOCKED_WINDOW_TITLE and not MANUAL_LOCK_ACTIVE:
-                    try:
-                        fg_hwnd_check = win32gui.GetForegroundWindow()
-                        fg_title_check = win32gui.GetWindowText(fg_hwnd_check)
-                        if fg_title_check and "Ghost Shell" not in fg_title_check and fg_title_check != LOCKED_WINDOW_TITLE:
-                            print(f"[AUTO-UNLOCK] Context switched to '{fg_title_check}'. Releasing Soft Lock.")
-                            LOCKED_WINDOW_TITLE = None
-                    except: pass
-
-                # Check if we have a locked window
-                if LOCKED_WINDOW_TITLE:
-                    # Locked mode: use the locked window
-                    win = get_target_window()
-
-                    if win:
-                        window_title = win.title
-                        hwnd = getattr(win, '_hWnd', None)
-                        if not hwnd and BACKGROUND_CAPTURE_AVAILABLE:
-                            hwnd = win32gui.FindWindow(None, win.title)
-                        
-                        # Handle pending activation (only once after lock)
-                        global PENDING_ACTIVATION
-                        if PENDING_ACTIVATION:
-                            print(f"[STREAM] Activating locked window once: '{win.title}'")
-                            try:
-                                if win.isMinimized:
-                                    win.restore()
-                                win.activate()
-                                import time
-                                time.sleep(0.15)
-                            except:
-                                pass
-                            PENDING_ACTIVATION = False
-                        
-                        # === LOCKED MODE CAPTURE CHAIN ===
-                        # Priority: WGC (best for covered GPU windows) > PrintWindow > simple_capture
-                        
-                        # 1. Try WGC first (Windows Graphics Capture - works for covered GPU apps)
-                        if WGC_CAPTURE_AVAILABLE and screenshot is None:
-                            screenshot = capture_window_wgc(hwnd=hwnd, window_name=win.title)
-                        
-                        # 2. Fallback to PrintWindow (works for covered non-GPU apps)
-                        if screenshot is None and hwnd and BACKGROUND_CAPTURE_AVAILABLE:
-                            screenshot = capture_window_background(hwnd, win.width, win.height, skip_black_check=True)
-                        
-                        # 3. Last resort: simple_capture (only gets visible screen)
-                        if screenshot is None and hwnd:
-                            try:
-                                rect = win32gui.GetWindowRect(hwnd)
-                                screenshot = simple_capture(hwnd=hwnd, rect=rect)
-                            except:
-                                screenshot = simple_capture(hwnd=hwnd)
-                        
-                        if screenshot:
-                            width, height = screenshot.size
-                else:
-                    # Auto-detect mode: use v2_simplified direct approach
-                    hwnd, rect = get_foreground_hwnd_and_rect()
-                    skipped = False
-                    if hwnd and rect:
-                        window_title = win32gui.GetWindowText(hwnd)
-                        width = rect[2] - rect[0]
-                        height = rect[3] - rect[1]
-                        
-                        # [LIVE MIRROR + LOGICAL PERSISTENCE v2]
-                        # 核心目标：当用户操作 Ghost Shell 时，系统逻辑上必须认为依然在操作上一个窗口
-                        # 1. 优先保持当前的状态 (Stickyness)，防止跳转到 Last 或 Ghost Shell
-                        if "Ghost Shell" in window_title and not LOCKED_WINDOW_TITLE:
-                             if CURRENT_DISPLAY_WINDOW and "Ghost Shell" not in CURRENT_DISPLAY_WINDOW:
-                                 # 保持当前窗口 (如记事本) 不变，即使前台是 Ghost Shell
-                                 window_title = CURRENT_DISPLAY_WINDOW
-                             elif LAST_VALID_WINDOW and "Ghost Shell" not in LAST_VALID_WINDOW:
-                                 # 如果当前无效，回退到上一个有效窗口
-                                 window_title = LAST_VALID_WINDOW
-                        
-                        # [Normal Case] Capture the actual foreground window (or Ghost Shell if above)
-                        # [PHASE 1 OPTIMIZATION] DXcam优先 (最快)
-                        screenshot = simple_capture(hwnd=hwnd, rect=rect)
-                        
-                        # BitBlt 备选 (窗口被遮挡时)
-                        if screenshot is None and BACKGROUND_CAPTURE_AVAILABLE:
-                            try:
-                                screenshot = capture_window_background(hwnd, width, height)
-                            except:
-                                screenshot = None
-                
-                # Update global state for lock_current
-                # 只有在非锁定模式下才更新 CURRENT_DISPLAY_WINDOW
-
-                if window_title and not LOCKED_WINDOW_TITLE:
-                    # 只有当 window_title 不是 Ghost Shell 时，才更新状态
-                    # 这确保了 Ghost Shell 永远不会成为逻辑焦点
-                    if "Ghost Shell" not in window_title:
-                        # 保存上一个窗口用于快速切换时的回退
-                        if CURRENT_DISPLAY_WINDOW and CURRENT_DISPLAY_WINDOW != window_title:
-                            # [POISON PREVENTION] 再次确认不保存 Ghost Shell
-                            if "Ghost Shell" not in CURRENT_DISPLAY_WINDOW:
-                                LAST_VALID_WINDOW = CURRENT_DISPLAY_WINDOW
-                                WINDOW_CHANGE_TIME = time.time()
-                        CURRENT_DISPLAY_WINDOW = window_title
-                
-                # Send logic
-                if screenshot:
-                    # [MULTI-BACKEND] 使用最优编码器 (NVENC > FFmpeg > JPEG)
-                    from encoders import get_encoder_manager
-                    encoder = get_encoder_manager()
-                    encoded_data, format_type = encoder.encode(screenshot)
-                    await websocket.send_json({
-                        "type": "meta",
-                        "width": width,
-                        "height": height,
-                        "window": window_title[:50] if window_title else "未知",
-                        "locked_title": LOCKED_WINDOW_TITLE if LOCKED_WINDOW_TITLE else None,
-                        "manual_lock": MANUAL_LOCK_ACTIVE,
-                        "format": format_type,
-                        "encoder": encoder.name
-                    })
-                    await websocket.send_bytes(encoded_data)
-                elif not (hwnd and rect) and not LOCKED_WINDOW_TITLE:
-                     await websocket.send_json({"type": "status", "status": "searching", "message": "正在搜索目标窗口..."})
-                elif not screenshot and not LOCKED_WINDOW_TITLE:
-                     # Just wait, don't spam error unless persistent
-                     pass
+                # [ABR] This client's frame rate: frames captured meanwhile are skipped,
+                # next_frame() then returns the newest one
+                hold = abr.hold_time() if abr is not None and abr.adaptive else 0.0
                 
-                # Process any pending control commands (non-blocking)
-                while not command_queue.empty():
-                    try:
-                        cmd = command_queue.get_nowait()
-                        result = await process_command(cmd)
-                        await websocket.send_json(result)
-                    except asyncio.QueueEmpty:
-                        break
-                    except Exception as cmd_err:
-                        print(f"[WS-CMD] Error: {cmd_err}")
+                # A new viewer gets the current frame immediately; afterwards wait for the next one
+                frame = await subscription.next_frame(timeout=0.1) if hold <= 0 else None
                 
-                # Smart delay: subtract actual processing time from target delay
-                elapsed = time.perf_counter() - frame_start
-                # Ensure at least 5 FPS (0.2s) even if fast, but user wanted DXcam speed?
-                # Restoring to 30 FPS logic (0.033) as it was before "revert to 5fps"
-                wait_time = max(0, 0.033 - elapsed)
-                await asyncio.sleep(wait_time)
+                if frame is not None:
+                    sender.offer_frame(subscription, frame)
+                elif hold > 0:
+                    await asyncio.sleep(min(hold, 0.05))
+                elif subscription.key[0] == "foreground" and subscription.channel.last_title is None:
+                    sender.send_control({"type": "status", "status": "searching", "message": "正在搜索目标窗口..."})
+                elif time.time() - max(sender.last_frame_at, last_keepalive_time) > STREAM_KEEPALIVE_INTERVAL:
+                    # Static screen: nothing to encode, just tell the client we are alive
+                    sender.send_control({"type": "keepalive", "seq": subscription.last_seq})
+                    last_keepalive_time = time.time()
 
             except Exception as e:
                 # Catch transient errors inside the loop to avoid disconnecting!
@@ -1035,7 +1471,6 @@ async def stream(websocket: WebSocket, client_id: int = 0):
                     break
                 print(f"[STREAM LOOP ERROR] {e}")
                 await asyncio.sleep(0.1) # Brief pause on error
-
     except WebSocketDisconnect:
         print("[STREAM] WebSocket disconnected")
     except Exception as e:
@@ -1045,12 +1480,18 @@ async def stream(websocket: WebSocket, client_id: int = 0):
         except:
             pass
     finally:
-        # Cleanup: cancel the receiver task
-        receiver_task.cancel()
-        try:
-            await receiver_task
-        except asyncio.CancelledError:
-            pass
+        # Cleanup: leave the capture hub and stop the receiver, command and sender tasks
+        subscription.close()
+        stream_sessions.pop(session_id, None)
+        for task in (receiver_task, command_task, sender_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                if not is_connection_closed(e):
+                    print(f"[STREAM] Sender error: {e}")
 
 # ==================== Audio Stream Endpoint ====================
 from starlette.websockets import WebSocketState
@@ -1192,8 +1633,15 @@ def background_type(hwnd, text):
 
 @app.post("/interact")
 async def interact(req: InteractionRequest):
-    """Send interaction to target window."""
-    global ORIGINAL_WINDOW_STATE, CURRENT_DISPLAY_WINDOW, LOCKED_WINDOW_TITLE, LAST_VALID_WINDOW, MANUAL_LOCK_ACTIVE, LAST_CLICK_POS
+    """Send interaction to target window (injected on the input thread, never on the event loop)."""
+    # [VIEWPORT] Stateless: the request names the frame it clicked on and the size it was scaled from
+    req.x, req.y = remap_input(req.x, req.y, req.frame_width, req.frame_height,
+                               req.source_width, req.source_height)
+    return await get_input_executor().run(inject_interaction, req)
+
+def inject_interaction(req: InteractionRequest):
+    """/interact body; runs on the input executor thread, so blocking calls are fine here."""
+    global ORIGINAL_WINDOW_STATE, CURRENT_DISPLAY_WINDOW, LAST_VALID_WINDOW, MANUAL_LOCK_ACTIVE, LAST_CLICK_POS
     
     # ... (Target selection logic unchanged)
     # 优先使用客户端指定的窗口（最准确）
@@ -1213,7 +1661,7 @@ async def interact(req: InteractionRequest):
     if target_title and not LOCKED_WINDOW_TITLE:
         if "Ghost Shell" not in target_title:
              print(f"[AUTO-LOCK] Interaction triggered Soft Lock on: {target_title}")
-             LOCKED_WINDOW_TITLE = target_title
+             pin_locked_window(target_title)
              MANUAL_LOCK_ACTIVE = False # Soft Lock
              CURRENT_DISPLAY_WINDOW = target_title
              LAST_VALID_WINDOW = target_title
@@ -1221,10 +1669,10 @@ async def interact(req: InteractionRequest):
     
     # Find window
     win = None
-    if target_title:
-        windows = gw.getWindowsWithTitle(target_title)
-        if windows:
-            win = windows[0]
+    if target_title and target_title == LOCKED_WINDOW_TITLE:
+        win = get_target_window()  # Pinned hwnd
+    elif target_title:
+        win = window_registry.find(target_title)
     
     if not win:
         win = get_target_window()
@@ -1317,7 +1765,6 @@ async def interact(req: InteractionRequest):
         elif req.action == "open_app":
             # press Win+S, type app name, press Enter
             pyautogui.hotkey('win', 's')
-            import time
             import pyperclip
             time.sleep(1.0)  # Wait longer for search bar
             
@@ -1481,7 +1928,7 @@ async def interact(req: InteractionRequest):
                     print(f"[CLOSE] Warning: Failed to activate window, trying anyway")
                 
                 # Give extra time for activation
-                await asyncio.sleep(0.2)
+                time.sleep(0.2)
                 
                 # SAFETY CHECK: Ensure target is actually foreground
                 try:
@@ -1499,7 +1946,7 @@ async def interact(req: InteractionRequest):
                 pyautogui.hotkey('alt', 'f4')
                 
                 # Wait a bit to let window close
-                await asyncio.sleep(0.3)
+                time.sleep(0.3)
                 
                 print(f"[CLOSE] Successfully sent close command to '{win_title}'")
                 return {"status": "success", "message": f"已关闭窗口: {win_title}", "title": win_title}
@@ -1537,6 +1984,7 @@ def get_clipboard():
 @app.get("/status")
 def status():
     """Get server and window status."""
+    from encoders import get_encoder_manager
     win = get_target_window()
     sessions = []
     try:
@@ -1554,13 +2002,44 @@ def status():
         "window_found": bool(win),
         "window_title": win.title if win else None,
         "window_box": {"left": win.left, "top": win.top, "width": win.width, "height": win.height} if win else None,
-        "sessions": sessions
+        "sessions": sessions,
+        "capture_engine": get_current_capture_engine(),
+        "frame_sources": available_frame_sources(),
+        "capture_hub": capture_hub.stats(),
+        "encode_pool": get_encode_pool().stats() if get_encode_pool() else None,
+        "tile_stream": get_tile_encoder().stats() if TILE_STREAMING else None,
+        "encoder": get_encoder_manager().stats(),
+        "stream_sessions": [
+            {"id": session_id, "client_id": info["client_id"],
+             "connected_s": round(time.time() - info["connected_at"], 1),
+             "tile_cache": info["tile_cache"].stats() if info["tile_cache"] else None,
+             "abr": info["abr"].stats() if info["abr"] else None,
+             "sender": info["sender"].stats(),
+             "input_latency": info["commands"].stats(),
+             "pointer": info["command_queue"].stats(),
+             "viewport": info["viewport"].stats(),
+             "latency": info["latency"].stats()}
+            for session_id, info in list(stream_sessions.items())
+        ],
+        "input_latency": ws_input_latency.stats(),
+        "input_executor": get_input_executor().stats(),
+        "pointer_lag": ws_pointer_lag.stats(),
+        "locked_hwnd": LOCKED_HWND,
+        "window_registry": window_registry.stats(),
+        "capture_methods": capture_scoreboard.stats(),
+        "event_loop_lag": loop_lag_monitor.stats(),
+        "metrics": metrics.compact()
     }
 
-# Helper functions for multiprocessing
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """[METRICS] Prometheus text exposition: stage histograms, frame/byte counters, gauges."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# Server entry points
 def start_http():
     import uvicorn
-    print(f"✅ HTTP Server started on port 8000")
+    print("✅ HTTP Server started on port 8000")
     # Need to pass import string or app object. App object works if defined globally.
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="error")
 
@@ -1568,15 +2047,40 @@ def start_https(cert_file, key_file):
     import uvicorn
     # Re-verify path in process
     if os.path.exists(cert_file):
-        print(f"✅ HTTPS Server started on port 8444")
+        print("✅ HTTPS Server started on port 8444")
         uvicorn.run(app, host="0.0.0.0", port=8444, ssl_certfile=cert_file, ssl_keyfile=key_file, log_level="error")
     else:
         print("❌ HTTPS certificate not found in child process.")
 
+def serve_http_and_https(cert_file, key_file):
+    """
+    HTTP (8000) and HTTPS (8444) listeners in one process on one event loop.
+    Both ports share the capture hub, encoders, audio capture, lock state and
+    sessions: a desktop viewer on 8000 and a phone on 8444 cost one capture and
+    one encode per frame (two processes used to do all of it twice).
+    """
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=8000, log_level="error")),
+        # Startup/shutdown hooks (DXcam, audio, lag monitor) run once, with the HTTP listener
+        uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=8444, ssl_certfile=cert_file,
+                                      ssl_keyfile=key_file, log_level="error", lifespan="off")),
+    ]
+    
+    async def serve_all():
+        tasks = [asyncio.create_task(server.serve()) for server in servers]
+        # Ctrl+C reaches the server whose signal handler was installed last: stop the rest with it
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for server in servers:
+            server.should_exit = True
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    print("✅ HTTP Server started on port 8000")
+    print("✅ HTTPS Server started on port 8444")
+    asyncio.run(serve_all())
+
 if __name__ == "__main__":
     import uvicorn
     import sys
-    import multiprocessing
     import time
     import socket
     
@@ -1599,18 +2103,8 @@ if __name__ == "__main__":
     elif "--http-only" in sys.argv:
         start_http()
     else:
-        # Default: Start HTTP + HTTPS servers
-        processes = []
-        
-        p_http = multiprocessing.Process(target=start_http)
-        p_http.start()
-        processes.append(p_http)
-        
+        # Default: HTTP + HTTPS listeners sharing one process (one capture/encode for both)
         if has_cert:
-            p_https = multiprocessing.Process(target=start_https, args=(cert_file, key_file))
-            p_https.start()
-            processes.append(p_https)
-            
             print("\n" + "="*50)
             print("🚀 Ghost Shell Server Active")
             print("   - PC (HTTP):      http://localhost:8000")
@@ -1620,12 +2114,9 @@ if __name__ == "__main__":
             print("="*50 + "\n")
             
             try:
-                for p in processes:
-                    p.join()
+                serve_http_and_https(cert_file, key_file)
             except KeyboardInterrupt:
                 print("Stopping servers...")
-                for p in processes:
-                    p.terminate()
         else:
             print("⚠️ SSL cert.pem/key.pem not found. Running in HTTP-only mode.")
             print("   Speech available at: http://localhost:8000/speech/")
@@ -0,0 +1,168 @@
+# Ghost Shell H.264 Elementary Stream
+# Helpers to turn an encoder's output into self-contained access units (one per
+# frame) that a browser can feed to WebCodecs' VideoDecoder.
+#
+# FFmpeg writes to a pipe, and a raw Annex-B stream has no frame boundaries: the
+# end of a frame is only known when the next one starts, one frame too late for
+# an interactive stream (and never, if the screen goes static). FFmpeg therefore
+# muxes to FLV, whose tags carry exact sizes; FlvAccessUnitReader turns every
+# video tag back into an Annex-B access unit without waiting for the next frame.
+#
+# Keyframes get SPS/PPS prepended, so a viewer can start decoding at any IDR.
+
+import struct
+from typing import BinaryIO, Iterator, List, Optional
+
+START_CODE = b"\x00\x00\x00\x01"
+
+# NAL unit types (ITU-T H.264 table 7-1)
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+
+
+def split_annexb(data: bytes) -> List[bytes]:
+    """NAL units (without start codes) of an Annex-B byte stream."""
+    nals = []
+    start = data.find(b"\x00\x00\x01")
+    while start >= 0:
+        start += 3
+        end = data.find(b"\x00\x00\x01", start)
+        if end < 0:
+            nals.append(data[start:])
+            break
+        # A 4-byte start code leaves its leading zero on the previous NAL
+        nals.append(data[start:end - 1] if data[end - 1] == 0 else data[start:end])
+        start = end
+    return nals
+
+
+def nal_type(nal: bytes) -> int:
+    return nal[0] & 0x1F
+
+
+def codec_string(sps: bytes) -> str:
+    """WebCodecs codec string ('avc1.PPCCLL') from an SPS NAL unit."""
+    return f"avc1.{sps[1]:02x}{sps[2]:02x}{sps[3]:02x}"
+
+
+class AccessUnit(bytes):
+    """One encoded frame as Annex-B bytes, plus what a viewer needs to join the stream.
+
+    index counts the encoder's output frames: a viewer can decode a non-key unit
+    only if it decoded the previous index.
+    """
+
+    index: int
+    keyframe: bool
+    codec: Optional[str]
+
+    def __new__(cls, data: bytes, index: int, keyframe: bool, codec: Optional[str]):
+        unit = super().__new__(cls, data)
+        unit.index = index
+        unit.keyframe = keyframe
+        unit.codec = codec
+        return unit
+
+    @classmethod
+    def from_annexb(cls, data: bytes, index: int, codec: Optional[str] = None) -> "AccessUnit":
+        """Parse the NAL units for the keyframe flag and, if present, the codec."""
+        keyframe = False
+        for nal in split_annexb(data):
+            kind = nal_type(nal)
+            if kind == NAL_IDR:
+                keyframe = True
+            elif kind == NAL_SPS and len(nal) >= 4:
+                codec = codec_string(nal)
+        return cls(data, index, keyframe, codec)
+
+
+# ==================== FLV Demuxing ====================
+# FLV: 'FLV' header, then tags: type u8, size u24, timestamp u24 + u8, stream id u24,
+# data, previous tag size u32 (big endian). AVC video data: frame type / codec u8,
+# packet type u8 (0 = decoder config, 1 = NAL units), composition time s24.
+_FLV_HEADER = struct.Struct(">3sBBI")
+FLV_TAG_VIDEO = 9
+FLV_CODEC_AVC = 7
+
+
+def _read_exact(stream: BinaryIO, size: int) -> Optional[bytes]:
+    data = stream.read(size)
+    return data if data is not None and len(data) == size else None
+
+
+class FlvAccessUnitReader:
+    """Reads an FLV stream of H.264 video and yields Annex-B AccessUnits."""
+
+    def __init__(self, stream: BinaryIO, first_index: int = 0):
+        self.stream = stream
+        self.codec: Optional[str] = None
+        self._parameter_sets = b""  # SPS + PPS in Annex-B, prepended to keyframes
+        self._length_size = 4
+        self._index = first_index  # Continues across encoder restarts
+
+    def __iter__(self) -> Iterator[AccessUnit]:
+        header = _read_exact(self.stream, _FLV_HEADER.size + 4)
+        if header is None:
+            return
+        signature, _, _, header_size = _FLV_HEADER.unpack_from(header)
+        if signature != b"FLV":
+            raise ValueError("Not an FLV stream")
+        if header_size > _FLV_HEADER.size and _read_exact(self.stream, header_size - _FLV_HEADER.size) is None:
+            return
+        while True:
+            tag_header = _read_exact(self.stream, 11)
+            if tag_header is None:
+                return
+            tag_type = tag_header[0]
+            size = int.from_bytes(tag_header[1:4], "big")
+            data = _read_exact(self.stream, size + 4)  # + previous tag size
+            if data is None:
+                return
+            if tag_type != FLV_TAG_VIDEO or size < 5 or data[0] & 0x0F != FLV_CODEC_AVC:
+                continue  # Script data (onMetaData) or audio
+            packet_type = data[1]
+            if packet_type == 0:
+                self._read_decoder_config(data[5:size])
+            elif packet_type == 1:
+                unit = self._access_unit(data[5:size], keyframe=(data[0] >> 4) == 1)
+                if unit is not None:
+                    yield unit
+
+    def _read_decoder_config(self, record: bytes):
+        """AVCDecoderConfigurationRecord: NAL length size and SPS/PPS."""
+        self._length_size = (record[4] & 0x03) + 1
+        offset = 5
+        parameter_sets = []
+        for count_mask in (0x1F, 0xFF):  # SPS count (5 bits), then PPS count
+            count = record[offset] & count_mask
+            offset += 1
+            for _ in range(count):
+                length = int.from_bytes(record[offset:offset + 2], "big")
+                parameter_sets.append(record[offset + 2:offset + 2 + length])
+                offset += 2 + length
+        sps = [nal for nal in parameter_sets if nal_type(nal) == NAL_SPS]
+        if sps:
+            self.codec = codec_string(sps[0])
+        self._parameter_sets = b"".join(START_CODE + nal for nal in parameter_sets)
+
+    def _access_unit(self, payload: bytes, keyframe: bool) -> Optional[AccessUnit]:
+        """Length-prefixed NAL units -> Annex-B (SPS/PPS first on keyframes)."""
+        parts = []
+        offset = 0
+        while offset + self._length_size <= len(payload):
+            length = int.from_bytes(payload[offset:offset + self._length_size], "big")
+            offset += self._length_size
+            parts.append(START_CODE)
+            parts.append(payload[offset:offset + length])
+            offset += length
+        if not parts:
+            return None
+        if keyframe:
+            parts.insert(0, self._parameter_sets)
+        unit = AccessUnit(b"".join(parts), self._index, keyframe, self.codec)
+        self._index += 1
+        return unit
@@ -0,0 +1,90 @@
+# Ghost Shell Input Executor
+# pyautogui, pyperclip, keybd_event, window lookups and activate_window() (its
+# AttachThreadInput / SetForegroundWindow retries) block for milliseconds up to
+# seconds (open_app waits 1.5 s for the search box). On the event loop they
+# freeze every stream. All injection jobs - /interact and WebSocket commands -
+# run on one input thread instead; callers await a future.
+#
+# One desktop, one mouse: jobs run strictly in submission order, so each
+# session's inputs keep their order and two sessions cannot interleave inside
+# a job (e.g. a click between another client's activate and its keystrokes).
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from latency_stats import LatencyStats
+
+
+class InputExecutor:
+    """Ordered single-thread executor for input injection."""
+
+    def __init__(self, name: str = "input-executor"):
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.wait = LatencyStats()  # Queued -> started
+        self.run_time = LatencyStats()  # Started -> done
+        self.jobs = 0
+        self.errors = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit(self, func: Callable, *args) -> Future:
+        """Queue func(*args) behind every earlier job; returns a concurrent Future."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((future, func, args, time.perf_counter()))
+        return future
+
+    async def run(self, func: Callable, *args) -> Any:
+        """submit() for the event loop: await the result without blocking the loop."""
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def _worker(self):
+        while True:
+            future, func, args, queued_at = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue  # Caller went away before the job started
+            started = time.perf_counter()
+            self.wait.add(started - queued_at)
+            try:
+                result = func(*args)
+            except BaseException as e:
+                self.errors += 1
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                self.run_time.add(time.perf_counter() - started)
+                self.jobs += 1
+
+    def stats(self) -> dict:
+        return {
+            "jobs": self.jobs,
+            "pending": self._queue.qsize(),
+            "errors": self.errors,
+            "wait": self.wait.stats(),
+            "run": self.run_time.stats(),
+        }
+
+
+# Global singleton
+_input_executor: Optional[InputExecutor] = None
+
+
+def get_input_executor() -> InputExecutor:
+    """Get or create the global input executor."""
+    global _input_executor
+    if _input_executor is None:
+        _input_executor = InputExecutor()
+    return _input_executor
@@ -0,0 +1,114 @@
+# Ghost Shell Slice-Parallel JPEG
+# A 4K frame is one cv2.imencode call on one core (tens of ms) while the other
+# cores idle. cv2 releases the GIL, so horizontal slices encode concurrently on a
+# thread pool and are stitched back into ONE baseline JPEG with restart markers:
+#
+#   header of slice 0 (SOF height patched, DRI added) | scan 0 | RST0 | scan 1 | RST1 | ... | EOI
+#
+# Every slice is a whole number of MCU rows and uses the same quality and the
+# standard Huffman tables, so its entropy-coded data is exactly what one restart
+# interval of the full image would hold. Browsers decode the result like any JPEG:
+# no client changes, and /capture, /stream and tiles all benefit.
+
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from pixel_frame import CV2_AVAILABLE, PixelFrame, cv2
+
+# Frames below this many pixels are encoded in one call (pool overhead > gain)
+PARALLEL_MIN_PIXELS = 1920 * 1080
+# Upper bound on slices per frame (and on pool threads)
+MAX_SLICES = 8
+
+_EOI = b"\xff\xd9"
+_SOF0 = 0xC0
+_SOS = 0xDA
+_DRI = 0xDD
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def default_slices() -> int:
+    """One slice per core, at most MAX_SLICES."""
+    return max(1, min(MAX_SLICES, os.cpu_count() or 1))
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=MAX_SLICES, thread_name_prefix="jpeg-slice")
+    return _pool
+
+
+def _encode_slice(frame: PixelFrame, quality: int) -> bytes:
+    # RGB -> BGR conversion (if any) also runs per slice, on the pool
+    _, encoded = cv2.imencode(".jpg", frame.to_bgr(), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
+
+
+def _split_jpeg(data: bytes):
+    """(header up to and including SOS, entropy-coded scan, (mcu_w, mcu_h), SOF offset)."""
+    offset = 2
+    sof_offset = None
+    mcu = (8, 8)
+    while offset < len(data):
+        marker = data[offset + 1]
+        length = struct.unpack_from(">H", data, offset + 2)[0]
+        if marker == _SOF0:
+            sof_offset = offset
+            components = data[offset + 9]
+            factors = [data[offset + 11 + 3 * i] for i in range(components)]
+            mcu = (8 * max(f >> 4 for f in factors), 8 * max(f & 0x0F for f in factors))
+        elif marker != 0xC4 and 0xC1 <= marker <= 0xCF and marker not in (0xC8, 0xCC):
+            raise ValueError(f"Unsupported JPEG frame type 0x{marker:02x}")
+        offset += 2 + length
+        if marker == _SOS:
+            if sof_offset is None or not data.endswith(_EOI):
+                raise ValueError("Malformed JPEG slice")
+            return data[:offset], data[offset:-2], mcu, sof_offset
+    raise ValueError("JPEG slice has no scan")
+
+
+def stitch_slices(parts: List[bytes], width: int, height: int) -> bytes:
+    """Join slice JPEGs (same width, equal MCU-aligned heights but the last) into one JPEG."""
+    header, scan, (mcu_w, mcu_h), sof_offset = _split_jpeg(parts[0])
+    slice_height = struct.unpack_from(">H", parts[0], sof_offset + 5)[0]
+    interval = -(-width // mcu_w) * (slice_height // mcu_h)  # MCUs per slice
+    if slice_height % mcu_h or interval > 0xFFFF:
+        raise ValueError("Slice height does not fit a restart interval")
+    # Patch the image height in SOF, then insert DRI before SOS
+    sos_offset = header.rfind(b"\xff\xda")
+    out = [header[:sof_offset + 5], struct.pack(">H", height), header[sof_offset + 7:sos_offset],
+           struct.pack(">BBHH", 0xFF, _DRI, 4, interval), header[sos_offset:], scan]
+    for index, part in enumerate(parts[1:]):
+        out.append(bytes((0xFF, 0xD0 + index % 8)))  # RSTn cycles through D0..D7
+        out.append(_split_jpeg(part)[1])
+    out.append(_EOI)
+    return b"".join(out)
+
+
+def encode_jpeg_sliced(frame: PixelFrame, quality: int = 85, slices: Optional[int] = None) -> Optional[bytes]:
+    """One JPEG of the frame, encoded as `slices` horizontal bands in parallel.
+
+    Returns None when slicing does not apply (small frame, one core, no cv2);
+    the caller then encodes the frame in one call.
+    """
+    slices = slices or default_slices()
+    width, height = frame.size
+    if not CV2_AVAILABLE or slices < 2 or width * height < PARALLEL_MIN_PIXELS:
+        return None
+    # Bands of whole 16-row MCUs (4:2:0); the last band takes the remainder. A band
+    # must also fit the 16-bit restart interval (8x8 MCUs in the worst case)
+    band = ((height + slices - 1) // slices + 15) // 16 * 16
+    band = min(band, 0xFFFF // -(-width // 8) * 8 // 16 * 16)
+    bands = [PixelFrame(frame.array[y:y + band], frame.pixel_format) for y in range(0, height, band)]
+    if len(bands) < 2:
+        return None
+    parts = list(_get_pool().map(_encode_slice, bands, [quality] * len(bands)))
+    return stitch_slices(parts, width, height)
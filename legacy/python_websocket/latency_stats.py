@@ -0,0 +1,37 @@
+# Ghost Shell Latency Statistics
+# Rolling window of latency samples with a millisecond summary, for /status:
+# click-to-injection delay of input commands, pointer lag, and the like.
+# An optional metrics.Histogram receives every sample too (for /metrics).
+
+from collections import deque
+
+
+class LatencyStats:
+    """Recent latency samples (seconds); count and max are all-time."""
+
+    def __init__(self, window: int = 500, histogram=None):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.max = 0.0
+        self.histogram = histogram
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self.count += 1
+        self.max = max(self.max, seconds)
+        if self.histogram is not None:
+            self.histogram.observe(seconds)
+
+    def stats(self) -> dict:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0, "avg_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2)
+        return {
+            "count": self.count,
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max * 1000, 2),
+        }
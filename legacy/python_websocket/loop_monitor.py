@@ -0,0 +1,56 @@
+# Ghost Shell Event Loop Lag Monitor
+# Measures how late the asyncio loop wakes a periodic sleep. Anything that blocks
+# the loop (synchronous capture, encode, input injection) shows up here directly.
+
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+
+class EventLoopLagMonitor:
+    """Samples event-loop lag: actual wake-up time minus the requested sleep."""
+
+    def __init__(self, interval: float = 0.05, window: int = 200, histogram=None):
+        self.interval = interval
+        self.histogram = histogram  # Optional metrics.Histogram fed with every sample
+        self._samples = deque(maxlen=window)  # Lag in seconds, most recent last
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start sampling on the running loop. Call from the event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, time.perf_counter() - start - self.interval)
+                self._samples.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if self.histogram is not None:
+                    self.histogram.observe(lag)
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> dict:
+        """Lag summary in milliseconds over the recent window (max_ms is all-time)."""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "avg_ms": 0.0, "p99_ms": 0.0, "recent_max_ms": 0.0, "max_ms": 0.0}
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return {
+            "samples": len(samples),
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p99_ms": round(p99 * 1000, 2),
+            "recent_max_ms": round(samples[-1] * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
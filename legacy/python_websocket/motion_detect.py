@@ -0,0 +1,171 @@
+# Ghost Shell Motion Detection (scroll / copy-rect)
+# Scrolling an editor dirties every tile although the new frame is mostly the old
+# one shifted. This finds the shift and turns it into a single copy-rect
+# instruction; only the newly exposed strip then needs encoding.
+#
+#   1. Estimate: per-line signatures in a few of the dirtiest tile columns (or rows
+#      for horizontal motion); unique lines vote for a shift.
+#   2. Verify: exact compare of the shifted frames per tile column, so static parts
+#      (side bar, minimap, scrollbar) are excluded from the rect.
+#
+# Signature collisions can only make the copy rect smaller or useless: the tile
+# encoder compares the predicted frame with the real one and sends what differs.
+
+from typing import Optional, Tuple
+
+from frame_diff import comparable_rows
+from pixel_frame import np
+
+# Only look for motion when at least this share of tiles is dirty
+MOTION_MIN_DIRTY_RATIO = 0.15
+# Tile columns/rows sampled to estimate the shift
+PROBE_LINES = 3
+# Unique lines that must agree on a shift
+MIN_VOTES = 8
+# A tile column moves with the content if this share of its overlap rows match
+MIN_MATCH_RATIO = 0.5
+
+CopyRect = Tuple[int, int, int, int, int, int]  # src x, src y, w, h, dst x, dst y
+
+_weights_cache = {}
+
+
+def _signatures(lines):
+    """int64 signature per line of an (n, m) uint8 array."""
+    length = lines.shape[1]
+    weights = _weights_cache.get(length)
+    if weights is None:
+        weights = np.random.default_rng(length).integers(1, 1 << 16, size=length, dtype=np.int64)
+        _weights_cache[length] = weights
+    return lines.astype(np.int64) @ weights
+
+
+def _line_shift(prev_lines, cur_lines) -> Tuple[int, int]:
+    """(shift, votes) where prev line index = cur line index + shift."""
+    prev_sig, prev_index, prev_count = np.unique(_signatures(prev_lines), return_index=True, return_counts=True)
+    cur_sig, cur_index, cur_count = np.unique(_signatures(cur_lines), return_index=True, return_counts=True)
+    # Repeated lines (blank lines, borders) carry no position information
+    prev_sig, prev_index = prev_sig[prev_count == 1], prev_index[prev_count == 1]
+    cur_sig, cur_index = cur_sig[cur_count == 1], cur_index[cur_count == 1]
+    _, p, c = np.intersect1d(prev_sig, cur_sig, assume_unique=True, return_indices=True)
+    shifts = prev_index[p] - cur_index[c]
+    shifts = shifts[shifts != 0]
+    if len(shifts) == 0:
+        return 0, 0
+    values, counts = np.unique(shifts, return_counts=True)
+    best = counts.argmax()
+    return int(values[best]), int(counts[best])
+
+
+def _longest_run(flags) -> Tuple[int, int]:
+    """(start, end) of the longest run of True values, (0, 0) if none."""
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    if len(edges) == 0:
+        return 0, 0
+    starts, ends = edges[0::2], edges[1::2]
+    best = (ends - starts).argmax()
+    return int(starts[best]), int(ends[best])
+
+
+def _estimate_shift(prev, cur, mask, tile: int, axis: int) -> int:
+    """Shift of the dirty content along `axis` (0 = vertical, 1 = horizontal), 0 if none.
+
+    Voted over the dirtiest tile columns (vertical) or rows (horizontal); only the
+    probed strips are copied, so this is cheap even when nothing moved.
+    """
+    if axis == 1:
+        # Horizontal motion is vertical motion of the transposed frame (views, no copy)
+        prev, cur, mask = prev.swapaxes(0, 1), cur.swapaxes(0, 1), mask.T
+    length = cur.shape[0]
+    dirty_lines = np.flatnonzero(mask.any(axis=1))
+    dirty_strips = mask.sum(axis=0)
+    if len(dirty_lines) == 0:
+        return 0
+    start, end = dirty_lines[0] * tile, min(length, (dirty_lines[-1] + 1) * tile)
+    votes = {}
+    for strip in np.argsort(dirty_strips)[::-1][:PROBE_LINES]:
+        if dirty_strips[strip] == 0:
+            break
+        x = strip * tile
+        strip_prev = prev[start:end, x:x + tile].reshape(end - start, -1)
+        strip_cur = cur[start:end, x:x + tile].reshape(end - start, -1)
+        shift, count = _line_shift(strip_prev, strip_cur)
+        if shift:
+            votes[shift] = votes.get(shift, 0) + count
+    if not votes:
+        return 0
+    shift, count = max(votes.items(), key=lambda item: item[1])
+    return shift if count >= MIN_VOTES else 0
+
+
+def _verify_vertical_copy(prev, cur, mask, tile: int, shift: int) -> Optional[CopyRect]:
+    """Copy rect covering the tile columns and rows that really moved down/up by `shift`."""
+    height, width, channels = cur.shape
+    dirty_rows = np.flatnonzero(mask.any(axis=1))
+    y0, y1 = dirty_rows[0] * tile, min(height, (dirty_rows[-1] + 1) * tile)
+    top, bottom = max(y0, -shift), min(y1, height - shift)
+    if bottom - top < tile:
+        return None
+    cur_rows, prev_rows, word = comparable_rows(cur[top:bottom], prev[top + shift:bottom + shift], tile)
+    equal = cur_rows == prev_rows
+    col_starts = np.arange(0, equal.shape[1], tile * channels // word)
+    segments = np.logical_and.reduceat(equal, col_starts, axis=1)  # (rows, tile cols)
+    moving = (segments.mean(axis=0) >= MIN_MATCH_RATIO) & mask.any(axis=0)
+    c0, c1 = _longest_run(moving)
+    if c1 == c0:
+        return None
+    # Rows where most moving columns match; stray mismatches (scrollbar thumb) are
+    # fixed by the residual tiles
+    r0, r1 = _longest_run(segments[:, c0:c1].mean(axis=1) >= MIN_MATCH_RATIO)
+    if r1 - r0 < tile:
+        return None
+    x, w = c0 * tile, min(width, c1 * tile) - c0 * tile
+    dst_y, h = top + r0, r1 - r0
+    return (x, dst_y + shift, w, h, x, dst_y)
+
+
+def _verify_horizontal_copy(prev, cur, mask, tile: int, shift: int) -> Optional[CopyRect]:
+    """Copy rect covering the tile rows and columns that really moved left/right by `shift`."""
+    height, width, _ = cur.shape
+    dirty_cols = np.flatnonzero(mask.any(axis=0))
+    x0, x1 = dirty_cols[0] * tile, min(width, (dirty_cols[-1] + 1) * tile)
+    left, right = max(x0, -shift), min(x1, width - shift)
+    if right - left < tile:
+        return None
+    equal = cur[:, left:right] == prev[:, left + shift:right + shift]
+    # Reduce over tile rows first (contiguous inner axes), channels last on the small result
+    segments = np.logical_and.reduceat(equal, np.arange(0, height, tile), axis=0).all(axis=2)  # (tile rows, cols)
+    moving = (segments.mean(axis=1) >= MIN_MATCH_RATIO) & mask.any(axis=1)
+    r0, r1 = _longest_run(moving)
+    if r1 == r0:
+        return None
+    c0, c1 = _longest_run(segments[r0:r1].mean(axis=0) >= MIN_MATCH_RATIO)
+    if c1 - c0 < tile:
+        return None
+    y, h = r0 * tile, min(height, r1 * tile) - r0 * tile
+    dst_x, w = left + c0, c1 - c0
+    return (dst_x + shift, y, w, h, dst_x, y)
+
+
+def find_copy_rect(prev, cur, mask, tile: int) -> Optional[CopyRect]:
+    """Copy rect (vertical scroll first, then horizontal) turning most of prev into cur."""
+    if not mask.any():
+        return None
+    shift = _estimate_shift(prev, cur, mask, tile, axis=0)
+    if shift:
+        copy = _verify_vertical_copy(prev, cur, mask, tile, shift)
+        if copy is not None:
+            return copy
+    shift = _estimate_shift(prev, cur, mask, tile, axis=1)
+    if shift:
+        return _verify_horizontal_copy(prev, cur, mask, tile, shift)
+    return None
+
+
+def apply_copy(array, copy: CopyRect):
+    """New array: `array` with the copy rect applied (what the client canvas will show)."""
+    src_x, src_y, w, h, dst_x, dst_y = copy
+    predicted = array.copy()
+    predicted[dst_y:dst_y + h, dst_x:dst_x + w] = array[src_y:src_y + h, src_x:src_x + w]
+    return predicted
@@ -0,0 +1,119 @@
+# Ghost Shell Pixel Frames
+# Zero-copy frame object: a numpy view over the capture backend's own buffer,
+# tagged with its pixel format.
+#
+# mss hands out BGRA, DXcam BGR; cv2.imencode and FFmpeg accept both directly,
+# so a frame can go from capture to encoder without PIL and without a color
+# conversion. PIL Images are still accepted everywhere for the window backends
+# (PrintWindow, WGC) that produce them.
+
+from typing import Any, Tuple
+
+from PIL import Image
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+    cv2 = None
+
+# pixel format -> channels
+PIXEL_FORMATS = {"BGRA": 4, "BGR": 3, "RGB": 3}
+
+
+class PixelFrame:
+    """An HxWxC uint8 array (possibly a strided view) plus its pixel format."""
+
+    __slots__ = ("array", "pixel_format")
+
+    def __init__(self, array, pixel_format: str):
+        channels = PIXEL_FORMATS.get(pixel_format)
+        if channels is None:
+            raise ValueError(f"Unknown pixel format '{pixel_format}'. Use one of {sorted(PIXEL_FORMATS)}")
+        if array.ndim != 3 or array.shape[2] != channels:
+            raise ValueError(f"{pixel_format} frame needs shape (h, w, {channels}), got {array.shape}")
+        self.array = array
+        self.pixel_format = pixel_format
+
+    @classmethod
+    def from_mss(cls, sct_img) -> "PixelFrame":
+        """Wrap an mss ScreenShot without copying (mss allocates a fresh buffer per grab)."""
+        width, height = sct_img.size
+        return cls(np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(height, width, 4), "BGRA")
+
+    @classmethod
+    def from_pil(cls, image: Image.Image) -> "PixelFrame":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return cls(np.asarray(image), "RGB")
+
+    @property
+    def width(self) -> int:
+        return self.array.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.array.shape[0]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), same as PIL's Image.size."""
+        return self.array.shape[1], self.array.shape[0]
+
+    @property
+    def is_contiguous(self) -> bool:
+        return self.array.flags["C_CONTIGUOUS"]
+
+    def to_bgr(self):
+        """BGR or BGRA array for cv2 (which drops alpha itself). Converts only RGB input."""
+        if self.pixel_format == "RGB":
+            if CV2_AVAILABLE:
+                return cv2.cvtColor(self.array, cv2.COLOR_RGB2BGR)
+            return np.ascontiguousarray(self.array[:, :, ::-1])
+        return self.array
+
+    def to_rgb(self):
+        """Contiguous RGB array (one conversion unless already RGB)."""
+        if self.pixel_format == "RGB":
+            return np.ascontiguousarray(self.array)
+        if CV2_AVAILABLE:
+            code = cv2.COLOR_BGRA2RGB if self.pixel_format == "BGRA" else cv2.COLOR_BGR2RGB
+            return cv2.cvtColor(self.array, code)
+        return np.ascontiguousarray(self.array[:, :, 2::-1])
+
+    def to_pil(self) -> Image.Image:
+        """PIL Image for legacy consumers (one conversion)."""
+        return Image.fromarray(self.to_rgb(), "RGB")
+
+    def resized(self, width: int, height: int) -> "PixelFrame":
+        """Downscaled copy in the same pixel format (area averaging keeps text legible)."""
+        if (width, height) == self.size:
+            return self
+        if CV2_AVAILABLE:
+            return PixelFrame(cv2.resize(self.array, (width, height), interpolation=cv2.INTER_AREA), self.pixel_format)
+        image = self.to_pil().resize((width, height), Image.BOX)
+        return PixelFrame.from_pil(image) if self.pixel_format == "RGB" else PixelFrame(np.asarray(image)[:, :, ::-1], "BGR")
+
+
+def as_pixel_frame(image: Any) -> PixelFrame:
+    """Accept a PixelFrame, PIL Image, or BGR/BGRA numpy array (cv2 convention)."""
+    if isinstance(image, PixelFrame):
+        return image
+    if isinstance(image, Image.Image):
+        return PixelFrame.from_pil(image)
+    return PixelFrame(image, "BGRA" if image.shape[2] == 4 else "BGR")
+
+
+def to_pil_image(image: Any) -> Image.Image:
+    """PIL Image from any supported frame type; PIL input is returned unchanged."""
+    if isinstance(image, Image.Image):
+        return image
+    return as_pixel_frame(image).to_pil()
@@ -0,0 +1,115 @@
+# Ghost Shell Per-Client Send Queue
+# The /stream loop no longer awaits the socket. It offers frames to the client's
+# sender, whose single frame slot is "latest wins": a newer frame replaces one
+# that has not gone out yet (counted as dropped), so a slow client falls behind
+# by at most one frame instead of queueing stale JPEGs in its TCP buffer, and the
+# capture/command side never waits for it.
+#
+# Control messages (command results, lock state, keepalives) have their own
+# queue and always go out before the next frame: a click acknowledgement never
+# waits behind a 300 KB JPEG that is only queued or still being encoded. (A frame
+# already being written still has to finish - one socket, one byte stream.)
+#
+# The slot holds the frame, not encoded bytes: deltas and tile-cache references
+# are built by the send callback against what this client really received.
+#
+# [PIPELINE] This is the transmit stage: slot_wait (offered -> picked up) and
+# send_time (per-client encode + socket write) are exported with the hub's
+# capture/encode stage timings.
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from latency_stats import LatencyStats
+from metrics import get_metrics
+
+
+def is_connection_closed(error: BaseException) -> bool:
+    """WebSocketDisconnect, ConnectionClosed, 'Cannot call send once a close message has been sent'..."""
+    return "disconnect" in type(error).__name__.lower() or "close" in str(error).lower()
+
+
+class ClientSender:
+    """Outgoing side of one connection: control messages first, then the newest frame."""
+
+    def __init__(self, send_json: Callable[[dict], Awaitable[Any]],
+                 send_frame: Callable[..., Awaitable[bool]]):
+        self._send_json = send_json
+        self._send_frame = send_frame  # (*frame_args) -> True if something was sent
+        self._control = deque()
+        self._frame: Optional[tuple] = None
+        self._wakeup = asyncio.Event()
+        self.last_frame_at = time.time()
+        self.frames_offered = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.control_sent = 0
+        self.max_control_wait = 0.0  # Seconds a control message waited for the socket
+        self._frame_offered_at = 0.0
+        metrics = get_metrics()
+        self.slot_wait = LatencyStats(histogram=metrics.histogram(  # Frame offered -> picked up by the send loop
+            "send_queue_wait_seconds", "Frame waiting in a client's send slot"))
+        self.send_time = LatencyStats(histogram=metrics.histogram(  # send_frame callback, frames actually sent
+            "send_seconds", "Per-client encode and socket write of a sent frame"))
+        self._sent_counter = metrics.counter("frames_sent_total", "Frames sent to clients, all sessions")
+        self._dropped_counter = metrics.counter("frames_dropped_total", "Frames replaced in a send slot before going out")
+
+    def send_control(self, message: dict):
+        """Queue a JSON control message; it goes out before any pending frame."""
+        self._control.append((message, time.perf_counter()))
+        self._wakeup.set()
+
+    def offer_frame(self, *frame_args):
+        """Make these the next frame arguments, replacing (dropping) an unsent frame."""
+        self.frames_offered += 1
+        if self._frame is not None:
+            self.frames_dropped += 1
+            self._dropped_counter.inc()
+        self._frame = frame_args
+        self._frame_offered_at = time.perf_counter()
+        self._wakeup.set()
+
+    async def flush_control(self):
+        """Send queued control messages now (the frame callback calls this after encoding)."""
+        while self._control:
+            message, queued_at = self._control.popleft()
+            await self._send_json(message)
+            self.control_sent += 1
+            self.max_control_wait = max(self.max_control_wait, time.perf_counter() - queued_at)
+
+    async def run(self):
+        """Drain both queues until the connection closes (raises the closing error)."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                await self.flush_control()
+                if self._frame is None:
+                    break
+                frame_args, self._frame = self._frame, None
+                send_start = time.perf_counter()
+                self.slot_wait.add(send_start - self._frame_offered_at)
+                try:
+                    if await self._send_frame(*frame_args):
+                        self.frames_sent += 1
+                        self._sent_counter.inc()
+                        self.last_frame_at = time.time()
+                        self.send_time.add(time.perf_counter() - send_start)
+                except Exception as e:
+                    if is_connection_closed(e):
+                        raise
+                    print(f"[SENDER] Frame send failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "frames_offered": self.frames_offered,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "control_sent": self.control_sent,
+            "control_queued": len(self._control),
+            "max_control_wait_ms": round(self.max_control_wait * 1000, 1),
+            "slot_wait": self.slot_wait.stats(),
+            "send": self.send_time.stats(),
+        }
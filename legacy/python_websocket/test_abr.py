@@ -0,0 +1,67 @@
+"""
+Checks for abr.py (pytest): step-ups are capped by the bandwidth measured when the link was the bottleneck.
+"""
+import heapq
+import time
+
+from abr import ABR_LEVELS, AbrController
+
+FRAME_BYTES = 20_000  # Per frame at scale 1.0
+ONE_WAY = 0.01        # Seconds of propagation each way
+CLIENT_HOLD = 0.005   # Received -> drawn on the client
+
+
+def simulate(link_rate, start_index, seconds=30.0):
+    """Frames at the controller's level fps over a FIFO link of link_rate bytes/s. Returns the controller."""
+    abr = AbrController()
+    abr.index = start_index
+    start = time.monotonic()  # The controller's level hold starts at construction
+    events = [(start, 0, "send", None)]  # (time, order, kind, payload)
+    order, seq, link_free_at, now = 1, 0, start, start
+    while events and now < start + seconds:
+        now, _, kind, payload = heapq.heappop(events)
+        if kind == "send":
+            seq += 1
+            size = round(FRAME_BYTES * abr.level.scale ** 2)
+            abr.on_sent(seq, size, now, now)
+            link_free_at = max(now, link_free_at) + size / link_rate
+            heapq.heappush(events, (link_free_at + ONE_WAY + CLIENT_HOLD + ONE_WAY, order, "ack", seq))
+            heapq.heappush(events, (now + 1.0 / abr.level.fps, order + 1, "send", None))
+            order += 2
+        else:
+            abr.on_ack(payload, now=now, client_hold=CLIENT_HOLD)
+    return abr
+
+
+def test_fast_link_steps_up_to_the_top():
+    abr = simulate(link_rate=10_000_000, start_index=2)
+    assert abr.index == 0
+    assert abr.bandwidth is None
+    assert abr.capped_upgrades == 0
+
+
+def test_step_up_beyond_the_link_is_not_repeated():
+    # Level 2 (20 fps) needs 400 KB/s, level 1 (30 fps) 600 KB/s: the link carries 500
+    assert ABR_LEVELS[2].fps == 20 and ABR_LEVELS[1].fps == 30
+    abr = simulate(link_rate=500_000, start_index=2)
+    assert abr.index == 2
+    # It tried level 1 once, measured the link there, and stepped back down
+    assert abr.upgrades == 1 and abr.downgrades == 1
+    assert abr.bandwidth is not None and 450_000 < abr.bandwidth < 550_000
+    assert abr.capped_upgrades > 0
+
+
+def test_without_acks_only_latency_decides():
+    abr = AbrController()
+    abr.index = 2
+    start = time.monotonic()
+    for seq in range(1, 400):
+        now = start + seq * 0.05
+        abr.on_sent(seq, FRAME_BYTES, now, now + 0.001)
+    assert abr.bandwidth is None
+    assert abr.index == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
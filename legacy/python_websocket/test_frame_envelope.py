@@ -0,0 +1,86 @@
+"""
+Checks for frame_envelope.py (pytest): the v2 header layout ghost_client.html parses, meta framing
+and MetaTracker.
+"""
+import json
+import os
+import re
+import struct
+
+from frame_envelope import (ENVELOPE_MAGIC, FLAG_KEYFRAME, FLAG_META, FORMAT_CODES, HEADER_SIZE, MetaTracker,
+                            pack_envelope, unpack_envelope)
+
+CLIENT_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ghost_client.html")
+CAPTURED, ENCODED, SENT = 1_700_000_000.125, 1_700_000_000.150, 1_700_000_000.175
+
+
+def client_field(message: bytes, fmt: str, offset: int):
+    """One little-endian field read the way parseEnvelope() does with a DataView."""
+    return struct.unpack_from("<" + fmt, message, offset)[0]
+
+
+def test_header_is_44_bytes_like_the_client():
+    assert HEADER_SIZE == 44
+    with open(CLIENT_HTML, encoding="utf-8") as f:
+        html = f.read()
+    assert int(re.search(r"ENVELOPE_HEADER_SIZE = (\d+)", html).group(1)) == HEADER_SIZE
+    assert int(re.search(r"ENVELOPE_MAGIC = (0x[0-9A-Fa-f]+)", html).group(1), 16) == \
+        struct.unpack("<I", ENVELOPE_MAGIC)[0]
+
+
+def test_fields_at_the_offsets_the_client_reads():
+    payload = b"\xff\xd8jpeg"
+    message = pack_envelope("h264", payload, 123456, CAPTURED, 1920, 1080, keyframe=True,
+                            sent_at=SENT, encoded_at=ENCODED)
+    assert message[:4] == ENVELOPE_MAGIC
+    assert client_field(message, "B", 4) == 2
+    assert client_field(message, "B", 5) == FORMAT_CODES["h264"]
+    assert client_field(message, "H", 6) == FLAG_KEYFRAME
+    assert client_field(message, "I", 8) == 123456
+    assert client_field(message, "d", 12) == CAPTURED * 1000
+    assert client_field(message, "d", 20) == SENT * 1000
+    assert client_field(message, "H", 28) == 1920
+    assert client_field(message, "H", 30) == 1080
+    assert client_field(message, "I", 32) == 0
+    assert client_field(message, "d", 36) == ENCODED * 1000
+    assert message[HEADER_SIZE:] == payload
+
+
+def test_round_trip_without_meta():
+    message = pack_envelope("jpeg", b"frame", 7, CAPTURED, 640, 480, sent_at=SENT)
+    envelope = unpack_envelope(message)
+    assert envelope["meta"] is None
+    assert envelope["keyframe"] is False
+    assert (envelope["format"], envelope["seq"], envelope["width"], envelope["height"]) == ("jpeg", 7, 640, 480)
+    assert envelope["encoded_at"] == envelope["sent_at"] == SENT  # encoded_at defaults to sent_at
+    assert bytes(envelope["payload"]) == b"frame"
+
+
+def test_round_trip_with_meta():
+    meta = {"window": "编辑器 - main.py", "encoder": "JPEG", "abr": {"level": 1}}
+    message = pack_envelope("tiles", b"GTIL...", 8, CAPTURED, 640, 480, meta=meta, sent_at=SENT,
+                            encoded_at=ENCODED)
+    meta_length = client_field(message, "I", 32)
+    assert client_field(message, "H", 6) == FLAG_META
+    assert json.loads(message[HEADER_SIZE:HEADER_SIZE + meta_length].decode("utf-8")) == meta
+    envelope = unpack_envelope(message)
+    assert envelope["meta"] == meta
+    assert envelope["encoded_at"] == ENCODED
+    assert bytes(envelope["payload"]) == b"GTIL..."
+
+
+def test_meta_tracker_returns_only_changes():
+    tracker = MetaTracker()
+    meta = {"window": "Editor", "encoder": "JPEG"}
+    assert tracker.changed(meta) == meta
+    assert tracker.changed(dict(meta)) is None
+    changed = {**meta, "window": "Terminal"}
+    assert tracker.changed(changed) == changed
+    assert tracker.changed(changed) is None
+    tracker.reset()  # E.g. a reconnect: the client has nothing
+    assert tracker.changed(changed) == changed
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,49 @@
+"""
+Checks for metrics.py (pytest): the instrumentation overhead counts recordings, not counter values.
+"""
+import metrics
+from metrics import MetricsRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def simulate_stream(monkeypatch, seconds=6, fps=30, frame_bytes=300_000):
+    clock = FakeClock()
+    monkeypatch.setattr(metrics.time, "monotonic", clock)
+    registry = MetricsRegistry()
+    frames = registry.frame_counter("frames_captured_total", "Frames")
+    sent_bytes = registry.counter("bytes_sent_total", "Bytes")
+    capture = registry.histogram("capture_seconds", "Capture")
+    for _ in range(seconds * fps):
+        clock.now += 1.0 / fps
+        frames.inc()
+        capture.observe(0.005)
+        sent_bytes.inc(frame_bytes)
+    return registry
+
+
+def test_byte_counters_count_as_one_recording(monkeypatch):
+    registry = simulate_stream(monkeypatch)
+    overhead = registry.overhead()
+    # frames.inc + capture.observe + bytes.inc
+    assert overhead["recordings_per_frame"] == 3.0
+    assert overhead["overhead_pct"] is not None
+    assert overhead["overhead_pct"] < metrics.OVERHEAD_BUDGET_PCT
+
+
+def test_overhead_needs_a_frame_counter(monkeypatch):
+    registry = MetricsRegistry()
+    registry.counter("bytes_sent_total", "Bytes").inc(300_000)
+    assert registry.overhead()["overhead_pct"] is None
+    assert registry.overhead()["recordings_per_frame"] == 0.0
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
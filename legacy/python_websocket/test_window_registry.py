@@ -0,0 +1,86 @@
+"""
+Checks for window_registry.py (pytest) against FakeWindowProvider: TTL caching, hwnd pinning,
+closed windows and the miss-refresh throttle.
+"""
+import pytest
+
+import window_registry
+from window_registry import (MISS_REFRESH_INTERVAL, REGISTRY_TTL, FakeWindow, FakeWindowProvider,
+                             WindowRegistry, window_hwnd)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(window_registry.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def provider():
+    return FakeWindowProvider([FakeWindow(101, "Editor"), FakeWindow(102, "Terminal")])
+
+
+def test_lookups_within_ttl_enumerate_once(clock, provider):
+    registry = WindowRegistry(provider)
+    for _ in range(5):
+        assert window_hwnd(registry.find("Editor")) == 101
+        assert window_hwnd(registry.get(102)) == 102
+        clock.now += REGISTRY_TTL / 10
+    assert provider.enumerations == 1
+    clock.now += REGISTRY_TTL
+    registry.find("Editor")
+    assert provider.enumerations == 2
+
+
+def test_pinned_hwnd_survives_a_title_change(clock, provider):
+    registry = WindowRegistry(provider)
+    hwnd = window_hwnd(registry.find("Editor"))
+    provider.windows[hwnd].title = "Editor - main.py"
+    clock.now += 1.0
+    # The lock follows the hwnd: it still resolves, without re-enumerating
+    assert registry.get(hwnd) is provider.windows[hwnd]
+    assert provider.enumerations == 1
+    clock.now += REGISTRY_TTL
+    assert registry.find("Editor - main.py") is provider.windows[hwnd]
+    assert registry.get(hwnd).title == "Editor - main.py"
+
+
+def test_closed_hwnd_invalidates_the_table(clock, provider):
+    registry = WindowRegistry(provider)
+    assert registry.get(101) is not None
+    provider.close(101)
+    assert registry.get(101) is None
+    assert registry.invalidations == 1
+    # Stale now: the next lookup re-enumerates before the TTL is up
+    assert registry.find("Terminal") is not None
+    assert provider.enumerations == 2
+    assert registry.stats()["windows"] == 1
+
+
+def test_misses_re_enumerate_at_most_once_per_interval(clock, provider):
+    registry = WindowRegistry(provider)
+    assert registry.find("Browser") is None  # Table is fresh: no second enumeration
+    assert provider.enumerations == 1
+    clock.now += MISS_REFRESH_INTERVAL + 0.01
+    assert registry.find("Browser") is None
+    assert registry.find("Browser") is None
+    assert provider.enumerations == 2
+    # A window opened since the last enumeration is found once the interval has passed
+    provider.add(FakeWindow(103, "Browser"))
+    assert registry.find("Browser") is None
+    clock.now += MISS_REFRESH_INTERVAL + 0.01
+    assert window_hwnd(registry.find("Browser")) == 103
+    assert provider.enumerations == 3
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
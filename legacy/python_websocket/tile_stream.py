@@ -0,0 +1,387 @@
+# Ghost Shell Tile Streaming (dirty regions)
+# Typing in an editor changes a few hundred pixels; re-encoding the whole window
+# for that wastes encode time and bandwidth. The frame is split into fixed tiles,
+# tiles are compared against the frame the client already has, and only the
+# dirty ones are JPEG-encoded and sent as one batched binary message.
+#
+# Scrolling is sent as a copy-rect instruction (see motion_detect.py) followed by
+# the tiles that still differ, i.e. roughly the newly exposed strip.
+#
+# Tile cache: IDE frames often repeat exact content (switching tabs back, reopening
+# a panel, a blinking caret). The server mirrors a bounded cache of the tiles each
+# client holds (TileCache, keyed by tile digest) and sends a 6-byte reference
+# instead of the pixels on a hit. The server assigns the cache slot of every tile
+# it sends, so the client only stores what it is told and never evicts on its own.
+#
+# Message layout (little endian):
+#   header: magic 'GTIL', frame width u16, frame height u16, tile size u16,
+#           copy count u16, ref count u16, rect count u16
+#   copies: src x, src y, w, h, dst x, dst y (u16 each) - applied first, in order
+#   refs:   x u16, y u16, cache slot u16 - cached tile drawn at (x, y)
+#   rects:  x u16, y u16, w u16, h u16, slot count u16, JPEG length u32,
+#           slots (u16 each, tiles of the rect row by row), JPEG bytes - repeated
+# Adjacent dirty tiles are merged into larger rects to save JPEG headers.
+# A JPEG full frame starts with FF D8, so the client can tell the two apart.
+
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from frame_diff import comparable_rows, frame_digest
+from motion_detect import MOTION_MIN_DIRTY_RATIO, apply_copy, find_copy_rect
+from pixel_frame import PixelFrame, as_pixel_frame, np
+
+TILE_MAGIC = b"GTIL"
+TILE_SIZE = 64
+# Above this share of dirty area a full frame is cheaper than tiles
+MAX_DIRTY_RATIO = 0.5
+# Cached tiles per client (64x64 RGBA bitmaps: ~32 MB in the browser)
+TILE_CACHE_SIZE = 2048
+TILE_CACHE_POLICIES = ("lru", "fifo")
+
+_BATCH_HEADER = struct.Struct("<4sHHHHHH")
+_COPY_RECT = struct.Struct("<HHHHHH")
+_TILE_REF = struct.Struct("<HHH")
+_RECT_HEADER = struct.Struct("<HHHHHI")
+
+Rect = Tuple[int, int, int, int]  # x, y, w, h in pixels
+Tile = Tuple[int, int]  # tile row, tile col
+
+
+def dirty_tile_mask(prev: PixelFrame, cur: PixelFrame, tile: int = TILE_SIZE) -> Optional[Any]:
+    """Boolean (tile rows, tile cols) mask of tiles that differ, or None if the frames are not comparable."""
+    if prev.array.shape != cur.array.shape or prev.pixel_format != cur.pixel_format:
+        return None
+    height, width, channels = cur.array.shape
+    prev_rows, cur_rows, word = comparable_rows(prev.array, cur.array, tile)
+    diff = prev_rows != cur_rows
+
+    tile_rows = -(-height // tile)
+    tile_cols = -(-width // tile)
+    mask = np.zeros((tile_rows, tile_cols), dtype=bool)
+    # Cheap pass over rows first: only bands that changed get the per-column reduction
+    changed_rows = diff.any(axis=1)
+    changed_bands = np.logical_or.reduceat(changed_rows, np.arange(0, height, tile))
+    col_starts = np.arange(0, diff.shape[1], tile * channels // word)
+    for band in np.flatnonzero(changed_bands):
+        band_cols = diff[band * tile:(band + 1) * tile].any(axis=0)
+        mask[band] = np.logical_or.reduceat(band_cols, col_starts)
+    return mask
+
+
+def merge_tiles(mask, tile: int, width: int, height: int) -> List[Rect]:
+    """Merge dirty tiles into rects: horizontal runs, then identical runs on consecutive rows."""
+    rects: List[Rect] = []
+    open_runs = {}  # (col start, col end) -> index in rects, for runs ending on the previous row
+    for row in range(mask.shape[0]):
+        cols = np.flatnonzero(mask[row])
+        runs = []
+        if len(cols):
+            breaks = np.flatnonzero(np.diff(cols) > 1)
+            starts = np.concatenate(([cols[0]], cols[breaks + 1]))
+            ends = np.concatenate((cols[breaks], [cols[-1]]))
+            runs = list(zip(starts.tolist(), ends.tolist()))
+        next_open = {}
+        for start, end in runs:
+            x = start * tile
+            y = row * tile
+            w = min(width, (end + 1) * tile) - x
+            h = min(height, y + tile) - y
+            index = open_runs.get((start, end))
+            if index is not None:
+                rx, ry, rw, rh = rects[index]
+                rects[index] = (rx, ry, rw, rh + h)  # Extend the rect from the row above
+            else:
+                index = len(rects)
+                rects.append((x, y, w, h))
+            next_open[(start, end)] = index
+        open_runs = next_open
+    return rects
+
+
+def rect_tiles(rect: Rect, tile: int) -> List[Tile]:
+    """Tiles covered by a tile-aligned rect, row by row (the order of its cache slots)."""
+    x, y, w, h = rect
+    return [(row, col) for row in range(y // tile, -(-(y + h) // tile))
+            for col in range(x // tile, -(-(x + w) // tile))]
+
+
+def _encode_rects(jpeg, frame: PixelFrame, mask, tile: int) -> list:
+    """[(x, y, w, h, jpeg_bytes)] for the merged dirty tiles of mask."""
+    if not mask.any():
+        return []
+    width, height = frame.size
+    return [(x, y, w, h, jpeg.encode(PixelFrame(frame.array[y:y + h, x:x + w], frame.pixel_format)))
+            for x, y, w, h in merge_tiles(mask, tile, width, height)]
+
+
+class TileCache:
+    """Server-side mirror of one client's tile cache: tile digest -> cache slot.
+
+    Lives as long as the client's connection; the client keeps the decoded tiles.
+    Not thread-safe: one session serializes its updates in order.
+    """
+
+    def __init__(self, capacity: int = TILE_CACHE_SIZE, policy: str = "lru"):
+        if policy not in TILE_CACHE_POLICIES:
+            raise ValueError(f"Unknown tile cache policy '{policy}'. Use one of {TILE_CACHE_POLICIES}")
+        if not 0 < capacity <= 0xFFFF:
+            raise ValueError(f"Tile cache capacity must be 1..65535, got {capacity}")
+        self.capacity = capacity
+        self.policy = policy
+        self._slots: "OrderedDict[int, int]" = OrderedDict()  # Eviction order: oldest first
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evictions = 0
+
+    def lookup(self, digest: int) -> Optional[int]:
+        """Slot holding this tile on the client, or None."""
+        slot = self._slots.get(digest)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.policy == "lru":
+            self._slots.move_to_end(digest)
+        return slot
+
+    def store(self, digest: int) -> int:
+        """Slot the client must store this (just sent) tile in, evicting if full."""
+        slot = self._slots.get(digest)
+        if slot is not None:
+            # Same tile twice in one update: stored again in the same slot
+            if self.policy == "lru":
+                self._slots.move_to_end(digest)
+            return slot
+        if len(self._slots) < self.capacity:
+            slot = len(self._slots)
+        else:
+            _, slot = self._slots.popitem(last=False)
+            self.evictions += 1
+        self._slots[digest] = slot
+        self.stored += 1
+        return slot
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "capacity": self.capacity,
+            "policy": self.policy,
+            "entries": len(self._slots),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stored": self.stored,
+            "evictions": self.evictions,
+        }
+
+
+class TileUpdate:
+    """Dirty tiles between two frames, shared by every client of a capture channel.
+
+    Tiles that were sent recently are not pre-encoded (`lazy`): most clients should
+    have them cached. to_bytes(cache) builds one client's message and may JPEG-encode
+    its misses, so call it off the event loop.
+    """
+
+    def __init__(self, frame: PixelFrame, tile_size: int, copies: list, rects: list,
+                 digests: Optional[Dict[Tile, int]], lazy, jpeg):
+        self.frame = frame
+        self.tile_size = tile_size
+        self.copies = copies
+        self.rects = rects  # Pre-encoded [(x, y, w, h, jpeg_bytes)]
+        self.digests = digests  # Every dirty tile's digest, None without tile hashing
+        self.lazy = lazy  # Tile mask of dirty tiles not in rects
+        self._jpeg = jpeg
+        self._lock = threading.Lock()
+        self._plain: Optional[bytes] = None
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.frame.size
+
+    def to_bytes(self, cache: Optional[TileCache] = None) -> bytes:
+        """Message for a client with this tile cache (None: no cache, shared bytes)."""
+        if cache is None or self.digests is None:
+            with self._lock:
+                if self._plain is None:
+                    rects = self.rects + _encode_rects(self._jpeg, self.frame, self.lazy, self.tile_size)
+                    self._plain = self._pack(rects, [], None)
+                return self._plain
+
+        tile = self.tile_size
+        refs = []
+        hit_tiles = set()
+        for (row, col), digest in self.digests.items():
+            slot = cache.lookup(digest)
+            if slot is not None:
+                refs.append((col * tile, row * tile, slot))
+                hit_tiles.add((row, col))
+        rects = self.rects
+        if hit_tiles or self.lazy.any():
+            # Rects with a cached tile are re-encoded without it, lazy misses are encoded
+            missing = self.lazy.copy()
+            rects = []
+            for rect in self.rects:
+                tiles = rect_tiles(rect[:4], tile)
+                if hit_tiles.isdisjoint(tiles):
+                    rects.append(rect)
+                else:
+                    for row_col in tiles:
+                        missing[row_col] = True
+            for row_col in hit_tiles:
+                missing[row_col] = False
+            rects = rects + _encode_rects(self._jpeg, self.frame, missing, tile)
+        slots = [[cache.store(self.digests[row_col]) for row_col in rect_tiles(rect[:4], tile)] for rect in rects]
+        return self._pack(rects, refs, slots)
+
+    def _pack(self, rects: list, refs: list, slots: Optional[list]) -> bytes:
+        width, height = self.frame.size
+        parts = [_BATCH_HEADER.pack(TILE_MAGIC, width, height, self.tile_size,
+                                    len(self.copies), len(refs), len(rects))]
+        for copy in self.copies:
+            parts.append(_COPY_RECT.pack(*copy))
+        for ref in refs:
+            parts.append(_TILE_REF.pack(*ref))
+        for i, (x, y, w, h, data) in enumerate(rects):
+            rect_slots = slots[i] if slots else ()
+            parts.append(_RECT_HEADER.pack(x, y, w, h, len(rect_slots), len(data)))
+            if rect_slots:
+                parts.append(struct.pack(f"<{len(rect_slots)}H", *rect_slots))
+            parts.append(data)
+        return b"".join(parts)
+
+
+class TileEncoder:
+    """Encodes the change between two frames as a batch of dirty-tile JPEGs."""
+
+    def __init__(self, tile_size: int = TILE_SIZE, quality: int = 85, max_dirty_ratio: float = MAX_DIRTY_RATIO,
+                 detect_motion: bool = True, recent_tiles: int = TILE_CACHE_SIZE):
+        from encoders import JPEGEncoder
+        self.tile_size = tile_size
+        self.max_dirty_ratio = max_dirty_ratio
+        self.detect_motion = detect_motion
+        # Digests of recently sent tiles (0 = no tile hashing, no client caches)
+        self.recent_tiles = recent_tiles
+        self._recent: "OrderedDict[int, None]" = OrderedDict()
+        self._jpeg = JPEGEncoder(quality=quality)
+        self._lock = threading.Lock()  # Stats and recent tiles are shared by several capture threads
+        self.updates = 0
+        self.full_frames = 0  # Deltas refused (not comparable / too dirty)
+        self.rects = 0
+        self.copies = 0  # Updates that used a copy rect (scroll)
+        self.lazy_tiles = 0  # Dirty tiles left to the client caches
+        self.bytes = 0
+        self.encode_ms = 0.0
+
+    def _tile_digests(self, frame: PixelFrame, mask) -> Dict[Tile, int]:
+        tile = self.tile_size
+        array = frame.array
+        return {(row, col): frame_digest(np.ascontiguousarray(array[row * tile:(row + 1) * tile,
+                                                                    col * tile:(col + 1) * tile]))
+                for row, col in zip(*np.nonzero(mask))}
+
+    def _recently_sent(self, digests: Dict[Tile, int], shape):
+        """Mask of the tiles sent recently, then remember all of them as sent."""
+        recent = np.zeros(shape, dtype=bool)
+        with self._lock:
+            for row_col, digest in digests.items():
+                if digest in self._recent:
+                    recent[row_col] = True
+                    self._recent.move_to_end(digest)
+                else:
+                    self._recent[digest] = None
+            while len(self._recent) > self.recent_tiles:
+                self._recent.popitem(last=False)
+        return recent
+
+    def encode_update(self, prev_image: Any, image: Any) -> Optional[TileUpdate]:
+        """Tiles turning prev_image into image, or None if a full frame should be sent."""
+        start = time.perf_counter()
+        prev, cur = as_pixel_frame(prev_image), as_pixel_frame(image)
+        mask = dirty_tile_mask(prev, cur, self.tile_size)
+        copies = []
+        if mask is not None and self.detect_motion and mask.mean() >= MOTION_MIN_DIRTY_RATIO:
+            # [MOTION] Scrolled content: copy it on the client, send only what still differs
+            copy = find_copy_rect(prev.array, cur.array, mask, self.tile_size)
+            if copy is not None:
+                predicted = PixelFrame(apply_copy(prev.array, copy), prev.pixel_format)
+                residual = dirty_tile_mask(predicted, cur, self.tile_size)
+                if residual.sum() < mask.sum():
+                    mask, copies = residual, [copy]
+        digests = None
+        lazy = np.zeros_like(mask) if mask is not None else None
+        if mask is not None and self.recent_tiles:
+            # [TILE CACHE] Recently sent tiles are probably cached: they do not count as dirty
+            digests = self._tile_digests(cur, mask)
+            lazy = self._recently_sent(digests, mask.shape)
+        if mask is None or (mask & ~lazy).mean() > self.max_dirty_ratio:
+            with self._lock:
+                self.full_frames += 1
+            return None
+
+        rects = _encode_rects(self._jpeg, cur, mask & ~lazy, self.tile_size)
+        update = TileUpdate(cur, self.tile_size, copies, rects, digests, lazy, self._jpeg)
+
+        with self._lock:
+            self.updates += 1
+            self.rects += len(rects)
+            self.copies += len(copies)
+            self.lazy_tiles += int(lazy.sum())
+            self.bytes += sum(len(rect[4]) for rect in rects)
+            self.encode_ms += (time.perf_counter() - start) * 1000
+        return update
+
+    def stats(self) -> dict:
+        return {
+            "tile_size": self.tile_size,
+            "updates": self.updates,
+            "full_frames": self.full_frames,
+            "avg_rects": round(self.rects / self.updates, 1) if self.updates else 0,
+            "copy_rects": self.copies,
+            "lazy_tiles": self.lazy_tiles,
+            "avg_bytes": int(self.bytes / self.updates) if self.updates else 0,
+            "avg_encode_ms": round(self.encode_ms / self.updates, 2) if self.updates else 0.0,
+        }
+
+
+def decode_tile_update(payload: bytes):
+    """Parse a tile batch: ((width, height), copies, refs, [(x, y, w, h, slots, jpeg_bytes), ...]).
+
+    Used by tools/benchmarks.
+    """
+    magic, width, height, _, copy_count, ref_count, count = _BATCH_HEADER.unpack_from(payload, 0)
+    if magic != TILE_MAGIC:
+        raise ValueError("Not a tile update")
+    offset = _BATCH_HEADER.size
+    copies = []
+    for _ in range(copy_count):
+        copies.append(_COPY_RECT.unpack_from(payload, offset))
+        offset += _COPY_RECT.size
+    refs = []
+    for _ in range(ref_count):
+        refs.append(_TILE_REF.unpack_from(payload, offset))
+        offset += _TILE_REF.size
+    rects = []
+    for _ in range(count):
+        x, y, w, h, slot_count, length = _RECT_HEADER.unpack_from(payload, offset)
+        offset += _RECT_HEADER.size
+        slots = struct.unpack_from(f"<{slot_count}H", payload, offset)
+        offset += 2 * slot_count
+        rects.append((x, y, w, h, slots, payload[offset:offset + length]))
+        offset += length
+    return (width, height), copies, refs, rects
+
+
+# Module-level instance for easy import
+_tile_encoder: Optional[TileEncoder] = None
+
+def get_tile_encoder() -> TileEncoder:
+    """Get or create the global tile encoder."""
+    global _tile_encoder
+    if _tile_encoder is None:
+        _tile_encoder = TileEncoder()
+    return _tile_encoder
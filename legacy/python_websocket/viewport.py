@@ -0,0 +1,132 @@
+# Ghost Shell Client Viewport Scaling
+# A 4K window used to be encoded and shipped at full size to a 390 px wide phone,
+# which then threw most of the pixels away. Clients report their viewport (CSS
+# pixels) and devicePixelRatio; the server downscales every frame to fit
+# viewport x dpr before encoding (area filter, on a worker thread), shared by
+# every client with the same target size.
+#
+# The client then works in the coordinates of the frame it received. Inputs
+# carry that frame's size (frame_width/frame_height). A /stream session maps
+# x/y back to the source window with the transform its own Viewport used for
+# that size (two clients can get the same frame size from different windows).
+# Stateless /interact requests also carry the source size the frame was scaled
+# from (source_width/source_height). Inputs without sizes, or for an unscaled
+# frame, are left untouched.
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Downscaling by less than this is not worth the resize (and its blur)
+MIN_DOWNSCALE = 0.9
+MAX_DPR = 4.0
+MAX_TRANSFORMS = 8  # Recently sent frame sizes per session (frames in flight across a resize)
+
+
+class ViewTransform:
+    """Source (window) size <-> sent frame size."""
+
+    def __init__(self, source_size: Tuple[int, int], frame_size: Optional[Tuple[int, int]] = None):
+        self.source_size = tuple(source_size)
+        self.frame_size = tuple(frame_size or source_size)
+
+    @property
+    def scaled(self) -> bool:
+        return self.frame_size != self.source_size
+
+    def to_source(self, x: float, y: float) -> Tuple[int, int]:
+        """Frame coordinates -> source window coordinates."""
+        (source_w, source_h), (frame_w, frame_h) = self.source_size, self.frame_size
+        return round(x * source_w / frame_w), round(y * source_h / frame_h)
+
+    def stats(self) -> dict:
+        return {"source": list(self.source_size), "frame": list(self.frame_size)}
+
+
+class Viewport:
+    """A client's display area: CSS pixels x devicePixelRatio."""
+
+    def __init__(self, width: int = 0, height: int = 0, dpr: float = 1.0):
+        self.width = 0
+        self.height = 0
+        self.dpr = 1.0
+        # Frame size -> transform of the latest scaled frame this client got at that size
+        self._transforms: "OrderedDict[Tuple[int, int], ViewTransform]" = OrderedDict()
+        self.update(width, height, dpr)
+
+    def update(self, width, height, dpr=1.0) -> bool:
+        """Set the viewport from client-reported values; returns True if it changed."""
+        try:
+            width, height = max(0, int(width or 0)), max(0, int(height or 0))
+            dpr = min(MAX_DPR, max(1.0, float(dpr or 1.0)))
+        except (TypeError, ValueError):
+            return False
+        changed = (width, height, dpr) != (self.width, self.height, self.dpr)
+        self.width, self.height, self.dpr = width, height, dpr
+        return changed
+
+    @property
+    def known(self) -> bool:
+        return self.width > 0 and self.height > 0
+
+    def frame_size(self, source_w: int, source_h: int) -> Tuple[int, int]:
+        """Size to send a source_w x source_h frame at: fits the viewport, never upscales."""
+        if not self.known or source_w <= 0 or source_h <= 0:
+            return source_w, source_h
+        scale = min(self.width * self.dpr / source_w, self.height * self.dpr / source_h)
+        if scale >= MIN_DOWNSCALE:
+            return source_w, source_h
+        return max(1, round(source_w * scale)), max(1, round(source_h * scale))
+
+    def remember(self, transform: ViewTransform):
+        """Record a scaled frame sent to this client so its inputs can be mapped back."""
+        if not transform.scaled:
+            return
+        self._transforms[transform.frame_size] = transform
+        self._transforms.move_to_end(transform.frame_size)
+        while len(self._transforms) > MAX_TRANSFORMS:
+            self._transforms.popitem(last=False)
+
+    def remap(self, x, y, frame_width=None, frame_height=None) -> Tuple[int, int]:
+        """Source-window coordinates for an input at (x, y) on a frame of the given size this client got."""
+        size = _size(frame_width, frame_height)
+        transform = self._transforms.get(size) if size else None
+        if transform is None:
+            return x, y
+        return transform.to_source(x, y)
+
+    def remap_command(self, cmd: dict) -> dict:
+        """Copy of a WebSocket input command with x/y in source coordinates."""
+        if "x" not in cmd and "y" not in cmd:
+            return cmd
+        x, y = self.remap(cmd.get("x", 0), cmd.get("y", 0), cmd.get("frame_width"), cmd.get("frame_height"))
+        return {**cmd, "x": x, "y": y}
+
+    def stats(self) -> dict:
+        return {"width": self.width, "height": self.height, "dpr": self.dpr}
+
+
+def _size(width, height) -> Optional[Tuple[int, int]]:
+    """(width, height) as positive ints, or None."""
+    try:
+        size = (int(width), int(height))
+    except (TypeError, ValueError):
+        return None
+    return size if size[0] > 0 and size[1] > 0 else None
+
+
+def remap_input(x, y, frame_width=None, frame_height=None,
+                source_width=None, source_height=None) -> Tuple[int, int]:
+    """Source-window coordinates for a stateless input: the request names both sizes."""
+    frame_size, source_size = _size(frame_width, frame_height), _size(source_width, source_height)
+    if frame_size is None or source_size is None or frame_size == source_size:
+        return x, y
+    return ViewTransform(source_size, frame_size).to_source(x, y)
+
+
+def remap_command(cmd: dict) -> dict:
+    """Copy of an input command with x/y in source coordinates, from the sizes it carries."""
+    if "x" not in cmd and "y" not in cmd:
+        return cmd
+    x, y = remap_input(cmd.get("x", 0), cmd.get("y", 0), cmd.get("frame_width"), cmd.get("frame_height"),
+                       cmd.get("source_width"), cmd.get("source_height"))
+    return {**cmd, "x": x, "y": y}
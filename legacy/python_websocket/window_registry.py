@@ -0,0 +1,299 @@
+# Ghost Shell Window Registry
+# Every lookup used to enumerate the desktop: get_target_window() walked
+# gw.getAllWindows() on every capture tick of a locked stream, and each input
+# command called gw.getWindowsWithTitle() (EnumWindows + GetWindowText for every
+# top-level window). The registry enumerates once per TTL and answers lookups
+# from a hwnd-keyed table with a title index.
+#
+# Window objects are cached, not their geometry: pygetwindow reads title, rect
+# and visibility live from the hwnd, so coordinates are never stale. A cached
+# hwnd is checked with IsWindow() before it is returned; a dead hwnd or a title
+# miss invalidates the table (at most once per MISS_REFRESH_INTERVAL, so a
+# stream looking for a closed window does not enumerate every tick).
+#
+# Enumeration sits behind a WindowProvider; FakeWindowProvider serves scripted
+# windows so lookups and lock pinning can be checked without a desktop.
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+try:
+    import pygetwindow as gw
+    PYGETWINDOW_AVAILABLE = True
+except ImportError:
+    gw = None
+    PYGETWINDOW_AVAILABLE = False
+
+try:
+    import win32gui
+    WIN32_AVAILABLE = True
+except ImportError:
+    win32gui = None
+    WIN32_AVAILABLE = False
+
+REGISTRY_TTL = 2.0            # Seconds between routine re-enumerations
+MISS_REFRESH_INTERVAL = 0.25  # Minimum age before a lookup miss forces a re-enumeration
+MIN_LISTED_WIDTH = 100        # /windows and locked-title matching ignore slivers
+
+
+def window_hwnd(win) -> Optional[int]:
+    """hwnd of a pygetwindow (or fake) window object."""
+    return getattr(win, "_hWnd", None)
+
+
+class WindowProvider(ABC):
+    """Platform access used by the registry."""
+
+    name = "base"
+
+    @abstractmethod
+    def list_windows(self) -> list:
+        """All top-level windows (objects with _hWnd, title, left/top/width/height, visible)."""
+        pass
+
+    @abstractmethod
+    def is_window(self, hwnd: int) -> bool:
+        pass
+
+    @abstractmethod
+    def foreground_hwnd(self) -> Optional[int]:
+        pass
+
+
+class Win32WindowProvider(WindowProvider):
+    """pygetwindow enumeration + win32gui handle checks."""
+
+    name = "win32"
+
+    def list_windows(self) -> list:
+        if not PYGETWINDOW_AVAILABLE:
+            return []
+        return gw.getAllWindows()
+
+    def is_window(self, hwnd: int) -> bool:
+        if WIN32_AVAILABLE:
+            return bool(win32gui.IsWindow(hwnd))
+        return True
+
+    def foreground_hwnd(self) -> Optional[int]:
+        if not WIN32_AVAILABLE:
+            return None
+        return win32gui.GetForegroundWindow() or None
+
+
+class FakeWindow:
+    """Scripted window for FakeWindowProvider."""
+
+    def __init__(self, hwnd: int, title: str, left: int = 0, top: int = 0,
+                 width: int = 800, height: int = 600, visible: bool = True):
+        self._hWnd = hwnd
+        self.title = title
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.visible = visible
+        self.isMinimized = False
+
+    def activate(self):
+        pass
+
+    def restore(self):
+        pass
+
+    def __repr__(self):
+        return f"FakeWindow({self._hWnd}, {self.title!r})"
+
+
+class FakeWindowProvider(WindowProvider):
+    """In-memory desktop; counts enumerations so cache behaviour can be checked."""
+
+    name = "fake"
+
+    def __init__(self, windows: Optional[List[FakeWindow]] = None):
+        self.windows: Dict[int, FakeWindow] = {w._hWnd: w for w in windows or []}
+        self.foreground: Optional[int] = None
+        self.enumerations = 0
+
+    def add(self, win: FakeWindow) -> FakeWindow:
+        self.windows[win._hWnd] = win
+        return win
+
+    def close(self, hwnd: int):
+        self.windows.pop(hwnd, None)
+        if self.foreground == hwnd:
+            self.foreground = None
+
+    def list_windows(self) -> list:
+        self.enumerations += 1
+        return list(self.windows.values())
+
+    def is_window(self, hwnd: int) -> bool:
+        return hwnd in self.windows
+
+    def foreground_hwnd(self) -> Optional[int]:
+        return self.foreground
+
+
+class WindowRegistry:
+    """Cached hwnd -> window table with a title index."""
+
+    def __init__(self, provider: Optional[WindowProvider] = None, ttl: float = REGISTRY_TTL):
+        self.provider = provider or Win32WindowProvider()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._windows: Dict[int, object] = {}
+        self._titles: Dict[str, int] = {}  # Title at enumeration -> first hwnd with it
+        self._refreshed_at = 0.0
+        self._stale = True
+        self.enumerations = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        """Force the next lookup to re-enumerate (window opened/closed/renamed)."""
+        self._stale = True
+        self.invalidations += 1
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            if not force and not self._stale and time.monotonic() - self._refreshed_at < self.ttl:
+                return
+            try:
+                windows = self.provider.list_windows()
+            except Exception as e:
+                print(f"[WINDOWS] Enumeration failed: {e}")
+                windows = []
+            by_hwnd, titles = {}, {}
+            for win in windows:
+                hwnd = window_hwnd(win)
+                if hwnd is None:
+                    continue
+                by_hwnd[hwnd] = win
+                title = win.title
+                if title and title not in titles:
+                    titles[title] = hwnd
+            self._windows, self._titles = by_hwnd, titles
+            self._refreshed_at = time.monotonic()
+            self._stale = False
+            self.enumerations += 1
+
+    def _refresh_after_miss(self) -> bool:
+        """Re-enumerate for a lookup miss unless the table is very fresh."""
+        if time.monotonic() - self._refreshed_at < MISS_REFRESH_INTERVAL:
+            return False
+        self.refresh(force=True)
+        return True
+
+    def _alive(self, hwnd: Optional[int]):
+        win = self._windows.get(hwnd) if hwnd else None
+        if win is None:
+            return None
+        try:
+            if self.provider.is_window(hwnd):
+                return win
+        except Exception:
+            pass
+        self.invalidate()  # Closed since the last enumeration
+        return None
+
+    def get(self, hwnd: Optional[int]):
+        """Window object for hwnd, or None if it no longer exists."""
+        if not hwnd:
+            return None
+        self.refresh()
+        win = self._alive(hwnd)
+        if win is None and hwnd not in self._windows and self._refresh_after_miss():
+            win = self._alive(hwnd)  # Opened since the last enumeration
+        if win is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return win
+
+    def _match(self, title: str, exact_only: bool, listed_only: bool):
+        hwnd = self._titles.get(title)
+        win = self._alive(hwnd)
+        if win is not None and (not listed_only or self._listed(win)):
+            return win
+        if exact_only:
+            return None
+        # Case-insensitive substring, like gw.getWindowsWithTitle(); visible windows first
+        needle = title.upper()
+        fallback = None
+        for hwnd, win in list(self._windows.items()):
+            if needle not in (win.title or "").upper() or self._alive(hwnd) is None:
+                continue
+            if self._listed(win):
+                return win
+            if fallback is None and not listed_only:
+                fallback = win
+        return fallback
+
+    def find(self, title: Optional[str], exact_only: bool = False, listed_only: bool = False):
+        """Window by title: exact match first, then substring. None if not found.
+
+        listed_only restricts matches to windows list_windows() would show."""
+        if not title:
+            return None
+        self.refresh()
+        win = self._match(title, exact_only, listed_only)
+        if win is None and self._refresh_after_miss():
+            win = self._match(title, exact_only, listed_only)
+        if win is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return win
+
+    def foreground(self):
+        """The foreground window object, or None."""
+        try:
+            hwnd = self.provider.foreground_hwnd()
+        except Exception:
+            return None
+        return self.get(hwnd)
+
+    @staticmethod
+    def _listed(win) -> bool:
+        try:
+            return bool(win.title) and win.visible and win.width > MIN_LISTED_WIDTH
+        except Exception:
+            return False  # Closed while being inspected
+
+    def list_windows(self) -> list:
+        """Visible, titled, non-trivial windows (the /windows list)."""
+        self.refresh()
+        return [win for win in list(self._windows.values()) if self._listed(win)]
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "windows": len(self._windows),
+            "age_s": round(time.monotonic() - self._refreshed_at, 2) if self._refreshed_at else None,
+            "enumerations": self.enumerations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global singleton
+_window_registry: Optional[WindowRegistry] = None
+
+
+def get_window_registry() -> WindowRegistry:
+    """Get or create the global window registry."""
+    global _window_registry
+    if _window_registry is None:
+        _window_registry = WindowRegistry()
+    return _window_registry
+
+
+def set_window_registry(registry: WindowRegistry):
+    """Replace the global registry (e.g. with a FakeWindowProvider-backed one)."""
+    global _window_registry
+    _window_registry = registry
@@ -10,6 +10,7 @@ import numpy as np
 from typing import Optional
 import threading
 import queue
+import weakref
 
 # Audio dependencies
 AUDIO_AVAILABLE = False
@@ -28,6 +29,9 @@ except ImportError:
 from av import AudioFrame
 from aiortc import MediaStreamTrack
 
+# Tracks not yet garbage collected, for the audio queue depth metric
+_live_tracks = weakref.WeakSet()
+
 
 class SystemAudioTrack(MediaStreamTrack):
     """
@@ -43,6 +47,7 @@ class SystemAudioTrack(MediaStreamTrack):
         self._timestamp = 0
         self._samples_per_frame = 960  # 20ms at 48kHz (Opus standard)
         self._audio_queue = queue.Queue(maxsize=100)
+        _live_tracks.add(self)
         self._running = False
         self._stream = None
         self._p = None
@@ -248,6 +253,11 @@ class SystemAudioTrack(MediaStreamTrack):
         print("[Audio] Capture stopped")
 
 
+def audio_queue_depth() -> int:
+    """Deepest capture queue of the live audio tracks (chunks not yet sent)."""
+    return max((track._audio_queue.qsize() for track in list(_live_tracks)), default=0)
+
+
 # [FIX] Each WebRTC connection needs its own audio track instance
 # because aiortc calls track.stop() when connection closes,
 # which would kill a shared global track.
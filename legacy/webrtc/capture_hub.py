@@ -0,0 +1,320 @@
+# Ghost Shell Capture Hub
+# One capture loop per target (locked window / foreground / monitor region),
+# shared by every /stream, WebRTC and /capture consumer.
+#
+# Consumers never capture on their own: they subscribe to a target key and read
+# numbered frames from the channel's latest-frame slot. Adding viewers does not
+# add captures or encodes - each frame is encoded once per encoder and cached.
+#
+# Capture and encode run on a dedicated worker thread per channel, never on the
+# asyncio event loop. Finished frames are handed to the loop with
+# call_soon_threadsafe, so other WebSockets and HTTP handlers keep running.
+#
+# With a change detector, a capture identical to the last published frame is
+# dropped before encoding: no new seq, so no consumer encodes or sends anything.
+
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from metrics import get_metrics
+
+# (cache_key, encode_func) - encode_func(image) result is cached on the frame under cache_key
+FrameEncoder = Tuple[Hashable, Callable[[Any], Any]]
+
+
+class HubFrame:
+    """A captured frame published by a CaptureChannel.
+
+    `image` is whatever the capture function returned (PIL Image or numpy array).
+    Encoded payloads are cached per key so N consumers share one encode.
+    """
+
+    def __init__(self, seq: int, image: Any, window_title: Optional[str], captured_at: float):
+        self.seq = seq
+        self.image = image
+        self.window_title = window_title
+        self.captured_at = captured_at
+        self._encoded: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()  # Worker thread, event loop and /capture threadpool
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Return (width, height) for PIL images and numpy arrays alike."""
+        shape = getattr(self.image, "shape", None)
+        if shape is not None:
+            return shape[1], shape[0]
+        return self.image.size
+
+    def cached(self, cache_key: Hashable) -> Any:
+        """Encoded payload for cache_key if already computed, else None."""
+        return self._encoded.get(cache_key)
+
+    def encode(self, cache_key: Hashable, encode_func: Callable[[Any], Any]) -> Any:
+        """Return encode_func(image), computing it only once per cache_key."""
+        with self._lock:
+            if cache_key not in self._encoded:
+                self._encoded[cache_key] = encode_func(self.image)
+            return self._encoded[cache_key]
+
+
+def _add_ref(table: dict, refs: Dict[Hashable, int], entry: tuple):
+    """Register a (cache_key, func) entry in table and count one more user."""
+    cache_key, func = entry
+    table[cache_key] = func
+    refs[cache_key] = refs.get(cache_key, 0) + 1
+
+
+def _drop_ref(table: dict, refs: Dict[Hashable, int], entry: tuple):
+    """Undo one _add_ref(); the entry is removed with its last user."""
+    cache_key = entry[0]
+    count = refs.get(cache_key, 0) - 1
+    if count > 0:
+        refs[cache_key] = count
+    else:
+        refs.pop(cache_key, None)
+        table.pop(cache_key, None)
+
+
+class CaptureChannel:
+    """Owns the capture thread for one target and publishes into a latest-frame slot."""
+
+    def __init__(self, key: Hashable, capture_func: Callable, frame_interval: Callable[[], float],
+                 change_detector: Optional[Callable[[Any], Hashable]] = None):
+        self.key = key
+        self._capture_func = capture_func
+        self._frame_interval = frame_interval
+        self._change_detector = change_detector
+        self._last_digest: Optional[Hashable] = None
+        # Encoders run on the worker thread right after capture, before publishing. Counted
+        # per cache_key: an entry goes when the last subscription using it closes
+        self._encoders: Dict[Hashable, Callable[[Any], Any]] = {}
+        self._encoder_refs: Dict[Hashable, int] = {}
+        self.latest: Optional[HubFrame] = None
+        self.last_title: Optional[str] = None
+        self.seq = 0
+        self.subscribers = 0
+        self.captures = 0
+        self.failures = 0
+        self.unchanged = 0  # Captures dropped as identical to the latest frame
+        self.capture_ms = 0.0  # Last capture + pre-encode time
+        # [METRICS] Shared by all channels (/metrics)
+        metrics = get_metrics()
+        self._capture_histogram = metrics.histogram("capture_seconds", "Capture plus change detection per published frame")
+        self._encode_histogram = metrics.histogram("encode_seconds", "Hub pre-encode per published frame")
+        self._frames_counter = metrics.counter("frames_captured_total", "Frames captured and published")
+        self._unchanged_counter = metrics.counter("frames_unchanged_total", "Captures dropped as unchanged")
+        self.detect_ms = 0.0  # Last change-detection time
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._new_frame: Optional[asyncio.Future] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_encoder(self, encoder: Optional[FrameEncoder]):
+        if encoder is not None:
+            _add_ref(self._encoders, self._encoder_refs, encoder)
+
+    def remove_encoder(self, encoder: Optional[FrameEncoder]):
+        if encoder is not None:
+            _drop_ref(self._encoders, self._encoder_refs, encoder)
+
+    def start(self):
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._new_frame = self._loop.create_future()
+            self._thread = threading.Thread(target=self._run, name=f"capture-{self.key}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Never join here: we are on the event loop and the thread may be mid-capture
+        self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        """Worker thread: capture -> pre-encode -> hand off to the event loop."""
+        print(f"[HUB] Capture thread started: {self.key}")
+        while not self._stop.is_set():
+            frame_start = time.perf_counter()
+            try:
+                image, window_title = self._capture_func(self.key)
+            except Exception as e:
+                print(f"[HUB] Capture error on {self.key}: {e}")
+                image, window_title = None, None
+
+            self.captures += 1
+            title_changed = window_title != self.last_title
+            self.last_title = window_title
+            if image is not None and self._is_unchanged(image, title_changed):
+                self.unchanged += 1  # Skip encode and publish: consumers keep the frame they have
+                self._unchanged_counter.inc()
+            elif image is not None:
+                self.seq += 1
+                frame = HubFrame(self.seq, image, window_title, time.time())
+                encode_start = time.perf_counter()
+                self._capture_histogram.observe(encode_start - frame_start)
+                self._frames_counter.inc()
+                for cache_key, encode_func in list(self._encoders.items()):
+                    try:
+                        frame.encode(cache_key, encode_func)
+                    except Exception as e:
+                        print(f"[HUB] Encode error on {self.key}: {e}")
+                if self._encoders:
+                    self._encode_histogram.observe(time.perf_counter() - encode_start)
+                try:
+                    self._loop.call_soon_threadsafe(self._publish, frame)
+                except RuntimeError:
+                    break  # Event loop closed (server shutting down)
+            else:
+                self.failures += 1
+
+            elapsed = time.perf_counter() - frame_start
+            self.capture_ms = elapsed * 1000
+            self._stop.wait(max(0.001, self._frame_interval() - elapsed))
+        print(f"[HUB] Capture thread stopped: {self.key}")
+
+    def _is_unchanged(self, image: Any, title_changed: bool) -> bool:
+        """True if image is pixel-identical to the last published frame. Worker thread."""
+        if self._change_detector is None:
+            return False
+        detect_start = time.perf_counter()
+        digest = self._change_detector(image)
+        self.detect_ms = (time.perf_counter() - detect_start) * 1000
+        unchanged = digest is not None and digest == self._last_digest and not title_changed
+        self._last_digest = digest
+        return unchanged
+
+    def _publish(self, frame: HubFrame):
+        """Runs on the event loop."""
+        self.latest = frame
+        # Wake every waiting consumer, then arm a fresh future for the next frame
+        waiters, self._new_frame = self._new_frame, self._loop.create_future()
+        waiters.set_result(frame.seq)
+
+
+class Subscription:
+    """A consumer's view of a channel. Tracks the last frame it has seen."""
+
+    def __init__(self, hub: "CaptureHub", channel: CaptureChannel, encoder: Optional[FrameEncoder] = None):
+        self._hub = hub
+        self.channel = channel
+        self.encoder = encoder
+        self.last_seq = 0
+        self.closed = False
+
+    @property
+    def key(self) -> Hashable:
+        return self.channel.key
+
+    async def next_frame(self, timeout: Optional[float] = None) -> Optional[HubFrame]:
+        """Return the newest frame this subscriber has not seen yet.
+
+        A fresh subscriber gets the current frame immediately (no extra capture).
+        Returns None if no new frame arrives within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            frame = self.channel.latest
+            if frame is not None and frame.seq > self.last_seq:
+                self.last_seq = frame.seq
+                return frame
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return None
+            # asyncio.wait() never cancels the shared future and never swallows our own cancellation
+            done, _ = await asyncio.wait([self.channel._new_frame], timeout=remaining)
+            if not done:
+                return None
+
+    async def latest_frame(self, timeout: Optional[float] = None) -> Optional[HubFrame]:
+        """Return the current frame even if already seen; only waits when the slot is empty."""
+        frame = self.channel.latest
+        if frame is not None:
+            self.last_seq = frame.seq
+            return frame
+        return await self.next_frame(timeout)
+
+    async def encoded(self, frame: HubFrame) -> Any:
+        """This subscriber's encoded payload for frame.
+
+        Normally already computed by the capture thread; a frame published before
+        we subscribed is encoded in a worker thread rather than on the event loop.
+        """
+        cache_key, encode_func = self.encoder
+        cached = frame.cached(cache_key)
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(frame.encode, cache_key, encode_func)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._hub._release(self)
+
+
+class CaptureHub:
+    """Registry of capture channels keyed by target.
+
+    capture_func(key) -> (image or None, window_title) runs once per tick per
+    target, no matter how many consumers are subscribed to that target.
+    """
+
+    def __init__(self, capture_func: Callable, frame_interval: Callable[[], float],
+                 change_detector: Optional[Callable[[Any], Hashable]] = None):
+        self._capture_func = capture_func
+        self._frame_interval = frame_interval
+        # change_detector(image) -> digest; equal digests mean the frame is skipped
+        self._change_detector = change_detector
+        self._channels: Dict[Hashable, CaptureChannel] = {}
+
+    def subscribe(self, key: Hashable, encoder: Optional[FrameEncoder] = None) -> Subscription:
+        """Subscribe to a target, starting its capture thread if needed. Call from the event loop.
+
+        encoder: optional (cache_key, encode_func) the capture thread should apply to every frame.
+        """
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = CaptureChannel(key, self._capture_func, self._frame_interval, self._change_detector)
+            self._channels[key] = channel
+            channel.start()
+        channel.add_encoder(encoder)
+        channel.subscribers += 1
+        return Subscription(self, channel, encoder)
+
+    def switch(self, subscription: Subscription, key: Hashable) -> Subscription:
+        """Move a subscription to another target (e.g. after lock/unlock)."""
+        if subscription.key == key and not subscription.closed:
+            return subscription
+        new_subscription = self.subscribe(key, subscription.encoder)
+        subscription.close()
+        return new_subscription
+
+    def _release(self, subscription: Subscription):
+        channel = subscription.channel
+        channel.remove_encoder(subscription.encoder)
+        channel.subscribers -= 1
+        if channel.subscribers <= 0 and self._channels.get(channel.key) is channel:
+            del self._channels[channel.key]
+            channel.stop()
+
+    def latest(self, key: Hashable) -> Optional[HubFrame]:
+        """Latest frame of a live channel, or None. Safe to call from any thread."""
+        channel = self._channels.get(key)
+        return channel.latest if channel is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "channels": [
+                {
+                    "target": list(channel.key) if isinstance(channel.key, tuple) else channel.key,
+                    "subscribers": channel.subscribers,
+                    "seq": channel.seq,
+                    "captures": channel.captures,
+                    "failures": channel.failures,
+                    "unchanged": channel.unchanged,
+                    "capture_ms": round(channel.capture_ms, 2),
+                    "detect_ms": round(channel.detect_ms, 2),
+                }
+                for channel in list(self._channels.values())
+            ]
+        }
@@ -16,7 +16,7 @@ except:
         pass
 
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import pyautogui
@@ -125,13 +125,26 @@ def stop_dxcam():
 
 app = FastAPI(title="Ghost Shell Server v2.2")
 
+# [METRICS] Process-wide registry: /metrics (Prometheus) and the "metrics" block of /status
+from metrics import get_metrics
+metrics = get_metrics()
+# Frame time for the instrumentation overhead estimate
+metrics.frame_counter("frames_captured_total", "Frames captured and published")
+
+# Event-loop lag: capture, encode and input must never block the loop
+from loop_monitor import EventLoopLagMonitor
+loop_lag_monitor = EventLoopLagMonitor(histogram=metrics.histogram(
+    "event_loop_lag_seconds", "Event loop wake-up delay of a periodic sleep"))
+
 @app.on_event("startup")
 async def startup_event():
+    loop_lag_monitor.start()
     # Auto-start DXcam if available
     start_dxcam()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    loop_lag_monitor.stop()
     stop_dxcam()
 
 app.add_middleware(
@@ -194,6 +207,11 @@ class InteractionRequest(BaseModel):
     text: str = ""
     key: str = ""
     window_title: str = None  # Client-specified target window for robust locking
+    # Size of the frame x/y refer to, when the client shows a downscaled one (viewport.py)
+    frame_width: Optional[int] = None
+    frame_height: Optional[int] = None
+    source_width: Optional[int] = None  # Window size that frame was scaled from
+    source_height: Optional[int] = None
 
 class LockRequest(BaseModel):
     title: str
@@ -319,11 +337,17 @@ def activate_window(win):
         print(f"[ERROR] Failed to activate window: {e}")
         return False
 
-def get_current_frame():
+def current_capture_target():
+    """Hub key for the window every viewer should currently see."""
+    if LOCKED_WINDOW_TITLE:
+        return ("window", LOCKED_WINDOW_TITLE)
+    return ("foreground", None)
+
+def capture_for_target(target):
     """
-    Shared capture function for WebRTC.
-    Returns (PIL.Image, window_title) or (None, None) if capture fails.
-    Uses the same capture logic as WebSocket stream.
+    Shared capture function for the capture hub (WebSocket and WebRTC).
+    Called once per tick per target, however many clients are watching.
+    Returns (PIL.Image or BGR ndarray, window_title) or (None, None) if capture fails.
     """
     global LOCKED_WINDOW_TITLE, CURRENT_DISPLAY_WINDOW, LAST_VALID_WINDOW
     
@@ -331,10 +355,19 @@ def get_current_frame():
     window_title = None
     hwnd = None
     rect = None
+    kind, value = target
     
     try:
+        # Monitor region: (left, top, width, height)
+        if kind == "region":
+            left, top, width, height = value
+            return simple_capture(rect=(left, top, left + width, top + height), fast_mode=True), None
+        
         # Check if we have a locked window
-        if LOCKED_WINDOW_TITLE:
+        if kind == "window":
+            # Lock moved elsewhere: subscribers will switch to the new target
+            if LOCKED_WINDOW_TITLE != value:
+                return None, None
             win = get_target_window()
             if win:
                 window_title = win.title
@@ -400,7 +433,7 @@ def get_current_frame():
         return screenshot, window_title
         
     except Exception as e:
-        print(f"[get_current_frame] Error: {e}")
+        print(f"[capture_for_target] Error: {e}")
         return None, None
 
 def simple_capture(hwnd=None, rect=None, fast_mode=False):
@@ -657,6 +690,43 @@ def capture_window_background(hwnd, width, height, skip_black_check=False):
         print(f"Background capture error: {e}")
         return None
 
+# ==================== Shared Capture Hub ====================
+# One capture loop per target feeds every /stream, WebRTC and /capture consumer.
+# Viewers subscribe to the target instead of capturing on their own.
+from capture_hub import CaptureHub
+from frame_diff import frame_digest
+from viewport import remap_command, remap_input
+
+# Unchanged frames are never re-sent; an idle stream gets a tiny keepalive instead
+STREAM_KEEPALIVE_INTERVAL = 2.0
+
+# [FRAME SKIPPING] Pixel-identical captures are dropped before encoding
+capture_hub = CaptureHub(capture_for_target, frame_interval=lambda: FRAME_DELAY,
+                         change_detector=frame_digest)
+
+def encode_stream_frame(screenshot, encoder):
+    """Encode a hub frame for /stream. Returns (data, format_type, encoder_name)."""
+    if np is not None and isinstance(screenshot, np.ndarray):
+        # DXcam / Fast Mode (BGR)
+        if cv2:
+            # cv2.imencode expects BGR. Perfect.
+            _, enc = cv2.imencode('.jpg', screenshot, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            return enc.tobytes(), "jpeg", "CV2-Fast"
+        rgb = screenshot[..., ::-1] # BGR to RGB
+        data, format_type = encoder.encode(Image.fromarray(rgb))
+        return data, format_type, encoder.name
+    # PIL Stream (PrintWindow)
+    data, format_type = encoder.encode(screenshot)
+    return data, format_type, encoder.name
+
+def encode_capture_jpeg(screenshot):
+    """Encode a hub frame for /capture (always JPEG, independent of the stream encoder)."""
+    if np is not None and isinstance(screenshot, np.ndarray):
+        screenshot = Image.fromarray(screenshot[..., ::-1])
+    img_byte_arr = io.BytesIO()
+    screenshot.save(img_byte_arr, format='JPEG', quality=85)
+    return img_byte_arr.getvalue()
+
 # Path to HTML client
 import os
 CLIENT_HTML_PATH = os.path.join(os.path.dirname(__file__), "ghost_client.html")
@@ -693,9 +763,10 @@ def api_info():
 WEBRTC_AVAILABLE = False
 try:
     from webrtc_server import webrtc_offer_handler, webrtc_manager, init_webrtc
-    # Initialize WebRTC with Ghost Shell's capture function
-    init_webrtc(get_current_frame)
+    # Initialize WebRTC with Ghost Shell's shared capture hub
+    init_webrtc(capture_hub, current_capture_target)
     WEBRTC_AVAILABLE = True
+    metrics.gauge("webrtc_peers", "Open WebRTC peer connections", lambda: len(webrtc_manager.pcs))
     print("✅ WebRTC available (low-latency streaming)")
 except ImportError as e:
     print(f"⚠️ WebRTC not available: {e}")
@@ -705,6 +776,7 @@ class WebRTCOffer(BaseModel):
     type: str = "offer"
     client_width: Optional[int] = None
     client_height: Optional[int] = None
+    client_dpr: Optional[float] = None
 
 @app.post("/webrtc/offer")
 async def webrtc_offer(offer: WebRTCOffer):
@@ -735,7 +807,8 @@ async def webrtc_offer(offer: WebRTCOffer):
             offer={"sdp": offer.sdp, "type": offer.type},
             fps=target_fps,
             region=region,
-            client_dims=(offer.client_width, offer.client_height)
+            client_dims=(offer.client_width, offer.client_height),
+            client_dpr=offer.client_dpr or 1.0
         )
         print(f"[WebRTC] Handler returned, answer type: {answer.get('type', 'unknown')}", flush=True)
         return answer
@@ -833,6 +906,12 @@ def set_fps(req: FpsRequest):
 @app.get("/capture")
 def capture():
     """Capture screenshot - works even when window is in background."""
+    # [CAPTURE HUB] If viewers are already streaming this target, reuse the latest frame
+    # instead of triggering another capture
+    frame = capture_hub.latest(current_capture_target())
+    if frame is not None:
+        return Response(content=frame.encode("capture-jpeg", encode_capture_jpeg), media_type="image/jpeg")
+    
     win = get_target_window()
     if not win:
         raise HTTPException(status_code=404, detail="未找到目标窗口")
@@ -898,6 +977,9 @@ async def stream(websocket: WebSocket, client_id: int = 0):
             return {"type": "unlock_result", "status": "unlocked"}
         
         # Handle interaction commands (click, type, key, scroll, etc.)
+        # [VIEWPORT] x/y are in the (possibly downscaled) video the client shows; the command
+        # carries the video size and the window size it was scaled from
+        cmd = remap_command(cmd)
         action = cmd.get('action', cmd_type)
         x = cmd.get('x', 0)
         y = cmd.get('y', 0)
@@ -1011,52 +1093,30 @@ async def stream(websocket: WebSocket, client_id: int = 0):
 
     receiver_task = asyncio.create_task(receive_commands())
 
-    try:
-        # Import dependencies here if not global
-        try:
-            import cv2
-            import numpy as np
-        except ImportError:
-            pass
-            
-        from encoders import get_encoder_manager
-        encoder = get_encoder_manager()
+    from encoders import get_encoder_manager
+    encoder = get_encoder_manager()
+    
+    # [CAPTURE HUB] Subscribe to the shared capture loop of the current target.
+    # All viewers of the same window read the same frames: no per-client capture/encode.
+    # Capture and encode run on the hub's worker thread, never on this event loop.
+    subscription = capture_hub.subscribe(
+        current_capture_target(),
+        encoder=(("stream", encoder.name), lambda img: encode_stream_frame(img, encoder)))
+    last_send_time = time.time()
 
+    try:
         while True:
-            frame_start = time.perf_counter()
+            # Follow lock/unlock by moving to the channel of the current target
+            subscription = capture_hub.switch(subscription, current_capture_target())
             
-            # 1. Capture Frame (Optimized)
-            screenshot, window_title = get_current_frame()
+            # 1. Next frame from the hub (current frame immediately for a new viewer)
+            frame = await subscription.next_frame(timeout=0.1)
             
-            if screenshot is not None:
-                # 2. Encode
-                encoded_data = None
-                width = 0
-                height = 0
-                format_type = "jpeg"
-                enc_name = encoder.name
-                
-                is_numpy = isinstance(screenshot, np.ndarray)
-                
-                if is_numpy:
-                    # DXcam / Fast Mode (BGR)
-                    height, width = screenshot.shape[:2]
-                    # Direct CV2 encoding
-                    if cv2:
-                        # Ensure BGR (DXcam default)
-                        # cv2.imencode expects BGR. Perfect.
-                        _, enc = cv2.imencode('.jpg', screenshot, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                        encoded_data = enc.tobytes()
-                        enc_name = "CV2-Fast"
-                    else:
-                        from PIL import Image
-                        rgb = screenshot[..., ::-1] # BGR to RGB
-                        pil_img = Image.fromarray(rgb)
-                        encoded_data, format_type = encoder.encode(pil_img)
-                else:
-                    # PIL Stream (PrintWindow)
-                    width, height = screenshot.size
-                    encoded_data, format_type = encoder.encode(screenshot)
+            if frame is not None:
+                # 2. Encode (once per frame off-loop, shared by every subscriber)
+                width, height = frame.size
+                window_title = frame.window_title
+                encoded_data, format_type, enc_name = await subscription.encoded(frame)
 
                 # 3. Send Meta (with foreground status)
                 is_fg = False
@@ -1082,6 +1142,11 @@ async def stream(websocket: WebSocket, client_id: int = 0):
                 
                 # 4. Send Video Data
                 await websocket.send_bytes(encoded_data)
+                last_send_time = time.time()
+            elif time.time() - last_send_time > STREAM_KEEPALIVE_INTERVAL:
+                # Static screen: nothing to encode, just tell the client we are alive
+                await websocket.send_json({"type": "keepalive", "seq": subscription.last_seq})
+                last_send_time = time.time()
             
             # 5. Process Commands (Poll Queue)
             while not command_queue.empty():
@@ -1092,11 +1157,6 @@ async def stream(websocket: WebSocket, client_id: int = 0):
                     await websocket.send_json(result)
                 except Exception as e:
                     print(f"[WS-CMD] Error: {e}")
-            
-            # 6. FPS Wait
-            elapsed = time.perf_counter() - frame_start
-            wait_time = max(0.001, FRAME_DELAY - elapsed)
-            await asyncio.sleep(wait_time)
 
     except WebSocketDisconnect:
         print("[WS] WebSocket disconnected")
@@ -1104,6 +1164,7 @@ async def stream(websocket: WebSocket, client_id: int = 0):
         print(f"[WS] Fatal Error: {e}")
         # traceback.print_exc()
     finally:
+        subscription.close()
         receiver_task.cancel()
         try:
             await receiver_task
@@ -1219,6 +1280,10 @@ async def interact(req: InteractionRequest):
     """Send interaction to target window."""
     global ORIGINAL_WINDOW_STATE, CURRENT_DISPLAY_WINDOW, LOCKED_WINDOW_TITLE, LAST_VALID_WINDOW, MANUAL_LOCK_ACTIVE, LAST_CLICK_POS
     
+    # [VIEWPORT] Stateless: the request names the video size it clicked on and the window size
+    req.x, req.y = remap_input(req.x, req.y, req.frame_width, req.frame_height,
+                               req.source_width, req.source_height)
+    
     # ... (Target selection logic unchanged)
     # 优先使用客户端指定的窗口（最准确）
     target_title = None
@@ -1578,13 +1643,21 @@ def status():
         "window_found": bool(win),
         "window_title": win.title if win else None,
         "window_box": {"left": win.left, "top": win.top, "width": win.width, "height": win.height} if win else None,
-        "sessions": sessions
+        "sessions": sessions,
+        "capture_hub": capture_hub.stats(),
+        "event_loop_lag": loop_lag_monitor.stats(),
+        "metrics": metrics.compact()
     }
 
-# Helper functions for multiprocessing
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """[METRICS] Prometheus text exposition: stage histograms, frame counters, gauges."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# Server entry points
 def start_http():
     import uvicorn
-    print(f"✅ HTTP Server started on port 8000")
+    print("✅ HTTP Server started on port 8000")
     # Need to pass import string or app object. App object works if defined globally.
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="error")
 
@@ -1592,15 +1665,40 @@ def start_https(cert_file, key_file):
     import uvicorn
     # Re-verify path in process
     if os.path.exists(cert_file):
-        print(f"✅ HTTPS Server started on port 8444")
+        print("✅ HTTPS Server started on port 8444")
         uvicorn.run(app, host="0.0.0.0", port=8444, ssl_certfile=cert_file, ssl_keyfile=key_file, log_level="error")
     else:
         print("❌ HTTPS certificate not found in child process.")
 
+def serve_http_and_https(cert_file, key_file):
+    """
+    HTTP (8000) and HTTPS (8444) listeners in one process on one event loop.
+    Both ports share the capture hub, encoders, audio capture, lock state and
+    sessions: a desktop viewer on 8000 and a phone on 8444 cost one capture and
+    one encode per frame (two processes used to do all of it twice).
+    """
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=8000, log_level="error")),
+        # Startup/shutdown hooks (DXcam, audio, lag monitor) run once, with the HTTP listener
+        uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=8444, ssl_certfile=cert_file,
+                                      ssl_keyfile=key_file, log_level="error", lifespan="off")),
+    ]
+    
+    async def serve_all():
+        tasks = [asyncio.create_task(server.serve()) for server in servers]
+        # Ctrl+C reaches the server whose signal handler was installed last: stop the rest with it
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for server in servers:
+            server.should_exit = True
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    print("✅ HTTP Server started on port 8000")
+    print("✅ HTTPS Server started on port 8444")
+    asyncio.run(serve_all())
+
 if __name__ == "__main__":
     import uvicorn
     import sys
-    import multiprocessing
     import time
     import socket
     
@@ -1623,18 +1721,8 @@ if __name__ == "__main__":
     elif "--http-only" in sys.argv:
         start_http()
     else:
-        # Default: Start HTTP + HTTPS servers
-        processes = []
-        
-        p_http = multiprocessing.Process(target=start_http)
-        p_http.start()
-        processes.append(p_http)
-        
+        # Default: HTTP + HTTPS listeners sharing one process (one capture/encode for both)
         if has_cert:
-            p_https = multiprocessing.Process(target=start_https, args=(cert_file, key_file))
-            p_https.start()
-            processes.append(p_https)
-            
             print("\n" + "="*50)
             print("🚀 Ghost Shell Server Active")
             print("   - PC (HTTP):      http://localhost:8000")
@@ -1644,12 +1732,9 @@ if __name__ == "__main__":
             print("="*50 + "\n")
             
             try:
-                for p in processes:
-                    p.join()
+                serve_http_and_https(cert_file, key_file)
             except KeyboardInterrupt:
                 print("Stopping servers...")
-                for p in processes:
-                    p.terminate()
         else:
             print("⚠️ SSL cert.pem/key.pem not found. Running in HTTP-only mode.")
             print("   Speech available at: http://localhost:8000/speech/")
@@ -0,0 +1,256 @@
+# Ghost Shell Metrics (Prometheus /metrics + compact JSON in /status)
+# Histograms for the per-frame stages (capture, encode, queue waits, send), counters
+# for frames/bytes/drops and pull-time gauges (audio queue depth, sessions), in one
+# process-wide registry. /metrics renders the Prometheus text format; /status gets
+# a compact summary with rates and bucket-estimated percentiles.
+#
+# Recording is cheap by construction: a histogram observation is one bisect over a
+# dozen bucket bounds and three additions under a lock, a counter increment one
+# addition plus a per-second rate slot. All formatting happens on scrape. The cost
+# is calibrated at startup (CALIBRATION_ROUNDS observations) and reported against
+# the measured frame time as instrumentation.overhead_pct; it is logged if it ever
+# exceeds OVERHEAD_BUDGET_PCT. Recordings are observe()/inc() calls, not counter
+# values: bytes_sent_total grows by a frame size per call but costs one inc().
+
+import bisect
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Seconds; roughly log-spaced around a 33 ms frame
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 0.5, 1.0)
+RATE_WINDOW = 5           # Seconds averaged by Counter.rate()
+CALIBRATION_ROUNDS = 2000
+OVERHEAD_BUDGET_PCT = 1.0
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics), values in seconds."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = tuple(buckets)
+        self._counts = [0] * (len(self.bounds) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """q-quantile interpolated within its bucket, like PromQL histogram_quantile()."""
+        with self._lock:
+            counts, total = list(self._counts), self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if index == len(self.bounds):
+                    return self.bounds[-1]  # In +Inf: the highest finite bound is all we know
+                lower = self.bounds[index - 1] if index else 0.0
+                return lower + (self.bounds[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            counts, total, value_sum = list(self._counts), self.count, self.sum
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {total}')
+        lines.append(f"{self.name}_sum {value_sum:.6f}")
+        lines.append(f"{self.name}_count {total}")
+        return lines
+
+    def compact(self) -> dict:
+        return {
+            "n": self.count,
+            "avg_ms": round(self.sum / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 2),
+            "p95_ms": round(self.quantile(0.95) * 1000, 2),
+        }
+
+
+class Counter:
+    """Monotonic counter with a rate over the last RATE_WINDOW whole seconds."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.calls = 0  # inc() calls, for the instrumentation overhead estimate
+        self._second = int(time.monotonic())
+        self._current = 0  # Increments in self._second
+        self._history = deque(maxlen=RATE_WINDOW)  # (second, increments) of finished seconds
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        second = int(time.monotonic())
+        with self._lock:
+            if second != self._second:
+                self._history.append((self._second, self._current))
+                self._second, self._current = second, 0
+            self._current += amount
+            self.value += amount
+            self.calls += 1
+
+    def rate(self) -> float:
+        """Per-second rate over the last RATE_WINDOW finished seconds (idle seconds count as 0)."""
+        now = int(time.monotonic())
+        with self._lock:
+            finished = list(self._history)
+            if self._second < now:
+                finished.append((self._second, self._current))
+        total = sum(count for second, count in finished if now - RATE_WINDOW <= second < now)
+        return total / RATE_WINDOW
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+    def compact(self) -> dict:
+        return {"total": self.value, "rate": round(self.rate(), 2)}
+
+
+class Gauge:
+    """Value read from a callback at scrape time (None = currently unknown, not exported)."""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], Optional[float]]):
+        self.name = name
+        self.help = help_text
+        self._read = read
+
+    def value(self) -> Optional[float]:
+        try:
+            return self._read()
+        except Exception:
+            return None
+
+    def render(self) -> List[str]:
+        value = self.value()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+    def compact(self):
+        value = self.value()
+        return round(value, 3) if isinstance(value, float) else value
+
+
+class MetricsRegistry:
+    """Named metrics; histogram()/counter() are get-or-create, so modules can share one by name."""
+
+    def __init__(self, prefix: str = "ghost_"):
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._frames: Optional[Counter] = None  # Its rate defines the frame time for overhead_pct
+        self.observe_cost = self._calibrate()
+        self._over_budget_logged = False
+        self.render_ms = 0.0
+
+    def _get(self, name: str, factory: Callable[[str], object]):
+        name = self.prefix + name
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = factory(name)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(name, lambda full_name: Histogram(full_name, help_text, buckets))
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get(name, lambda full_name: Counter(full_name, help_text))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], Optional[float]]) -> Gauge:
+        return self._get(name, lambda full_name: Gauge(full_name, help_text, read))
+
+    def frame_counter(self, name: str, help_text: str) -> Counter:
+        """counter() that also defines the frame rate instrumentation.overhead_pct is measured against."""
+        self._frames = self.counter(name, help_text)
+        return self._frames
+
+    @staticmethod
+    def _calibrate() -> float:
+        """Seconds per recorded sample: one histogram observe + one counter inc, measured here."""
+        histogram, counter = Histogram("calibration", ""), Counter("calibration", "")
+        started = time.perf_counter()
+        for index in range(CALIBRATION_ROUNDS):
+            histogram.observe(index * 1e-5)
+            counter.inc()
+        return (time.perf_counter() - started) / CALIBRATION_ROUNDS
+
+    def _recordings(self) -> int:
+        """observe() and inc() calls so far, all metrics."""
+        return sum(metric.count if isinstance(metric, Histogram) else metric.calls
+                   for metric in list(self._metrics.values()) if isinstance(metric, (Histogram, Counter)))
+
+    def overhead(self) -> dict:
+        """Instrumentation cost per frame, as a share of the current frame time."""
+        frames = self._frames.value if self._frames is not None else 0
+        fps = self._frames.rate() if self._frames is not None else 0.0
+        per_frame = self._recordings() / frames if frames else 0.0
+        cost = per_frame * self.observe_cost
+        overhead_pct = cost * fps * 100 if fps else None
+        if overhead_pct is not None and overhead_pct > OVERHEAD_BUDGET_PCT and not self._over_budget_logged:
+            self._over_budget_logged = True
+            print(f"⚠️ [METRICS] Instrumentation overhead {overhead_pct:.2f}% of frame time")
+        return {
+            "observe_us": round(self.observe_cost * 1e6, 3),
+            "recordings_per_frame": round(per_frame, 1),
+            "per_frame_us": round(cost * 1e6, 2),
+            "overhead_pct": round(overhead_pct, 4) if overhead_pct is not None else None,
+            "render_ms": round(self.render_ms, 2),
+        }
+
+    def render_prometheus(self) -> str:
+        started = time.perf_counter()
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        self.render_ms = (time.perf_counter() - started) * 1000
+        return "\n".join(lines) + "\n"
+
+    def compact(self) -> dict:
+        """Short JSON for /status: histograms in ms, counters with rates, gauge values."""
+        summary = {"histograms": {}, "counters": {}, "gauges": {}}
+        for name, metric in list(self._metrics.items()):
+            short = name[len(self.prefix):]
+            if isinstance(metric, Histogram):
+                summary["histograms"][short] = metric.compact()
+            elif isinstance(metric, Counter):
+                summary["counters"][short] = metric.compact()
+            else:
+                summary["gauges"][short] = metric.compact()
+        summary["instrumentation"] = self.overhead()
+        return summary
+
+
+# Global singleton
+_metrics: Optional[MetricsRegistry] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get or create the global metrics registry."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
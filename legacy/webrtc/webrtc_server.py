@@ -2,18 +2,27 @@
 WebRTC Server Module for Ghost Shell
 Uses aiortc for low-latency screen streaming
 
-Integrated version - uses shared capture logic from ghost_server
+Integrated version - subscribes to ghost_server's shared capture hub,
+so any number of peers cost a single capture per frame.
 """
 
 import asyncio
 import fractions
 import sys
+import time
 from typing import Optional, Tuple
 import numpy as np
 import cv2  # Required for resizing
 
 from av import VideoFrame
 from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack, RTCConfiguration, RTCIceServer
+from aiortc.mediastreams import VIDEO_CLOCK_RATE, VIDEO_TIME_BASE
+
+from viewport import Viewport
+from metrics import get_metrics
+
+# An unchanged screen produces no hub frames; re-send the last frame this often
+KEEPALIVE_INTERVAL = 1.0
 
 
 class ScreenCaptureTrack(VideoStreamTrack):
@@ -24,51 +33,114 @@ class ScreenCaptureTrack(VideoStreamTrack):
     
     kind = "video"
     
-    def __init__(self, fps: int = 30, client_dims: Tuple[int, int] = None):
+    def __init__(self, fps: int = 30, client_dims: Tuple[int, int] = None, client_dpr: float = 1.0):
         super().__init__()
         self.fps = fps
         self._frame_count = 0
-        self._get_current_frame = None  # Will be set externally
+        self._hub = None  # Will be set externally
+        self._target_func = None
+        self._subscription = None
+        self._last_frame = None  # Last VideoFrame sent, re-sent as keepalive
+        self._start_time = None
+        self._last_recv_time = None
         self.client_dims = client_dims  # (width, height) or None
-        print(f"[WebRTC-Track] Created: fps={fps}, client_dims={client_dims}", flush=True)
+        # [VIEWPORT] Frames are downscaled to fit the client's screen (CSS px x devicePixelRatio)
+        self.viewport = Viewport(*(client_dims or (0, 0)), client_dpr)
+        # [METRICS] Hub frame -> VideoFrame (conversion + viewport resize); aiortc encodes after that
+        metrics = get_metrics()
+        self._convert_histogram = metrics.histogram("track_convert_seconds", "Hub frame to VideoFrame per track")
+        self._sent_counter = metrics.counter("frames_sent_total", "New frames handed to WebRTC video tracks")
+        self._keepalive_counter = metrics.counter("frames_keepalive_total", "Previous frame re-sent on a static screen")
+        print(f"[WebRTC-Track] Created: fps={fps}, client_dims={client_dims}, dpr={client_dpr}", flush=True)
         
-    def set_capture_function(self, func):
-        """Set the capture function (from ghost_server)."""
-        self._get_current_frame = func
-        print(f"[WebRTC-Track] Capture function set", flush=True)
+    def set_capture_hub(self, hub, target_func):
+        """Set the shared capture hub and the function returning the current target (from ghost_server)."""
+        self._hub = hub
+        self._target_func = target_func
+        print(f"[WebRTC-Track] Capture hub set", flush=True)
+    
+    async def _next_screenshot(self):
+        """Next changed hub frame for the current target, or (None, None) if the
+        screen stayed identical for KEEPALIVE_INTERVAL. Never triggers a capture itself."""
+        # Cap the track at self.fps even if the hub captures faster
+        if self._last_recv_time is not None:
+            wait = self._last_recv_time + 1.0 / self.fps - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        target = self._target_func()
+        if self._subscription is None:
+            self._subscription = self._hub.subscribe(target)
+        else:
+            self._subscription = self._hub.switch(self._subscription, target)
+        frame = await self._subscription.next_frame(timeout=KEEPALIVE_INTERVAL)
+        if frame is None:
+            return None, None
+        return frame.image, frame.window_title
+
+    def _wallclock_timestamp(self):
+        """pts from elapsed wall-clock time (frames are sent at a variable rate)."""
+        now = time.perf_counter()
+        if self._start_time is None:
+            self._start_time = now
+        self._last_recv_time = now
+        return int((now - self._start_time) * VIDEO_CLOCK_RATE), VIDEO_TIME_BASE
+    
+    @staticmethod
+    def _grab_primary_monitor():
+        """Grab the primary monitor with mss as a contiguous RGB array. Runs in a worker thread."""
+        import mss
+        with mss.mss() as sct:
+            raw = sct.grab(sct.monitors[1])
+        img = np.array(raw)[:, :, :3][:, :, ::-1]
+        return np.ascontiguousarray(img)
+
+    async def _fit_viewport(self, img):
+        height, width = img.shape[:2]
+        frame_w, frame_h = self.viewport.frame_size(width, height)
+        # Even sizes: the video encoders work on 4:2:0 chroma
+        frame_w, frame_h = max(2, frame_w - frame_w % 2), max(2, frame_h - frame_h % 2)
+        if (frame_w, frame_h) == (width - width % 2, height - height % 2):
+            return img
+        img = await asyncio.to_thread(cv2.resize, img, (frame_w, frame_h), interpolation=cv2.INTER_AREA)
+        return img
+
+    def stop(self):
+        if self._subscription is not None:
+            self._subscription.close()
+            self._subscription = None
+        super().stop()
         
     async def recv(self):
         """
         Generate video frames using Ghost Shell's capture logic.
         """
         try:
-            # Get timestamp
-            pts, time_base = await self.next_timestamp()
-            self._frame_count += 1
+            # Use Ghost Shell's shared capture hub
+            if self._hub:
+                # [FRAME SKIPPING] Unchanged frames are neither converted nor encoded;
+                # a static screen only re-sends the previous frame as keepalive
+                screenshot, window_title = await self._next_screenshot()
+                pts, time_base = self._wallclock_timestamp()
+                if screenshot is None and self._last_frame is not None:
+                    self._last_frame.pts = pts
+                    self._keepalive_counter.inc()
+                    return self._last_frame
+            else:
+                pts, time_base = await self.next_timestamp()
             
+            self._frame_count += 1
+            convert_start = time.perf_counter()
             # Log frames
             if self._frame_count % 120 == 1:
                 print(f"[WebRTC-Track] Frame {self._frame_count}", flush=True)
             
-            # Use Ghost Shell's capture logic
-            if self._get_current_frame:
-                screenshot, window_title = self._get_current_frame()
-            else:
-                # Fallback to mss if no capture function set
-                import mss
-                with mss.mss() as sct:
-                    monitor = sct.monitors[1]
-                    raw = sct.grab(monitor)
-                    screenshot = None
-                    # Convert to numpy
-                    img = np.array(raw)
-                    img = img[:, :, :3]
-                    img = img[:, :, ::-1]
-                    img = np.ascontiguousarray(img)
-                    frame = VideoFrame.from_ndarray(img, format="rgb24")
-                    frame.pts = pts
-                    frame.time_base = time_base
-                    return frame
+            if not self._hub:
+                # Fallback to mss if no capture function set (blocking grab: keep it off the event loop)
+                img = await asyncio.to_thread(self._grab_primary_monitor)
+                frame = VideoFrame.from_ndarray(img, format="rgb24")
+                frame.pts = pts
+                frame.time_base = time_base
+                return frame
             
             if screenshot is None:
                 # Return a black frame if capture failed
@@ -100,14 +172,19 @@ class ScreenCaptureTrack(VideoStreamTrack):
                 
                 img = np.ascontiguousarray(img)
 
-            # [REVERTED] No Resolution Cap
-            # User choice: Send full raw resolution to avoid coordinate mapping issues.
-            # Performance relies on hardware/capture speed.
+            # [VIEWPORT] Downscale to the client's screen (area filter, off the event loop).
+            # Clicks on the smaller video carry its size and the window size (viewport.py)
+            if screenshot is not None:
+                img = await self._fit_viewport(img)
             
             # Create VideoFrame
             frame = VideoFrame.from_ndarray(img, format=pixel_format)
             frame.pts = pts
             frame.time_base = time_base
+            if screenshot is not None:
+                self._last_frame = frame
+                self._convert_histogram.observe(time.perf_counter() - convert_start)
+                self._sent_counter.inc()
             
             return frame
             
@@ -130,14 +207,17 @@ class WebRTCManager:
     
     def __init__(self):
         self.pcs: set[RTCPeerConnection] = set()
-        self._capture_func = None
+        self._hub = None
+        self._target_func = None
         
-    def set_capture_function(self, func):
-        """Set the capture function from ghost_server."""
-        self._capture_func = func
-        print(f"[WebRTC-Manager] Capture function set", flush=True)
+    def set_capture_hub(self, hub, target_func):
+        """Set the shared capture hub from ghost_server."""
+        self._hub = hub
+        self._target_func = target_func
+        print(f"[WebRTC-Manager] Capture hub set", flush=True)
         
-    async def handle_offer(self, offer_sdp: str, offer_type: str = "offer", fps: int = 30, client_dims: Tuple[int, int] = None) -> Tuple[str, str]:
+    async def handle_offer(self, offer_sdp: str, offer_type: str = "offer", fps: int = 30, client_dims: Tuple[int, int] = None,
+                           client_dpr: float = 1.0) -> Tuple[str, str]:
         """
         Handle an incoming WebRTC offer from a client.
         Returns (answer_sdp, answer_type).
@@ -175,9 +255,9 @@ class WebRTCManager:
         
         # Add local tracks
         # Create video track with specific FPS and client dimensions
-        track = ScreenCaptureTrack(fps=fps, client_dims=client_dims)
-        if self._capture_func:
-            track.set_capture_function(self._capture_func)
+        track = ScreenCaptureTrack(fps=fps, client_dims=client_dims, client_dpr=client_dpr)
+        if self._hub:
+            track.set_capture_hub(self._hub, self._target_func)
         
         # Add the screen capture track
         pc.addTrack(track)
@@ -224,18 +304,19 @@ webrtc_manager = WebRTCManager()
 
 
 # FastAPI integration functions
-async def webrtc_offer_handler(offer: dict, fps: int = 30, region=None, client_dims=None) -> dict:
+async def webrtc_offer_handler(offer: dict, fps: int = 30, region=None, client_dims=None, client_dpr: float = 1.0) -> dict:
     """
     Handle WebRTC offer from client.
     Called by FastAPI route.
     """
-    print(f"[WebRTC] webrtc_offer_handler: fps={fps}, dims={client_dims}", flush=True)
+    print(f"[WebRTC] webrtc_offer_handler: fps={fps}, dims={client_dims}, dpr={client_dpr}", flush=True)
     
     answer_sdp, answer_type = await webrtc_manager.handle_offer(
         offer_sdp=offer.get("sdp", ""),
         offer_type=offer.get("type", "offer"),
         fps=fps,
-        client_dims=client_dims
+        client_dims=client_dims,
+        client_dpr=client_dpr
     )
     
     return {
@@ -244,10 +325,17 @@ async def webrtc_offer_handler(offer: dict, fps: int = 30, region=None, client_d
     }
 
 
-def init_webrtc(capture_func):
+def init_webrtc(capture_hub, target_func):
     """
-    Initialize WebRTC with Ghost Shell's capture function.
+    Initialize WebRTC with Ghost Shell's shared capture hub.
+    target_func() returns the hub key every track should follow.
     Called from ghost_server.py on startup.
     """
-    webrtc_manager.set_capture_function(capture_func)
-    print(f"[WebRTC] Initialized with Ghost Shell capture", flush=True)
+    webrtc_manager.set_capture_hub(capture_hub, target_func)
+    try:
+        from audio_capture import AUDIO_AVAILABLE, audio_queue_depth
+        if AUDIO_AVAILABLE:
+            get_metrics().gauge("audio_queue_depth", "Deepest audio track capture queue (chunks)", audio_queue_depth)
+    except ImportError:
+        pass
+    print(f"[WebRTC] Initialized with Ghost Shell capture hub", flush=True)